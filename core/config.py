@@ -11,6 +11,11 @@ def str_to_bool(value):
     return value.lower() in ("true", "1", "yes", "on")
 
 
+def str_to_list(value):
+    """逗號分隔字串轉為小寫列表 (忽略空白項目)"""
+    return [v.strip().lower() for v in (value or "").split(",") if v.strip()]
+
+
 # 全域設定
 DOWNLOAD_ATTACHMENTS = str_to_bool(os.getenv("DOWNLOAD_ATTACHMENTS", "True"))
 GOOGLE_DRIVE_FOLDER_ID = os.getenv("GOOGLE_DRIVE_FOLDER_ID")
@@ -43,3 +48,140 @@ BASE_DIR = os.path.join(os.path.expanduser("~"), "Downloads", "Asana_Knowledge_B
 RAW_DIR = os.path.join(BASE_DIR, "raw_data")
 PROCESSED_DIR = os.path.join(BASE_DIR, "processed_data")
 QA_DIR = os.path.join(BASE_DIR, "qa_data")
+# 已處理文件的 Metadata 索引 (由 Stage 2 維護，供 QA 等下游查詢)
+DOC_INDEX_DB = os.path.join(BASE_DIR, "doc_index.sqlite")
+
+# --- QA 輸入壓縮 (Context Compaction) ---
+ENABLE_QA_COMPACTION = str_to_bool(os.getenv("ENABLE_QA_COMPACTION", "True"))
+QA_TOKEN_BUDGET = int(os.getenv("QA_TOKEN_BUDGET", "6000"))
+# 依優先順序保留的「最後 N 則」留言
+QA_KEEP_LAST_COMMENTS = int(os.getenv("QA_KEEP_LAST_COMMENTS", "3"))
+
+# --- QA Map-Reduce (超長任務) ---
+ENABLE_QA_MAP_REDUCE = str_to_bool(os.getenv("ENABLE_QA_MAP_REDUCE", "True"))
+# 清理後內文超過此 token 數才改走 Map-Reduce，其餘維持單次呼叫
+QA_MAP_REDUCE_THRESHOLD = int(os.getenv("QA_MAP_REDUCE_THRESHOLD", "12000"))
+QA_MAP_CHUNK_TOKENS = int(os.getenv("QA_MAP_CHUNK_TOKENS", "4000"))
+QA_MAP_WORKERS = int(os.getenv("QA_MAP_WORKERS", "4"))
+
+# --- QA 多文件批次 (短任務合併為單次請求) ---
+ENABLE_QA_BATCH = str_to_bool(os.getenv("ENABLE_QA_BATCH", "False"))
+QA_BATCH_TOKEN_BUDGET = int(os.getenv("QA_BATCH_TOKEN_BUDGET", "8000"))
+QA_BATCH_MAX_DOCS = int(os.getenv("QA_BATCH_MAX_DOCS", "8"))
+# 單份文件超過此 token 數即不併入批次
+QA_BATCH_MAX_DOC_TOKENS = int(os.getenv("QA_BATCH_MAX_DOC_TOKENS", "1500"))
+
+# --- QA 近似重複合併 (MinHash / LSH) ---
+ENABLE_QA_DEDUP = str_to_bool(os.getenv("ENABLE_QA_DEDUP", "True"))
+QA_DEDUP_THRESHOLD = float(os.getenv("QA_DEDUP_THRESHOLD", "0.8"))
+QA_DEDUP_NUM_PERM = int(os.getenv("QA_DEDUP_NUM_PERM", "64"))
+QA_DEDUP_BANDS = int(os.getenv("QA_DEDUP_BANDS", "8"))
+
+# 全文檢索索引 (知識庫 Markdown + QA 資料集)
+SEARCH_INDEX_DB = os.path.join(BASE_DIR, "search_index.sqlite")
+
+# --- 向量索引 (QA 語意檢索) ---
+ENABLE_VECTOR_INDEX = str_to_bool(os.getenv("ENABLE_VECTOR_INDEX", "False"))
+# 向量後端：azure (Azure OpenAI embeddings) 或 local (sentence-transformers，本機 CPU)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "azure")
+AZURE_OPENAI_EMBEDDING_DEPLOYMENT = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT")
+EMBEDDING_LOCAL_MODEL = os.getenv(
+    "EMBEDDING_LOCAL_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+# 向量儲存精度：float16 (省一半空間) 或 float32
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float16")
+VECTOR_INDEX_DIR = os.path.join(BASE_DIR, "vector_index")
+
+# --- QA 訓練資料集匯出 (JSONL.zst / Parquet) ---
+QA_DATASET_DIR = os.path.join(BASE_DIR, "qa_dataset")
+# 每個分片最多筆數 (超過即換新檔)
+EXPORT_SHARD_ROWS = int(os.getenv("EXPORT_SHARD_ROWS", "100000"))
+# 每次寫出的批量 (控制記憶體上限)
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "5000"))
+
+# --- 原始資料儲存後端 ---
+# sqlite：正規化 SQLite (tasks / subtasks / stories / attachments)；json：逐檔 JSON (json_tasks/)；
+# packed：精簡 + 壓縮的只追加分片 (packed/，含 gid→offset 索引)
+RAW_STORE_BACKEND = os.getenv("RAW_STORE_BACKEND", "sqlite")
+RAW_DB = os.path.join(BASE_DIR, "raw_store.sqlite")
+# sqlite 後端是否同步寫出 json_tasks/ (相容匯出)
+EXPORT_RAW_JSON = str_to_bool(os.getenv("EXPORT_RAW_JSON", "False"))
+RAW_SHARD_MAX_BYTES = int(os.getenv("RAW_SHARD_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# JSON 序列化後端：auto (orjson > msgspec > json)、orjson、msgspec 或 json
+JSON_BACKEND = os.getenv("JSON_BACKEND", "auto")
+
+# 任務詳情 (notes、custom_fields) 並行抓取數 (精簡掃描篩選後才抓)
+FETCH_DETAIL_WORKERS = int(os.getenv("FETCH_DETAIL_WORKERS", "8"))
+# 同時列舉的區段數 (get_tasks_for_section)
+FETCH_SECTION_WORKERS = int(os.getenv("FETCH_SECTION_WORKERS", "4"))
+# 擷取執行日誌 (中斷後可續傳)；每完成幾筆任務 commit 原始資料並寫入一次日誌
+FETCH_JOURNAL_DIR = os.path.join(BASE_DIR, "fetch_journal")
+FETCH_CHECKPOINT_EVERY = int(os.getenv("FETCH_CHECKPOINT_EVERY", "20"))
+# 附件處理：下載與圖片分析為兩組獨立 worker；同一主機同時下載數上限
+ATTACHMENT_DOWNLOAD_WORKERS = int(os.getenv("ATTACHMENT_DOWNLOAD_WORKERS", "8"))
+ATTACHMENT_ANALYSIS_WORKERS = int(os.getenv("ATTACHMENT_ANALYSIS_WORKERS", "4"))
+ATTACHMENT_DOWNLOADS_PER_HOST = int(os.getenv("ATTACHMENT_DOWNLOADS_PER_HOST", "4"))
+# 多圖批次分析：同一任務的多張圖片合併為單次 vision 請求 (共用一次 system prompt)
+ENABLE_VISION_BATCH = str_to_bool(os.getenv("ENABLE_VISION_BATCH", "False"))
+VISION_BATCH_MAX_IMAGES = int(os.getenv("VISION_BATCH_MAX_IMAGES", "6"))
+# 每次請求的圖片 input token 預算 (依圖片尺寸估計)；無法讀取尺寸時每張以 VISION_TOKENS_PER_IMAGE 計
+VISION_BATCH_TOKEN_BUDGET = int(os.getenv("VISION_BATCH_TOKEN_BUDGET", "6000"))
+VISION_TOKENS_PER_IMAGE = int(os.getenv("VISION_TOKENS_PER_IMAGE", "1105"))
+# 本機 OCR 快速路徑 (需安裝 pytesseract、Pillow 與 tesseract 執行檔)：文字清楚的截圖改以文字分析
+ENABLE_LOCAL_OCR = str_to_bool(os.getenv("ENABLE_LOCAL_OCR", "False"))
+LOCAL_OCR_LANG = os.getenv("LOCAL_OCR_LANG", "chi_tra+eng")
+LOCAL_OCR_WORKERS = int(os.getenv("LOCAL_OCR_WORKERS", "0"))  # 0 表示 CPU 核心數
+LOCAL_OCR_MIN_CONFIDENCE = float(os.getenv("LOCAL_OCR_MIN_CONFIDENCE", "80"))
+LOCAL_OCR_MAX_LOW_CONF_RATIO = float(os.getenv("LOCAL_OCR_MAX_LOW_CONF_RATIO", "0.2"))
+LOCAL_OCR_MIN_CHARS = int(os.getenv("LOCAL_OCR_MIN_CHARS", "20"))
+LOCAL_OCR_MIN_TEXT_AREA = float(os.getenv("LOCAL_OCR_MIN_TEXT_AREA", "0.05"))
+# PDF / XLSX / DOCX 附件本機擷取文字 (需 pypdf / openpyxl；DOCX 與純文字不需額外套件)
+DOC_EXTRACT_WORKERS = int(os.getenv("DOC_EXTRACT_WORKERS", "2"))
+DOC_EXTRACT_MAX_CHARS = int(os.getenv("DOC_EXTRACT_MAX_CHARS", "20000"))
+DOC_EXTRACT_MAX_PAGES = int(os.getenv("DOC_EXTRACT_MAX_PAGES", "50"))
+DOC_EXTRACT_MAX_ROWS = int(os.getenv("DOC_EXTRACT_MAX_ROWS", "500"))
+# 附件策略 (依 Asana 附件 metadata 在下載前決定：分析 / 僅下載 / 僅連結 / 延後)
+# 只下載這些來源 (附件 host)；Google Drive、Dropbox 等外部連結只保留連結
+ATTACHMENT_DOWNLOAD_HOSTS = str_to_list(os.getenv("ATTACHMENT_DOWNLOAD_HOSTS", "asana"))
+# 影片、壓縮檔、映像檔等只保留連結
+ATTACHMENT_LINK_EXTENSIONS = str_to_list(
+    os.getenv(
+        "ATTACHMENT_LINK_EXTENSIONS",
+        ".mp4,.mov,.avi,.mkv,.wmv,.webm,.m4v,.mp3,.wav,.zip,.rar,.7z,.tar,.gz,.iso,.dmg,.exe,.msi",
+    )
+)
+# 下載後送分析的副檔名 (圖片與可本機擷取的文件)；其餘只下載保存；無副檔名者照常分析
+ATTACHMENT_ANALYZE_EXTENSIONS = str_to_list(
+    os.getenv(
+        "ATTACHMENT_ANALYZE_EXTENSIONS",
+        ".png,.jpg,.jpeg,.gif,.webp,.bmp,.pdf,.xlsx,.xlsm,.docx,.txt,.csv,.log,.md,.json,.xml",
+    )
+)
+# 超過此大小只保留連結；超過 ATTACHMENT_DEFER_MB 則排入低優先背景佇列，不阻塞任務擷取
+ATTACHMENT_MAX_DOWNLOAD_MB = float(os.getenv("ATTACHMENT_MAX_DOWNLOAD_MB", "50"))
+ATTACHMENT_DEFER_MB = float(os.getenv("ATTACHMENT_DEFER_MB", "10"))
+ATTACHMENT_DEFER_WORKERS = int(os.getenv("ATTACHMENT_DEFER_WORKERS", "1"))
+# 分析失敗 (analysis_state=failed) 的附件在任務重新擷取時最多重試的總次數；無內容 (empty) 者不重試
+ATTACHMENT_ANALYSIS_MAX_ATTEMPTS = int(os.getenv("ATTACHMENT_ANALYSIS_MAX_ATTEMPTS", "3"))
+
+# 管線模式 (擷取 → 處理 → QA 同時進行)：階段間佇列長度 (滿時上游暫停，形成背壓)
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "16"))
+# QA 階段閒置幾秒即送出累積中的批次 (新任務不必等整包湊滿)
+PIPELINE_QA_IDLE_FLUSH = float(os.getenv("PIPELINE_QA_IDLE_FLUSH", "2"))
+# 管線中生成失敗 / 中斷的任務與待補 QA 的專案，下次執行時重試
+PIPELINE_RETRY_FILE = os.path.join(BASE_DIR, "pipeline_retry.json")
+
+# Webhook 常駐同步：接收 Asana webhook 事件，只擷取 / 處理有異動的任務
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8787"))
+# 握手取得的 X-Hook-Secret (依專案 GID 保存，用於驗證事件簽章)
+WEBHOOK_SECRET_FILE = os.path.join(BASE_DIR, "webhook_secrets.json")
+# 同一任務最後一個事件後靜默幾秒才處理 (合併連續編輯)；最久延遲 WEBHOOK_MAX_DELAY_SECONDS
+WEBHOOK_COALESCE_SECONDS = float(os.getenv("WEBHOOK_COALESCE_SECONDS", "5"))
+WEBHOOK_MAX_DELAY_SECONDS = float(os.getenv("WEBHOOK_MAX_DELAY_SECONDS", "60"))
+WEBHOOK_BATCH_MAX_TASKS = int(os.getenv("WEBHOOK_BATCH_MAX_TASKS", "50"))
+WEBHOOK_MAX_RETRIES = int(os.getenv("WEBHOOK_MAX_RETRIES", "3"))
+# 不同步的區段 GID (逗號分隔，相當於互動模式的排除區段)
+WEBHOOK_EXCLUDED_SECTIONS = str_to_list(os.getenv("WEBHOOK_EXCLUDED_SECTIONS", ""))
@@ -0,0 +1,127 @@
+# 檔案用途：已處理文件 (processed_data) 的 Metadata 索引 (SQLite)，取代 glob + 全文 YAML 解析。
+
+import os
+import sqlite3
+import datetime
+from typing import List, Optional
+
+from core import config
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    gid TEXT PRIMARY KEY,
+    project TEXT NOT NULL,
+    status TEXT,
+    section TEXT,
+    title TEXT,
+    created_date TEXT,
+    expiry_date TEXT,
+    path TEXT NOT NULL,
+    content_hash TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_documents_project_status ON documents (project, status);
+CREATE INDEX IF NOT EXISTS idx_documents_status ON documents (status);
+"""
+
+
+class DocIndex:
+    """
+    文件索引：每份 Markdown 一列，由 Stage 2 (run_process) 寫入。
+
+    欄位:
+        gid: 任務 GID
+        project: 專案資料夾名稱 (safe_proj_name)
+        status / section / title / created_date / expiry_date: 與 Markdown 檔頭一致
+        path: 相對於 PROCESSED_DIR 的路徑
+        content_hash: Markdown 內文 (不含檔頭) 的雜湊
+    """
+
+    def __init__(self, db_path=config.DOC_INDEX_DB):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(_SCHEMA)
+
+    def upsert(self, project: str, meta: dict, path: str, content_hash: str):
+        """
+        新增或更新單一文件紀錄
+
+        Args:
+            project (str): 專案資料夾名稱
+            meta (dict): 文件檔頭欄位 (gid, status, section, title, created_date, expiry_date)
+            path (str): 相對於 PROCESSED_DIR 的路徑
+            content_hash (str): 內文雜湊
+        """
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        self.conn.execute(
+            """
+            INSERT INTO documents
+                (gid, project, status, section, title, created_date, expiry_date, path, content_hash, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(gid) DO UPDATE SET
+                project=excluded.project, status=excluded.status, section=excluded.section,
+                title=excluded.title, created_date=excluded.created_date,
+                expiry_date=excluded.expiry_date, path=excluded.path,
+                content_hash=excluded.content_hash, updated_at=excluded.updated_at
+            """,
+            (
+                str(meta["gid"]),
+                project,
+                meta.get("status"),
+                meta.get("section"),
+                meta.get("title"),
+                meta.get("created_date"),
+                meta.get("expiry_date"),
+                path,
+                content_hash,
+                now,
+            ),
+        )
+
+    def delete(self, gid: str):
+        self.conn.execute("DELETE FROM documents WHERE gid = ?", (str(gid),))
+
+    def select_documents(
+        self, project: Optional[str] = None, status: Optional[str] = "completed"
+    ) -> List[dict]:
+        """
+        依專案與狀態挑選文件
+
+        Args:
+            project (str): 專案資料夾名稱，None 表示全部
+            status (str): 文件狀態，None 表示不限
+
+        Returns:
+            List[dict]: 文件紀錄列表
+        """
+        sql = "SELECT * FROM documents WHERE 1=1"
+        params = []
+        if project:
+            sql += " AND project = ?"
+            params.append(project)
+        if status:
+            sql += " AND status = ?"
+            params.append(status)
+        sql += " ORDER BY path"
+        return [dict(r) for r in self.conn.execute(sql, params)]
+
+    def is_empty(self, project: Optional[str] = None) -> bool:
+        """索引中是否沒有任何文件 (project 為 None 表示全部)"""
+        if project:
+            row = self.conn.execute("SELECT 1 FROM documents WHERE project = ? LIMIT 1", (project,)).fetchone()
+        else:
+            row = self.conn.execute("SELECT 1 FROM documents LIMIT 1").fetchone()
+        return row is None
+
+    def get(self, gid: str) -> Optional[dict]:
+        """以 GID 取得單一文件紀錄"""
+        row = self.conn.execute("SELECT * FROM documents WHERE gid = ?", (str(gid),)).fetchone()
+        return dict(row) if row else None
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
@@ -63,3 +63,5 @@ class AttachmentData:
     download_url: str
     local_path: Optional[str] = None  # 下載後的本地路徑
     ocr_text: Optional[str] = None  # LLM 分析結果
+    analysis_state: Optional[str] = None  # ok / empty (無內容) / failed (可重試)；None 表示未分析
+    analysis_attempts: int = 0  # 已嘗試分析的次數
@@ -0,0 +1,346 @@
+# 檔案用途：原始任務資料的 SQLite 正規化儲存 (tasks / subtasks / stories / attachments)，支援依 GID、異動時間、區段查詢。
+
+import os
+import sqlite3
+from typing import Iterator, List, Optional
+
+from core import config, serializer
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    gid TEXT PRIMARY KEY,
+    project TEXT NOT NULL,
+    section TEXT,
+    name TEXT,
+    created_at TEXT,
+    modified_at TEXT,
+    completed INTEGER,
+    expiry_date TEXT,
+    fetched_at TEXT,
+    metadata TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_project_modified ON tasks (project, modified_at);
+CREATE INDEX IF NOT EXISTS idx_tasks_project_section ON tasks (project, section);
+
+CREATE TABLE IF NOT EXISTS subtasks (
+    gid TEXT NOT NULL,
+    task_gid TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT,
+    meta TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_subtasks_task ON subtasks (task_gid, position);
+
+CREATE TABLE IF NOT EXISTS stories (
+    gid TEXT,
+    task_gid TEXT NOT NULL,
+    owner_gid TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    created_at TEXT,
+    resource_subtype TEXT,
+    text TEXT,
+    created_by_name TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_stories_task ON stories (task_gid, owner_gid, position);
+
+CREATE TABLE IF NOT EXISTS attachments (
+    gid TEXT NOT NULL,
+    task_gid TEXT NOT NULL,
+    owner_type TEXT NOT NULL,
+    owner_gid TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT,
+    download_url TEXT,
+    local_path TEXT,
+    ocr_text TEXT,
+    analysis_state TEXT,
+    analysis_attempts INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_attachments_task ON attachments (task_gid, position);
+CREATE INDEX IF NOT EXISTS idx_attachments_gid ON attachments (gid);
+"""
+
+_CHILD_TABLES = ("subtasks", "stories", "attachments")
+
+
+class SqliteStore:
+    """
+    原始資料 SQLite 儲存 (單一資料庫，以 project 欄位區分專案)
+
+    * 介面與 raw_store.JsonDirStore / PackedStore 相同：put / get / delete / iter_records / close
+    * get() 會還原為 run_fetch 產生的資料包結構，下游 renderer 不需修改
+    * EXPORT_RAW_JSON=True 時，同步寫出 json_tasks/ 作為相容匯出
+    """
+
+    COMMIT_EVERY = 50
+
+    def __init__(self, proj_name, db_path=None):
+        db_path = db_path or config.RAW_DB
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.project = proj_name
+        self.conn = sqlite3.connect(db_path)
+        self.conn.row_factory = sqlite3.Row
+        # WAL：擷取寫入時，處理 / 查詢端仍可同時讀取
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+        self._migrate()
+        self._pending = 0
+        self._json_export = None
+        if config.EXPORT_RAW_JSON:
+            from core.raw_store import JsonDirStore
+
+            self._json_export = JsonDirStore(proj_name)
+
+    def _migrate(self):
+        """舊版資料庫補上後來新增的欄位"""
+        columns = {r["name"] for r in self.conn.execute("PRAGMA table_info(attachments)")}
+        for name, sql_type in (("analysis_state", "TEXT"), ("analysis_attempts", "INTEGER")):
+            if name not in columns:
+                self.conn.execute(f"ALTER TABLE attachments ADD COLUMN {name} {sql_type}")
+
+    # ------------------------------------------------------------------
+    # 寫入
+    # ------------------------------------------------------------------
+    def put(self, data: dict):
+        """
+        新增或覆寫一筆任務資料 (含留言、子任務、附件)
+
+        Args:
+            data (dict): run_fetch 產生的任務資料包 (可含 AttachmentData)
+        """
+        from core.raw_store import to_plain
+
+        if self._json_export:
+            self._json_export.put(data)
+        data = to_plain(data)
+        t = data["metadata"]
+        gid = str(t["gid"])
+
+        self._delete_rows(gid)
+        self.conn.execute(
+            """INSERT INTO tasks (gid, project, section, name, created_at, modified_at, completed,
+                                  expiry_date, fetched_at, metadata)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (
+                gid,
+                self.project,
+                data.get("section_name"),
+                t.get("name"),
+                t.get("created_at"),
+                t.get("modified_at"),
+                1 if t.get("completed") else 0,
+                t.get("calculated_expiry_date"),
+                data.get("fetched_at"),
+                serializer.dumps(t),
+            ),
+        )
+
+        stories = [(gid, s) for s in data.get("stories") or []]
+        atts = [("task", gid, a) for a in data.get("task_attachments") or []]
+        for s_gid, alist in (data.get("story_attachment_map") or {}).items():
+            atts.extend(("story", s_gid, a) for a in alist)
+
+        for pos, sub in enumerate(data.get("subtasks") or []):
+            sm = sub["meta"]
+            self.conn.execute(
+                "INSERT INTO subtasks (gid, task_gid, position, name, meta) VALUES (?, ?, ?, ?, ?)",
+                (str(sm["gid"]), gid, pos, sm.get("name"), serializer.dumps(sm)),
+            )
+            stories.extend((str(sm["gid"]), s) for s in sub.get("stories") or [])
+            atts.extend(("subtask", str(sm["gid"]), a) for a in sub.get("attachments") or [])
+
+        self.conn.executemany(
+            """INSERT INTO stories (gid, task_gid, owner_gid, position, created_at, resource_subtype, text, created_by_name)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            [
+                (
+                    s.get("gid"),
+                    gid,
+                    owner,
+                    pos,
+                    s.get("created_at"),
+                    s.get("resource_subtype"),
+                    s.get("text"),
+                    (s.get("created_by") or {}).get("name"),
+                )
+                for pos, (owner, s) in enumerate(stories)
+            ],
+        )
+        self.conn.executemany(
+            """INSERT INTO attachments (gid, task_gid, owner_type, owner_gid, position, name, download_url, local_path,
+                                        ocr_text, analysis_state, analysis_attempts)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            [
+                (
+                    str(a["gid"]),
+                    gid,
+                    owner_type,
+                    owner,
+                    pos,
+                    a.get("name"),
+                    a.get("download_url"),
+                    a.get("local_path"),
+                    a.get("ocr_text"),
+                    a.get("analysis_state"),
+                    a.get("analysis_attempts") or 0,
+                )
+                for pos, (owner_type, owner, a) in enumerate(atts)
+            ],
+        )
+        self._tick()
+
+    def _delete_rows(self, gid):
+        for table in _CHILD_TABLES:
+            self.conn.execute(f"DELETE FROM {table} WHERE task_gid = ?", (gid,))
+        self.conn.execute("DELETE FROM tasks WHERE gid = ?", (gid,))
+
+    def delete(self, gid) -> bool:
+        gid = str(gid)
+        if self._json_export:
+            self._json_export.delete(gid)
+        exists = self.conn.execute("SELECT 1 FROM tasks WHERE gid = ?", (gid,)).fetchone()
+        if not exists:
+            return False
+        self._delete_rows(gid)
+        self._tick()
+        return True
+
+    def _tick(self):
+        self._pending += 1
+        if self._pending >= self.COMMIT_EVERY:
+            self.commit()
+
+    def commit(self):
+        self.conn.commit()
+        self._pending = 0
+
+    # ------------------------------------------------------------------
+    # 讀取
+    # ------------------------------------------------------------------
+    def get(self, gid) -> Optional[dict]:
+        """以 GID 讀取並還原為 run_fetch 的資料包結構"""
+        gid = str(gid)
+        task = self.conn.execute("SELECT * FROM tasks WHERE gid = ?", (gid,)).fetchone()
+        if not task:
+            return None
+
+        stories_by_owner = {}
+        for r in self.conn.execute(
+            "SELECT * FROM stories WHERE task_gid = ? ORDER BY position", (gid,)
+        ):
+            stories_by_owner.setdefault(r["owner_gid"], []).append(
+                {
+                    "gid": r["gid"],
+                    "created_at": r["created_at"],
+                    "resource_subtype": r["resource_subtype"],
+                    "text": r["text"],
+                    "created_by": {"name": r["created_by_name"]} if r["created_by_name"] is not None else None,
+                }
+            )
+
+        task_atts, story_map, sub_atts = [], {}, {}
+        for r in self.conn.execute(
+            "SELECT * FROM attachments WHERE task_gid = ? ORDER BY position", (gid,)
+        ):
+            att = {
+                "gid": r["gid"],
+                "name": r["name"],
+                "download_url": r["download_url"],
+                "local_path": r["local_path"],
+                "ocr_text": r["ocr_text"],
+                "analysis_state": r["analysis_state"],
+                "analysis_attempts": r["analysis_attempts"] or 0,
+            }
+            if r["owner_type"] == "story":
+                story_map.setdefault(r["owner_gid"], []).append(att)
+            elif r["owner_type"] == "subtask":
+                sub_atts.setdefault(r["owner_gid"], []).append(att)
+            else:
+                task_atts.append(att)
+
+        subtasks = [
+            {
+                "meta": serializer.loads(r["meta"]),
+                "stories": stories_by_owner.get(r["gid"], []),
+                "attachments": sub_atts.get(r["gid"], []),
+            }
+            for r in self.conn.execute(
+                "SELECT gid, meta FROM subtasks WHERE task_gid = ? ORDER BY position", (gid,)
+            )
+        ]
+
+        return {
+            "metadata": serializer.loads(task["metadata"]),
+            "section_name": task["section"],
+            "stories": stories_by_owner.get(gid, []),
+            "task_attachments": task_atts,
+            "story_attachment_map": story_map,
+            "subtasks": subtasks,
+            "fetched_at": task["fetched_at"],
+        }
+
+    def gids(self) -> List[str]:
+        return [
+            r["gid"]
+            for r in self.conn.execute(
+                "SELECT gid FROM tasks WHERE project = ? ORDER BY created_at, gid", (self.project,)
+            )
+        ]
+
+    def __len__(self):
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM tasks WHERE project = ?", (self.project,)
+        ).fetchone()[0]
+
+    def iter_records(self) -> Iterator[dict]:
+        for gid in self.gids():
+            record = self.get(gid)
+            if record:
+                yield record
+
+    # ------------------------------------------------------------------
+    # 查詢 (取代目錄掃描)
+    # ------------------------------------------------------------------
+    def modified_index(self) -> dict:
+        """{gid: modified_at}，用於比對哪些任務有異動"""
+        return {
+            r["gid"]: r["modified_at"]
+            for r in self.conn.execute(
+                "SELECT gid, modified_at FROM tasks WHERE project = ?", (self.project,)
+            )
+        }
+
+    def changed_since(self, modified_after: str) -> List[str]:
+        """異動時間晚於指定時間 (ISO 字串) 的任務 GID"""
+        return [
+            r["gid"]
+            for r in self.conn.execute(
+                "SELECT gid FROM tasks WHERE project = ? AND modified_at > ? ORDER BY modified_at",
+                (self.project, modified_after),
+            )
+        ]
+
+    def gids_in_section(self, section: str) -> List[str]:
+        return [
+            r["gid"]
+            for r in self.conn.execute(
+                "SELECT gid FROM tasks WHERE project = ? AND section = ?", (self.project, section)
+            )
+        ]
+
+    def attachments_missing_analysis(self) -> List[dict]:
+        """已下載但尚無分析結果 (ocr_text 為空) 的附件"""
+        return [
+            dict(r)
+            for r in self.conn.execute(
+                """SELECT a.gid, a.task_gid, a.owner_type, a.owner_gid, a.name, a.local_path
+                   FROM attachments a JOIN tasks t ON t.gid = a.task_gid
+                   WHERE t.project = ? AND a.local_path IS NOT NULL
+                     AND (a.ocr_text IS NULL OR a.ocr_text = '')""",
+                (self.project,),
+            )
+        ]
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
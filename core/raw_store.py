@@ -0,0 +1,330 @@
+# 檔案用途：原始任務資料 (Raw Data) 的儲存後端：SQLite (預設)、逐檔 JSON 或壓縮封裝分片 (packed)，並提供格式轉換工具。
+
+import os
+import sys
+import glob
+import zlib
+from typing import Iterator, Optional
+
+from core import config, serializer
+
+# zstd 為選用相依；未安裝時封裝分片改用 zlib
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# 封裝時從 metadata 移除的欄位 (僅 Stage 1 擷取時使用，渲染不需要)
+_TRIM_METADATA_KEYS = ("memberships",)
+
+
+def to_plain(data: dict) -> dict:
+    """將資料包中的 dataclass (AttachmentData) 轉為純 dict"""
+    return serializer.to_builtins(data)
+
+
+def trim_task_package(data: dict) -> dict:
+    """
+    移除渲染用不到的內容，縮小封裝後的紀錄
+
+    * 留言只保留 comment_added (其餘為系統異動紀錄，renderer 不會輸出)
+    * metadata 移除 memberships 等擷取階段專用欄位
+
+    Args:
+        data (dict): run_fetch 產生的任務資料包 (可含 AttachmentData)
+
+    Returns:
+        dict: 精簡後、可直接 JSON 序列化的資料包
+    """
+    data = to_plain(data)
+    data["metadata"] = {
+        k: v for k, v in data["metadata"].items() if k not in _TRIM_METADATA_KEYS
+    }
+
+    def _comments(stories):
+        return [s for s in stories or [] if s.get("resource_subtype") == "comment_added"]
+
+    data["stories"] = _comments(data.get("stories"))
+    for sub in data.get("subtasks") or []:
+        sub["stories"] = _comments(sub.get("stories"))
+    return data
+
+
+def _json_filename(meta: dict) -> str:
+    c_at = meta["created_at"][:10].replace("-", "")
+    return f"{c_at}_{meta['gid']}.json"
+
+
+class JsonDirStore:
+    """
+    逐檔 JSON 儲存 (原有格式)：raw_data/<專案>/json_tasks/{建立日}_{gid}.json
+    """
+
+    def __init__(self, proj_name):
+        self.json_dir = os.path.join(config.RAW_DIR, proj_name, "json_tasks")
+        os.makedirs(self.json_dir, exist_ok=True)
+
+    def put(self, data: dict):
+        fpath = os.path.join(self.json_dir, _json_filename(data["metadata"]))
+        serializer.dump_file(data, fpath, indent=True)
+
+    def _path(self, gid) -> Optional[str]:
+        matches = glob.glob(os.path.join(self.json_dir, f"*_{gid}.json"))
+        return matches[0] if matches else None
+
+    def get(self, gid) -> Optional[dict]:
+        fpath = self._path(gid)
+        if not fpath:
+            return None
+        return serializer.load_file(fpath)
+
+    def delete(self, gid) -> bool:
+        fpath = self._path(gid)
+        if not fpath:
+            return False
+        os.remove(fpath)
+        return True
+
+    def _files(self):
+        return sorted(glob.glob(os.path.join(self.json_dir, "*.json")))
+
+    def __len__(self):
+        return len(self._files())
+
+    def iter_records(self) -> Iterator[dict]:
+        for fpath in self._files():
+            yield serializer.load_file(fpath)
+
+    def modified_index(self) -> dict:
+        """{gid: modified_at} (需讀取所有檔案)"""
+        return {
+            str(d["metadata"]["gid"]): d["metadata"].get("modified_at")
+            for d in self.iter_records()
+        }
+
+    def commit(self):
+        # 每筆寫入即為獨立檔案，無需額外處理
+        pass
+
+    def close(self):
+        pass
+
+
+class PackedStore:
+    """
+    壓縮封裝儲存：raw_data/<專案>/packed/
+
+    * shard-NNNN.pack：只追加 (append-only) 的分片，每筆為一段獨立壓縮的精簡 JSON
+    * index.json：{gid: [分片編號, offset, 長度]}，支援以 GID 隨機讀取
+    * 同一 GID 重新寫入時追加新紀錄並更新索引，舊紀錄成為空間碎片 (可用 compact() 回收)
+    """
+
+    INDEX_FILE = "index.json"
+
+    def __init__(self, proj_name):
+        self.pack_dir = os.path.join(config.RAW_DIR, proj_name, "packed")
+        os.makedirs(self.pack_dir, exist_ok=True)
+        self.index_path = os.path.join(self.pack_dir, self.INDEX_FILE)
+        self.index = self._load_index()
+        self._dirty = False
+        self._writer = None
+        self._writer_shard = None
+        self._compressor = zstandard.ZstdCompressor(level=9) if zstandard else None
+        self._decompressor = zstandard.ZstdDecompressor() if zstandard else None
+
+    def _load_index(self):
+        if os.path.exists(self.index_path):
+            return serializer.load_file(self.index_path)
+        return {}
+
+    def _shard_path(self, shard_no):
+        return os.path.join(self.pack_dir, f"shard-{shard_no:04d}.pack")
+
+    def _open_writer(self):
+        shards = sorted(glob.glob(os.path.join(self.pack_dir, "shard-*.pack")))
+        shard_no = int(os.path.basename(shards[-1])[6:10]) if shards else 0
+        if shards and os.path.getsize(shards[-1]) >= config.RAW_SHARD_MAX_BYTES:
+            shard_no += 1
+        self._writer = open(self._shard_path(shard_no), "ab")
+        self._writer_shard = shard_no
+
+    def _compress(self, raw: bytes) -> bytes:
+        if self._compressor:
+            return self._compressor.compress(raw)
+        return zlib.compress(raw, 9)
+
+    def _decompress(self, blob: bytes) -> bytes:
+        if blob[:4] == _ZSTD_MAGIC:
+            if not self._decompressor:
+                raise RuntimeError("此分片以 zstd 壓縮，請先安裝 zstandard")
+            return self._decompressor.decompress(blob)
+        return zlib.decompress(blob)
+
+    def put(self, data: dict, trim=True):
+        """
+        追加一筆任務資料
+
+        Args:
+            data (dict): 任務資料包
+            trim (bool): 是否先以 trim_task_package 精簡
+        """
+        record = trim_task_package(data) if trim else data
+        blob = self._compress(serializer.dumps_bytes(record))
+        if self._writer is None:
+            self._open_writer()
+        elif self._writer.tell() >= config.RAW_SHARD_MAX_BYTES:
+            self._writer.close()
+            self._writer = open(self._shard_path(self._writer_shard + 1), "ab")
+            self._writer_shard += 1
+
+        offset = self._writer.tell()
+        self._writer.write(blob)
+        self.index[str(record["metadata"]["gid"])] = [self._writer_shard, offset, len(blob)]
+        self._dirty = True
+
+    def get(self, gid) -> Optional[dict]:
+        entry = self.index.get(str(gid))
+        if not entry:
+            return None
+        shard_no, offset, length = entry
+        if self._writer is not None and shard_no == self._writer_shard:
+            self._writer.flush()
+        with open(self._shard_path(shard_no), "rb") as f:
+            f.seek(offset)
+            return serializer.loads(self._decompress(f.read(length)))
+
+    def delete(self, gid) -> bool:
+        if self.index.pop(str(gid), None) is None:
+            return False
+        self._dirty = True
+        return True
+
+    def __len__(self):
+        return len(self.index)
+
+    def iter_records(self) -> Iterator[dict]:
+        """依分片與 offset 順序讀取 (循序 I/O)，每個分片只開啟一次"""
+        if self._writer is not None:
+            self._writer.flush()
+        entries = sorted(self.index.values())
+        fh, fh_shard = None, None
+        try:
+            for shard_no, offset, length in entries:
+                if shard_no != fh_shard:
+                    if fh:
+                        fh.close()
+                    fh, fh_shard = open(self._shard_path(shard_no), "rb"), shard_no
+                fh.seek(offset)
+                yield serializer.loads(self._decompress(fh.read(length)))
+        finally:
+            if fh:
+                fh.close()
+
+    def modified_index(self) -> dict:
+        """{gid: modified_at} (需解壓所有紀錄)"""
+        return {
+            str(d["metadata"]["gid"]): d["metadata"].get("modified_at")
+            for d in self.iter_records()
+        }
+
+    def compact(self):
+        """將仍有效的紀錄重寫到新分片，移除已覆寫或刪除的舊紀錄"""
+        records = list(self.iter_records())
+        self.close()
+        for f in glob.glob(os.path.join(self.pack_dir, "shard-*.pack")):
+            os.remove(f)
+        self.index = {}
+        for record in records:
+            self.put(record, trim=False)
+        self.close()
+
+    def commit(self):
+        """將分片寫入磁碟並寫出索引 (之後中斷也不會遺失已寫入的紀錄)"""
+        if self._writer is not None:
+            self._writer.flush()
+            os.fsync(self._writer.fileno())
+        if self._dirty:
+            tmp_path = self.index_path + ".tmp"
+            serializer.dump_file(self.index, tmp_path, indent=False)
+            os.replace(tmp_path, self.index_path)
+            self._dirty = False
+
+    def close(self):
+        self.commit()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+def get_raw_store(proj_name, backend=None):
+    """
+    依設定 (RAW_STORE_BACKEND) 取得專案的原始資料儲存後端
+
+    * sqlite 後端首次開啟某專案時，若資料庫尚無紀錄但已有 json_tasks/，會自動匯入
+
+    Args:
+        proj_name (str): 專案資料夾名稱 (safe_proj_name)
+        backend (str): "sqlite"、"json" 或 "packed"，None 表示使用設定值
+    """
+    backend = backend or config.RAW_STORE_BACKEND
+    if backend == "packed":
+        return PackedStore(proj_name)
+    if backend == "json":
+        return JsonDirStore(proj_name)
+
+    from core.raw_db import SqliteStore
+
+    store = SqliteStore(proj_name)
+    json_dir = os.path.join(config.RAW_DIR, proj_name, "json_tasks")
+    if len(store) == 0 and glob.glob(os.path.join(json_dir, "*.json")):
+        copy_records(JsonDirStore(proj_name), store, f"匯入 {proj_name} 既有 JSON → SQLite")
+    return store
+
+
+def copy_records(src, dst, label):
+    """將 src 後端的所有紀錄寫入 dst 後端 (dst 寫入後會先 commit/flush，但不關閉)"""
+    total = len(src)
+    print(f"\n📦 {label}：{total} 筆")
+    for i, data in enumerate(src.iter_records()):
+        dst.put(data)
+        sys.stdout.write(f"\r   進度: {i+1}/{total}...")
+        sys.stdout.flush()
+    if hasattr(dst, "commit"):
+        dst.commit()
+    print(f"\n✅ 完成")
+
+
+def convert_json_to_packed(proj_name):
+    """
+    將既有 json_tasks/ 逐檔 JSON 轉入封裝分片 (原檔保留，確認無誤後可自行刪除)
+    """
+    src = JsonDirStore(proj_name)
+    dst = PackedStore(proj_name)
+    src_bytes = sum(os.path.getsize(f) for f in src._files())
+    copy_records(src, dst, f"轉換 {proj_name}：JSON → 封裝分片")
+    dst.close()
+    dst_bytes = sum(
+        os.path.getsize(f) for f in glob.glob(os.path.join(dst.pack_dir, "shard-*.pack"))
+    )
+    print(f"   {src_bytes / 1e6:.1f} MB → {dst_bytes / 1e6:.1f} MB ({dst.pack_dir})")
+
+
+def export_json(proj_name):
+    """將目前後端的資料匯出為 json_tasks/ 逐檔 JSON (相容舊格式)"""
+    src = get_raw_store(proj_name)
+    copy_records(src, JsonDirStore(proj_name), f"匯出 {proj_name} → json_tasks/")
+    src.close()
+
+
+if __name__ == "__main__":
+    # 用法:
+    #   python -m core.raw_store convert <專案資料夾名稱>   (json_tasks → packed)
+    #   python -m core.raw_store export <專案資料夾名稱>    (目前後端 → json_tasks)
+    if len(sys.argv) == 3 and sys.argv[1] == "convert":
+        convert_json_to_packed(sys.argv[2])
+    elif len(sys.argv) == 3 and sys.argv[1] == "export":
+        export_json(sys.argv[2])
+    else:
+        print("用法: python -m core.raw_store [convert|export] <專案資料夾名稱>")
@@ -0,0 +1,191 @@
+# 檔案用途：JSON 序列化層：有安裝 orjson / msgspec 時使用之，否則退回標準函式庫，輸出位元組與 json 模組一致。
+
+import sys
+import json
+import time
+import dataclasses
+from typing import Any, List
+
+from core import config
+from core.models import AttachmentData
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+# JSON 編碼器：處理 dataclass (AttachmentData) 轉 dict
+class EnhancedJSONEncoder(json.JSONEncoder):
+    def default(self, o):
+        if dataclasses.is_dataclass(o):
+            return dataclasses.asdict(o)
+        return super().default(o)
+
+
+def _select_backend(name):
+    if name in ("auto", "orjson") and orjson:
+        return "orjson"
+    if name in ("auto", "msgspec") and msgspec:
+        return "msgspec"
+    if name not in ("auto", "json"):
+        print(f"⚠️ JSON_BACKEND={name} 未安裝，改用標準函式庫 json")
+    return "json"
+
+
+# 目前使用的後端："orjson"、"msgspec" 或 "json"
+BACKEND = _select_backend(config.JSON_BACKEND)
+
+_COMPACT = (",", ":")
+if msgspec:
+    _msgspec_decoder = msgspec.json.Decoder()
+
+
+def dumps_bytes(obj: Any, indent=False) -> bytes:
+    """
+    序列化為 UTF-8 位元組 (不跳脫非 ASCII 字元，可直接處理 dataclass)
+
+    輸出與 json.dumps(ensure_ascii=False, indent=2 或 separators=(",", ":")) 相同；
+    唯一例外是 orjson 會將 NaN/Infinity 輸出為 null、指數型浮點數不帶 "+"，任務資料中不會出現。
+
+    Args:
+        obj: 任意可序列化物件
+        indent (bool): True 時縮排 2 格 (與原本 raw JSON 檔相同)，否則為緊湊格式
+    """
+    if BACKEND == "orjson":
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+        except TypeError:
+            # 超過 64-bit 的整數等 orjson 不支援的型別，退回標準函式庫
+            pass
+    return dumps(obj, indent=indent, _force_stdlib=True).encode("utf-8")
+
+
+def dumps(obj: Any, indent=False, _force_stdlib=False) -> str:
+    """序列化為字串 (格式同 dumps_bytes)"""
+    if BACKEND == "orjson" and not _force_stdlib:
+        return dumps_bytes(obj, indent=indent).decode("utf-8")
+    if indent:
+        return json.dumps(obj, cls=EnhancedJSONEncoder, ensure_ascii=False, indent=2)
+    return json.dumps(obj, cls=EnhancedJSONEncoder, ensure_ascii=False, separators=_COMPACT)
+
+
+def loads(data):
+    """反序列化 (接受 str 或 bytes)"""
+    if BACKEND == "orjson":
+        return orjson.loads(data)
+    if BACKEND == "msgspec":
+        return _msgspec_decoder.decode(data.encode("utf-8") if isinstance(data, str) else data)
+    return json.loads(data)
+
+
+def dump_file(obj: Any, path, indent=True):
+    with open(path, "wb") as f:
+        f.write(dumps_bytes(obj, indent=indent))
+
+
+def load_file(path):
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+def to_builtins(obj: Any):
+    """將含 dataclass 的物件轉為純 dict / list (等同序列化後再解析)"""
+    if msgspec:
+        return msgspec.to_builtins(obj)
+    return loads(dumps_bytes(obj))
+
+
+_ATTACHMENT_FIELDS = tuple(f.name for f in dataclasses.fields(AttachmentData))
+
+
+def decode_attachment(data: dict) -> AttachmentData:
+    """將附件 dict 轉為 AttachmentData (msgspec 可用時含型別檢查)"""
+    if msgspec:
+        return msgspec.convert(data, AttachmentData)
+    return AttachmentData(**{k: data.get(k) for k in _ATTACHMENT_FIELDS if k in data})
+
+
+def decode_attachments(items: List[dict]) -> List[AttachmentData]:
+    return [decode_attachment(a) for a in items or []]
+
+
+# ----------------------------------------------------------------------
+# 效能量測：python -m core.serializer [任務數]
+# ----------------------------------------------------------------------
+def _sample_package(i):
+    att = AttachmentData(
+        gid=f"9{i:08d}",
+        name="螢幕擷取畫面.png",
+        download_url="https://asana-user-private.s3.amazonaws.com/assets/xxx",
+        local_path=f"/data/attachments/20250101_{i}_螢幕擷取畫面.png",
+        ocr_text="**圖片類型**：`錯誤訊息`\n- 錯誤代碼：E123\n**內容摘要**：使用者登入失敗，系統提示密碼錯誤。",
+    )
+    stories = [
+        {
+            "gid": f"{i}{j:03d}",
+            "created_at": "2025-01-02T03:04:05.678Z",
+            "resource_subtype": "comment_added",
+            "text": f"第 {j} 則回覆：已確認問題並提供處理方式，請客戶重新登入後再試一次。" * 2,
+            "created_by": {"name": "客服人員"},
+        }
+        for j in range(12)
+    ]
+    return {
+        "metadata": {
+            "gid": str(1200000000000000 + i),
+            "name": f"[客訴] 無法登入系統 #{i}",
+            "created_at": "2025-01-01T00:00:00.000Z",
+            "modified_at": "2025-01-05T00:00:00.000Z",
+            "completed": True,
+            "due_on": None,
+            "notes": "提問人問題主旨：無法登入\n提問人問題內文：輸入帳號密碼後出現錯誤訊息。" * 3,
+            "memberships": [{"project": {"gid": "1"}, "section": {"gid": "2"}}],
+            "custom_fields": [{"gid": "3", "name": "知識截止日", "display_value": "2026-01-01"}],
+            "calculated_expiry_date": "2026-01-01",
+        },
+        "section_name": "帳號問題",
+        "stories": stories,
+        "task_attachments": [att],
+        "story_attachment_map": {stories[0]["gid"]: [att]},
+        "subtasks": [{"meta": {"gid": f"8{i}", "name": "回覆客戶", "notes": ""}, "stories": stories[:2], "attachments": []}],
+        "fetched_at": "2025-01-06T00:00:00.000000Z",
+    }
+
+
+def benchmark(n_tasks=10000):
+    """
+    以 n_tasks 筆模擬任務比較標準函式庫與目前後端，並驗證輸出位元組一致
+    """
+    packages = [_sample_package(i) for i in range(n_tasks)]
+
+    def timed(fn):
+        start = time.perf_counter()
+        result = fn()
+        return time.perf_counter() - start, result
+
+    t_std_enc, std_out = timed(
+        lambda: [json.dumps(p, cls=EnhancedJSONEncoder, ensure_ascii=False, indent=2).encode("utf-8") for p in packages]
+    )
+    t_fast_enc, fast_out = timed(lambda: [dumps_bytes(p, indent=True) for p in packages])
+    t_std_dec, _ = timed(lambda: [json.loads(b) for b in std_out])
+    t_fast_dec, decoded = timed(lambda: [loads(b) for b in fast_out])
+    t_typed, _ = timed(lambda: [decode_attachments(d["task_attachments"]) for d in decoded])
+
+    identical = std_out == fast_out
+    mb = sum(len(b) for b in std_out) / 1e6
+    print(f"\n⏱️ 序列化效能 ({n_tasks} 筆任務，{mb:.1f} MB，後端: {BACKEND})")
+    print(f"   編碼 (indent=2)：json {t_std_enc:.2f}s → {BACKEND} {t_fast_enc:.2f}s ({t_std_enc / t_fast_enc:.1f}x)")
+    print(f"   解碼           ：json {t_std_dec:.2f}s → {BACKEND} {t_fast_dec:.2f}s ({t_std_dec / t_fast_dec:.1f}x)")
+    print(f"   附件型別轉換   ：{t_typed:.2f}s")
+    print(f"   {'✅' if identical else '❌'} 輸出位元組{'一致' if identical else '不一致'}")
+    return identical
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -1,5 +1,7 @@
 import re
 import os
+import math
+import hashlib
 import requests
 from core import config  # Updated import
 from typing import List
@@ -15,6 +17,54 @@ def ensure_dict(obj):
     return obj
 
 
+def hash_text(text):
+    """
+    計算文字內容的 SHA-256 雜湊 (用於判斷內容是否變動)
+
+    Args:
+        text (str): 任意文字
+
+    Returns:
+        str: 16 進位雜湊字串
+    """
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+# 中日韓字元 (含全形標點)，粗估每字約 1 token
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+
+def estimate_tokens(text):
+    """
+    粗估文字的 token 數 (不依賴 tokenizer)
+
+    規則：CJK 字元每字約 1 token，其餘字元約 4 字元 1 token。
+
+    Args:
+        text (str): 任意文字
+
+    Returns:
+        int: 估計 token 數
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def split_frontmatter(md_content):
+    """
+    分離 Markdown 的 YAML 檔頭文字與內文 (不解析 YAML)
+
+    Returns:
+        tuple: (YAML 文字, 內文)；若無檔頭則回傳 (None, 原文)
+    """
+    match = re.match(r"^---\n(.*?)\n---\n(.*)", md_content, re.DOTALL)
+    if match:
+        return match.group(1), match.group(2)
+    return None, md_content
+
+
 def clean_filename(name):
     """
     清理檔名: 移除不合法字元，限制長度
@@ -39,6 +89,24 @@ def process_attachment_link(att, parent_gid, save_dir):
         tuple: (Markdown連結字串, 本地檔案絕對路徑)
         * 如果沒下載或失敗，本地路徑回傳 None
     """
+    link, local_path, _ = download_attachment(att, parent_gid, save_dir)
+    return link, local_path
+
+
+def download_attachment(att, parent_gid, save_dir, session=None):
+    """
+    下載附件並寫入本地，同時回傳下載的位元組 (供後續分析直接使用，不必再讀檔)
+
+    Args:
+        att (dict): 附件物件
+        parent_gid (str): 父任務 GID
+        save_dir (str): 存檔目錄
+        session (requests.Session): 可重用連線的 Session，None 時使用 requests.get
+
+    Returns:
+        tuple: (Markdown連結字串, 本地檔案絕對路徑, 檔案位元組)
+        * 如果沒下載或失敗，本地路徑與位元組回傳 None
+    """
     att = ensure_dict(att)
     a_name = att.get("name", "unknown")
     a_url = att.get("download_url")
@@ -53,24 +121,24 @@ def process_attachment_link(att, parent_gid, save_dir):
 
         # 下載檔案 (強制覆蓋以確保最新)
         try:
-            # 建議加上 stream=True 處理大檔案，這裡維持簡單寫法
-            r = requests.get(a_url, timeout=30)
+            r = (session or requests).get(a_url, timeout=30)
             if r.status_code == 200:
+                content = r.content
                 with open(local_path, "wb") as f:
-                    f.write(r.content)
+                    f.write(content)
             else:
                 # 下載失敗，回傳 None 路徑
-                return (f"[{a_name} (下載失敗)]({a_url})", None)
+                return (f"[{a_name} (下載失敗)]({a_url})", None, None)
         except Exception as e:
             print(f"⚠️ 附件下載失敗 [{a_name}]: {e}")
-            return (f"[{a_name} (下載失敗)]({a_url})", None)
+            return (f"[{a_name} (下載失敗)]({a_url})", None, None)
 
-        # ✅ 成功：回傳 (相對路徑連結, 本地絕對路徑)
+        # ✅ 成功：回傳 (相對路徑連結, 本地絕對路徑, 位元組)
         # 本地絕對路徑是用來給 OCR 讀取的
-        return (f"[{a_name}](../attachments/{unique_fname})", local_path)
+        return (f"[{a_name}](../attachments/{unique_fname})", local_path, content)
     else:
-        # ❎ 不下載：回傳 (Asana網頁連結, None)
-        return (f"[{a_name}]({a_url})", None)
+        # ❎ 不下載：回傳 (Asana網頁連結, None, None)
+        return (f"[{a_name}]({a_url})", None, None)
 
 
 def post_masking_preview(client, task_gid, markdown_content):
@@ -1,58 +1,132 @@
 # 檔案用途：封裝 Asana API 相關取數邏輯
 
-from typing import Dict, List, Tuple
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
 from asana.rest import ApiException
 
-from core import utils, config
+from core import utils, config, serializer
 from core.models import AsanaApis, AttachmentData
-from services import llm_processor
+from fetch import attachment_policy, attachment_workers
+
+# 差異擷取統計 (沿用 / 新處理的附件數)；多個擷取執行緒同時累加，以鎖保護
+delta_stats = {"reused_attachments": 0, "new_attachments": 0, "new_stories": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(key, n=1):
+    with _stats_lock:
+        delta_stats[key] += n
+
+
+def reset_stats():
+    with _stats_lock:
+        delta_stats.update(dict.fromkeys(delta_stats, 0))
+
+
+def _known_attachments(existing: Optional[dict]) -> Dict[str, dict]:
+    """從已存紀錄收集所有附件 {gid: 附件 dict}"""
+    if not existing:
+        return {}
+    atts = list(existing.get("task_attachments") or [])
+    for alist in (existing.get("story_attachment_map") or {}).values():
+        atts.extend(alist)
+    for sub in existing.get("subtasks") or []:
+        atts.extend(sub.get("attachments") or [])
+    return {str(a["gid"]): a for a in atts}
+
+
+def _reusable(known_att: Optional[dict]) -> bool:
+    """
+    已存附件可沿用：未啟用下載，或已下載 (檔案仍在) 且需分析者已完成分析
+
+    * analysis_state 為 empty (分析成功但無內容，例如沒有文字層的掃描 PDF) 者沿用，不重複付費
+    * failed (或升級前無狀態且無結果) 者重新下載與分析，累計 ATTACHMENT_ANALYSIS_MAX_ATTEMPTS 次後不再重試
+    """
+    if not known_att:
+        return False
+    if not config.DOWNLOAD_ATTACHMENTS:
+        return True
+    path = known_att.get("local_path")
+    if not (path and os.path.exists(path)):
+        return False
+    if known_att.get("ocr_text") or not attachment_policy.should_analyze(known_att):
+        return True
+    if known_att.get("analysis_state") == attachment_workers.EMPTY:
+        return True
+    return (known_att.get("analysis_attempts") or 0) >= config.ATTACHMENT_ANALYSIS_MAX_ATTEMPTS
 
 
 def _process_attachments_with_llm(
-    api_attachments: List[dict], parent_gid: str, save_dir: str
-) -> List[AttachmentData]:
+    api_attachments: List[dict],
+    parent_gid: str,
+    save_dir: str,
+    known=None,
+    group=None,
+    task_gid=None,
+) -> list:
     """
-    內部輔助函式：批次處理附件列表
-    動作：1. 下載檔案  2. 呼叫 GPT-4o-mini 分析  3. 封裝資料
+    內部輔助函式：批次排入附件處理
+    動作：1. 依附件策略決定處理方式  2. 下載檔案 (下載池)  3. 呼叫 GPT-4o-mini 分析 (分析池)  4. 封裝資料
+    known ({gid: dict}) 中已處理過的附件直接沿用，不重新下載與分析
+    group (VisionGroup) 不為 None 時，同一任務的圖片合併為多圖請求
+    task_gid 為延後附件回填的任務 (子任務附件填主任務 GID)，預設同 parent_gid
+
+    Returns:
+        list: AttachmentData (沿用) 或 Future (處理中)，以 attachment_workers.resolve() 取得結果
     """
+    workers = attachment_workers.get_workers()
     processed_list = []
 
     for att in api_attachments:
         att = utils.ensure_dict(att)
 
-        # 1. 下載檔案 (並取得本地路徑)
-        # utils.process_attachment_link 會回傳 (markdown_link, local_path)
-        # 這裡我們只需要 local_path
-        _, local_path = utils.process_attachment_link(att, parent_gid, save_dir)
-
-        # 2. 執行 LLM 分析 (僅當有本地檔案且設定開啟時)
-        analysis_result = None
-        if local_path and config.DOWNLOAD_ATTACHMENTS:
-            # 呼叫 GPT-4o-mini
-            analysis_result = llm_processor.analyze_image(local_path)
-
-        # 3. 封裝資料為 AttachmentData 物件，讓後續的流程能用 .ocr_text 拿到 AI 的分析結果
-        processed_list.append(
-            AttachmentData(
-                gid=att["gid"],
-                name=att["name"],
-                download_url=att.get("download_url"),
-                local_path=local_path,
-                ocr_text=analysis_result,  # 這裡存的是 LLM 的分析結果
+        known_att = (known or {}).get(str(att["gid"]))
+        if _reusable(known_att):
+            processed_list.append(serializer.decode_attachment(known_att))
+            _count("reused_attachments")
+            continue
+        _count("new_attachments")
+        if known_att:
+            # 重試分析失敗的附件：延續嘗試次數
+            att["analysis_attempts"] = known_att.get("analysis_attempts") or 0
+
+        action = attachment_policy.decide(att)
+        if action == attachment_policy.LINK:
+            processed_list.append(attachment_workers.link_only(att))
+        elif action == attachment_policy.DEFER:
+            # 大型附件：先以連結寫入，背景下載完成後於擷取結束時回填
+            processed_list.append(attachment_workers.link_only(att))
+            workers.defer(
+                att, parent_gid, save_dir, task_gid or parent_gid, analyze=attachment_policy.analyzable(att)
+            )
+        else:
+            # 下載與分析在背景 worker 進行，這裡不等待，繼續抓取其他留言 / 子任務
+            processed_list.append(
+                workers.submit(
+                    att, parent_gid, save_dir, group, analyze=action == attachment_policy.ANALYZE
+                )
             )
-        )
 
     return processed_list
 
 
 def fetch_task_context(
-    task_gid: str, apis: AsanaApis, att_dir: str  # 參數：附件儲存目錄 (用途:下載附件)
+    task_gid: str,
+    apis: AsanaApis,
+    att_dir: str,  # 參數：附件儲存目錄 (用途:下載附件)
+    existing: Optional[dict] = None,
 ) -> Tuple[
     List[AttachmentData], Dict[str, List[AttachmentData]], List[dict], List[dict]
 ]:
     """
     取得單一任務的完整上下文 (Context)，並完成所有前處理。
 
+    差異模式 (傳入 existing 已存紀錄)：
+        * 留言清單仍需列出 (API 無法依時間篩選)，但只有新留言會帶來新附件
+        * 已存在的附件 (依 GID) 直接沿用，不重新下載與圖片分析
+        * 子任務的 modified_at 未變動時，整個子任務 (詳情、留言、附件) 直接沿用
+
     Returns:
         task_attachments (List[AttachmentData]): 主任務附件
         story_attachment_map (Dict): 留言附件對照表
@@ -71,6 +145,11 @@ def fetch_task_context(
         )
     ]
 
+    if existing:
+        known_story_gids = {s.get("gid") for s in existing.get("stories") or []}
+        _count("new_stories", sum(1 for s in stories if s.get("gid") not in known_story_gids))
+    known_atts = _known_attachments(existing)
+
     # ==========================================
     # 2. 抓取附件 & 歸位 & LLM 分析
     # ==========================================
@@ -80,7 +159,8 @@ def fetch_task_context(
         for a in apis.attachments.get_attachments_for_object(
             parent=task_gid,
             opts={
-                "opt_fields": "gid,name,download_url,parent.resource_type,parent.gid"
+                "opt_fields": attachment_policy.ATTACHMENT_OPT_FIELDS
+                + ",parent.resource_type,parent.gid"
             },
         )
     ]
@@ -98,14 +178,19 @@ def fetch_task_context(
         else:
             task_atts_raw.append(att)
 
-    # 處理任務附件(下載 + LLM)
-    task_attachments = _process_attachments_with_llm(task_atts_raw, task_gid, att_dir)
+    # 同一任務 (含留言、子任務) 的圖片可合併為多圖請求 (ENABLE_VISION_BATCH)
+    vision_group = attachment_workers.get_workers().group()
+
+    # 處理任務附件(下載 + LLM，背景進行；函式結尾統一等待結果)
+    task_attachments = _process_attachments_with_llm(
+        task_atts_raw, task_gid, att_dir, known_atts, vision_group
+    )
 
     # 處理留言附件 (批次處理 map 中的每一組)
     story_attachment_map = {}
     for s_gid, att_list in story_atts_map_raw.items():
         story_attachment_map[s_gid] = _process_attachments_with_llm(
-            att_list, task_gid, att_dir
+            att_list, task_gid, att_dir, known_atts, vision_group
         )
 
     # ==========================================
@@ -114,19 +199,33 @@ def fetch_task_context(
     subs_meta = [
         utils.ensure_dict(s)
         for s in apis.tasks.get_subtasks_for_task(
-            task_gid, opts={"opt_fields": "gid,name"}
+            task_gid, opts={"opt_fields": "gid,name,modified_at"}
         )
     ]
+    known_subs = {
+        str(sub["meta"]["gid"]): sub for sub in (existing or {}).get("subtasks") or []
+    }
 
     full_subs: List[dict] = []
     for sm in subs_meta:
+        # 差異模式：子任務未異動則整筆沿用
+        known_sub = known_subs.get(str(sm["gid"]))
+        if (
+            known_sub
+            and sm.get("modified_at")
+            and known_sub["meta"].get("modified_at") == sm["modified_at"]
+            and all(_reusable(a) for a in known_sub.get("attachments") or [])
+        ):
+            full_subs.append(known_sub)
+            _count("reused_attachments", len(known_sub.get("attachments") or []))
+            continue
         try:
             # 3-1. 子任務詳情
             sd = utils.ensure_dict(
                 apis.tasks.get_task(
                     sm["gid"],
                     opts={
-                        "opt_fields": "gid,name,completed,notes,due_on,custom_fields.name,custom_fields.display_value"
+                        "opt_fields": "gid,name,completed,notes,due_on,modified_at,custom_fields.name,custom_fields.display_value"
                     },
                 )
             )
@@ -144,10 +243,13 @@ def fetch_task_context(
             sa_raw = [
                 utils.ensure_dict(a)
                 for a in apis.attachments.get_attachments_for_object(
-                    parent=sm["gid"], opts={"opt_fields": "gid,name,download_url"}
+                    parent=sm["gid"],
+                    opts={"opt_fields": attachment_policy.ATTACHMENT_OPT_FIELDS},
                 )
             ]
-            sa_processed = _process_attachments_with_llm(sa_raw, sm["gid"], att_dir)
+            sa_processed = _process_attachments_with_llm(
+                sa_raw, sm["gid"], att_dir, known_atts, vision_group, task_gid
+            )
 
             # 這裡 subtask 的結構稍微不同，attachments 欄位存放的是處理過的 AttachmentData 列表
             full_subs.append({"meta": sd, "stories": ss, "attachments": sa_processed})
@@ -156,4 +258,16 @@ def fetch_task_context(
             print(f"⚠️ 抓取子任務失敗 {sm.get('gid')}: {e}")
             full_subs.append({"meta": sm, "stories": [], "attachments": []})
 
+    # ==========================================
+    # 4. 等待背景下載與分析完成
+    # ==========================================
+    if vision_group is not None:
+        vision_group.close()
+    task_attachments = attachment_workers.resolve(task_attachments)
+    story_attachment_map = {
+        s_gid: attachment_workers.resolve(alist) for s_gid, alist in story_attachment_map.items()
+    }
+    for sub in full_subs:
+        sub["attachments"] = attachment_workers.resolve(sub["attachments"])
+
     return task_attachments, story_attachment_map, stories, full_subs
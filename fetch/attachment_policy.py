@@ -0,0 +1,92 @@
+# 檔案用途：附件策略：依 Asana 附件 metadata (size、resource_subtype、host、副檔名) 在下載前決定處理方式。
+
+import os
+import threading
+
+from core import config
+
+# 處理方式
+ANALYZE = "analyze"  # 下載並分析 (圖片 vision / OCR、文件擷取)
+DOWNLOAD = "download"  # 只下載保存，不分析
+LINK = "link"  # 只保留連結，不下載
+DEFER = "defer"  # 排入低優先背景佇列下載 (不阻塞任務擷取)
+
+# 附件 metadata 欄位 (get_attachments_for_object 的 opt_fields)
+ATTACHMENT_OPT_FIELDS = "gid,name,download_url,size,resource_subtype,host"
+
+# 本次執行統計：各處理方式件數；bytes_avoided 為只保留連結而省下的下載量，bytes_deferred 為延後下載量
+policy_stats = {ANALYZE: 0, DOWNLOAD: 0, LINK: 0, DEFER: 0, "bytes_avoided": 0, "bytes_deferred": 0}
+_stats_lock = threading.Lock()
+
+_MB = 1024 * 1024
+
+
+def analyzable(att: dict) -> bool:
+    """副檔名是否屬於可分析的類型 (無副檔名時交給下載後的內容判斷)；DEFER 的附件依此決定下載後是否分析"""
+    ext = os.path.splitext(att.get("name") or "")[1].lower()
+    return not ext or ext in config.ATTACHMENT_ANALYZE_EXTENSIONS
+
+
+def _decide(att: dict) -> str:
+    if not config.DOWNLOAD_ATTACHMENTS or not att.get("download_url"):
+        return LINK
+    # 外部儲存 (Google Drive、Dropbox、Box…) 的附件需另行授權，只保留連結
+    host = (att.get("host") or att.get("resource_subtype") or "asana").lower()
+    if host not in config.ATTACHMENT_DOWNLOAD_HOSTS:
+        return LINK
+    ext = os.path.splitext(att.get("name") or "")[1].lower()
+    if ext in config.ATTACHMENT_LINK_EXTENSIONS:
+        return LINK
+    size = att.get("size") or 0
+    if size > config.ATTACHMENT_MAX_DOWNLOAD_MB * _MB:
+        return LINK
+    if size > config.ATTACHMENT_DEFER_MB * _MB:
+        return DEFER
+    if not analyzable(att):
+        return DOWNLOAD
+    return ANALYZE
+
+
+def decide(att: dict) -> str:
+    """
+    決定單一附件的處理方式 (依序判斷，第一個符合者為準)
+
+    1. 未啟用下載、無下載網址、來源不在 ATTACHMENT_DOWNLOAD_HOSTS、副檔名在 ATTACHMENT_LINK_EXTENSIONS
+       或大於 ATTACHMENT_MAX_DOWNLOAD_MB → LINK
+    2. 大於 ATTACHMENT_DEFER_MB → DEFER (下載後是否分析依 analyzable() 判斷)
+    3. 副檔名不在 ATTACHMENT_ANALYZE_EXTENSIONS → DOWNLOAD
+    4. 其餘 → ANALYZE
+
+    Asana 未提供 size 時 (例如舊附件) 不做大小判斷。
+
+    Returns:
+        str: ANALYZE / DOWNLOAD / LINK / DEFER
+    """
+    action = _decide(att)
+    size = att.get("size") or 0
+    with _stats_lock:
+        policy_stats[action] += 1
+        if action == LINK:
+            policy_stats["bytes_avoided"] += size
+        elif action == DEFER:
+            policy_stats["bytes_deferred"] += size
+    return action
+
+
+def should_analyze(att: dict) -> bool:
+    """附件是否屬於需分析的類型 (不計入統計；供判斷已存附件是否缺少分析結果)"""
+    return _decide(att) == ANALYZE
+
+
+def reset_stats():
+    with _stats_lock:
+        policy_stats.update(dict.fromkeys(policy_stats, 0))
+
+
+def format_stats() -> str:
+    """統計摘要 (供擷取結束時顯示)"""
+    s = policy_stats
+    return (
+        f"分析 {s[ANALYZE]}、僅下載 {s[DOWNLOAD]}、僅連結 {s[LINK]}、延後 {s[DEFER]}；"
+        f"省下下載 {s['bytes_avoided'] / _MB:.1f} MB，延後 {s['bytes_deferred'] / _MB:.1f} MB"
+    )
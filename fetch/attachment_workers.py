@@ -0,0 +1,362 @@
+# 檔案用途：附件下載與圖片分析的兩段式 worker：下載池與分析池以佇列串接，下載完成的位元組直接在記憶體交給分析。
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+
+from core import config, utils
+from core.models import AttachmentData
+from services import doc_extract, llm_processor, local_ocr
+
+# 附件分析狀態 (AttachmentData.analysis_state)
+OK = "ok"  # 已有分析結果
+EMPTY = "empty"  # 分析成功但沒有內容 (不重試)
+FAILED = "failed"  # 分析失敗 (重新擷取時重試，最多 ATTACHMENT_ANALYSIS_MAX_ATTEMPTS 次)
+
+
+class AttachmentWorkers:
+    """
+    附件處理的兩組 worker
+
+    * 下載池 (ATTACHMENT_DOWNLOAD_WORKERS)：寫入本地檔案，並依主機限制同時下載數 (ATTACHMENT_DOWNLOADS_PER_HOST)
+    * 分析池 (ATTACHMENT_ANALYSIS_WORKERS)：下載完成即排入，直接以記憶體中的位元組呼叫圖片分析
+    * submit() 立即回傳 Future[AttachmentData]，呼叫端可在等待期間繼續呼叫其他 API
+    * 傳入 group() 建立的 VisionGroup 時，同一任務的圖片累積後以多圖請求分析 (ENABLE_VISION_BATCH)
+    * ENABLE_LOCAL_OCR 時先在分析池做本機 OCR，文字清楚的截圖改以文字分析，其餘才送 vision
+    * PDF / XLSX / DOCX / 純文字附件交給文件擷取池 (DOC_EXTRACT_WORKERS) 在本機解析，不送 vision
+    * 大型附件以 defer() 排入低優先背景佇列 (ATTACHMENT_DEFER_WORKERS)，結果於 drain_deferred() 一次取回
+    """
+
+    def __init__(self, download_workers=None, analysis_workers=None, per_host=None):
+        self._downloads = ThreadPoolExecutor(
+            max_workers=download_workers or config.ATTACHMENT_DOWNLOAD_WORKERS,
+            thread_name_prefix="att-download",
+        )
+        self._analyses = ThreadPoolExecutor(
+            max_workers=analysis_workers or config.ATTACHMENT_ANALYSIS_WORKERS,
+            thread_name_prefix="att-analysis",
+        )
+        self._extracts = ThreadPoolExecutor(
+            max_workers=config.DOC_EXTRACT_WORKERS, thread_name_prefix="att-extract"
+        )
+        self._deferred = ThreadPoolExecutor(
+            max_workers=config.ATTACHMENT_DEFER_WORKERS, thread_name_prefix="att-deferred"
+        )
+        self._pending_deferred = []  # [(任務 GID, 附件 GID, 父物件 GID, Future)]
+        self._per_host = per_host or config.ATTACHMENT_DOWNLOADS_PER_HOST
+        self._host_slots = {}
+        self._lock = threading.Lock()
+        # 每個下載執行緒各自一個 Session，重用 TCP/TLS 連線
+        self._local = threading.local()
+
+    def _host_slot(self, url):
+        host = urlparse(url or "").hostname or ""
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self._per_host)
+            return self._host_slots[host]
+
+    def _session(self):
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def group(self):
+        """建立一個任務的多圖分析群組；未啟用 ENABLE_VISION_BATCH 時回傳 None (逐張分析)"""
+        return VisionGroup(self) if config.ENABLE_VISION_BATCH else None
+
+    def submit(self, att: dict, parent_gid, save_dir, group=None, analyze=True) -> Future:
+        """
+        排入一個附件：下載 → (成功且啟用下載時) 圖片分析
+
+        Args:
+            att (dict): Asana 附件物件
+            parent_gid (str): 父任務 GID (用於檔名)
+            save_dir (str): 存檔目錄
+            group (VisionGroup): 多圖分析群組，None 表示逐張分析
+            analyze (bool): False 時只下載保存，不分析
+
+        Returns:
+            Future: 完成時結果為 AttachmentData (失敗時 local_path / ocr_text 為 None，不會拋出例外)
+        """
+        result = Future()
+        if group is not None:
+            group.expect()
+        self._downloads.submit(self._download, att, parent_gid, save_dir, result, group, analyze)
+        return result
+
+    def defer(self, att: dict, parent_gid, save_dir, task_gid, analyze=True):
+        """
+        將附件排入低優先背景佇列 (下載 → 分析)，不阻塞任務擷取；analyze 為 False 時只下載保存
+
+        任務紀錄先以僅連結的 AttachmentData 寫入，擷取結束時以 drain_deferred() 取回結果回填。
+        """
+        result = Future()
+        self._deferred.submit(self._download, att, parent_gid, save_dir, result, None, analyze)
+        with self._lock:
+            self._pending_deferred.append((str(task_gid), str(att["gid"]), str(parent_gid), result))
+
+    def pending_deferred(self):
+        """尚未取回的延後附件 [(任務 GID, 附件 GID, 父物件 GID)] (供呼叫端持久化，中斷後可重試)"""
+        with self._lock:
+            return [item[:3] for item in self._pending_deferred]
+
+    def drain_deferred(self):
+        """
+        等待背景佇列中所有延後的附件完成
+
+        Returns:
+            dict: {任務 GID: [AttachmentData]}
+        """
+        with self._lock:
+            pending, self._pending_deferred = self._pending_deferred, []
+        done = {}
+        for task_gid, _, _, future in pending:
+            try:
+                done.setdefault(task_gid, []).append(future.result())
+            except Exception as e:
+                # 未回填的附件留在待辦清單，下次執行重試
+                print(f"⚠️ 延後附件處理失敗 (任務 {task_gid}): {e}")
+        return done
+
+    def _download(self, att, parent_gid, save_dir, result, group=None, analyze=True):
+        local_path = None
+        handed = False  # 是否已交給群組 (群組的 outstanding 已扣除)
+        try:
+            try:
+                with self._host_slot(att.get("download_url")):
+                    _, local_path, content = utils.download_attachment(
+                        att, parent_gid, save_dir, session=self._session()
+                    )
+            except Exception as e:
+                print(f"⚠️ 附件下載失敗 [{att.get('name')}]: {e}")
+                local_path, content = None, None
+
+            kind = doc_extract.detect_kind(att.get("name"), content) if content else None
+            if not (content and config.DOWNLOAD_ATTACHMENTS and analyze):
+                _settle(result, att, local_path)
+                if group is not None:
+                    handed = True
+                    group.add(None)
+            elif kind:
+                # 文件類附件：本機擷取文字，不送圖片分析
+                self._extracts.submit(self._extract, kind, att, local_path, content, result)
+                if group is not None:
+                    handed = True
+                    group.add(None)
+            elif config.ENABLE_LOCAL_OCR and local_ocr.available():
+                # 先做本機 OCR 再決定路徑 (OCR 在行程池執行，分析池執行緒僅等待結果)
+                self._analyses.submit(self._route, att, local_path, content, result, group)
+                handed = True
+            else:
+                handed = True
+                self._to_vision(att, local_path, content, result, group, inline=False)
+        except Exception as e:
+            print(f"⚠️ 附件處理失敗 [{att.get('name')}]: {e}")
+            _settle(result, att, local_path, state=FAILED if analyze else None)
+            if group is not None and not handed:
+                group.add(None)
+
+    def _to_vision(self, att, local_path, content, result, group, inline=True):
+        if group is not None:
+            # 多圖模式：交給群組累積，湊滿一包 (或群組結束) 才送出
+            group.add((att, local_path, content, result))
+        elif inline:
+            self._analyze(att, local_path, content, result)
+        else:
+            # 下載完成，交給分析池 (下載執行緒立即接手下一個附件)
+            self._analyses.submit(self._analyze, att, local_path, content, result)
+
+    def _route(self, att, local_path, content, result, group):
+        handed = False
+        try:
+            ocr = local_ocr.ocr_bytes(content)
+            if local_ocr.route(ocr) != "text":
+                handed = True
+                self._to_vision(att, local_path, content, result, group)
+                return
+            analysis = None
+            try:
+                analysis = llm_processor.analyze_ocr_text(ocr["text"])
+            except Exception as e:
+                print(f"⚠️ OCR 文字分析失敗 [{att.get('name')}]: {e}")
+            if analysis is None:
+                # 文字分析失敗，退回 vision
+                handed = True
+                self._to_vision(att, local_path, content, result, group)
+                return
+            _settle(result, att, local_path, analysis)
+            if group is not None:
+                handed = True
+                group.add(None)
+        except Exception as e:
+            print(f"⚠️ 附件分析失敗 [{att.get('name')}]: {e}")
+            _settle(result, att, local_path, state=FAILED)
+            if group is not None and not handed:
+                group.add(None)
+
+    def _extract(self, kind, att, local_path, content, result):
+        # 無文字 (掃描檔、解析器未安裝) 記為 empty 不再重試；解析例外記為 failed
+        text, state = None, EMPTY
+        try:
+            text = doc_extract.extract_text(kind, local_path, content)
+        except Exception as e:
+            print(f"⚠️ 文件擷取失敗 [{att.get('name')}]: {e}")
+            state = FAILED
+        _settle(result, att, local_path, text, state)
+
+    def _analyze(self, att, local_path, content, result):
+        # 模型回傳空字串記為 empty；呼叫失敗 (回傳 None 或例外) 記為 failed
+        analysis = None
+        try:
+            analysis = llm_processor.analyze_image_bytes(content)
+        except Exception as e:
+            print(f"⚠️ 圖片分析失敗 [{att.get('name')}]: {e}")
+        _settle(result, att, local_path, analysis, FAILED if analysis is None else EMPTY)
+
+    def _analyze_pack(self, pack):
+        """多圖請求；整包失敗或模型漏回的圖片退回單張分析"""
+        try:
+            if len(pack) == 1:
+                self._analyze(*pack[0])
+                return
+            analyses = None
+            try:
+                analyses = llm_processor.analyze_images_bytes(
+                    [(str(att["gid"]), content) for att, _, content, _ in pack]
+                )
+            except Exception as e:
+                print(f"⚠️ 多圖分析失敗，改為逐張分析: {e}")
+            analyses = analyses or {}
+            for att, local_path, content, result in pack:
+                analysis = analyses.get(str(att["gid"]))
+                if analysis is None:
+                    self._analyze(att, local_path, content, result)
+                else:
+                    _settle(result, att, local_path, analysis)
+        finally:
+            for att, local_path, _, result in pack:
+                _settle(result, att, local_path, state=FAILED)
+
+
+class VisionGroup:
+    """
+    單一任務的多圖分析群組
+
+    * 下載完成的圖片累積於群組，達到 VISION_BATCH_MAX_IMAGES 張或 VISION_BATCH_TOKEN_BUDGET 時送出一包
+    * 呼叫端排入所有附件後呼叫 close()；所有下載結束後，剩餘的圖片送出最後一包
+    """
+
+    def __init__(self, workers: AttachmentWorkers):
+        self._workers = workers
+        self._lock = threading.Lock()
+        self._ready = []  # [(tokens, item)]
+        self._outstanding = 0
+        self._closed = False
+
+    def expect(self):
+        with self._lock:
+            self._outstanding += 1
+
+    def add(self, item):
+        """下載結束 (item 為 None 表示無需分析)"""
+        with self._lock:
+            self._outstanding -= 1
+            if item is not None:
+                self._ready.append((llm_processor.estimate_image_tokens(item[2]), item))
+            packs = self._take_packs()
+        self._dispatch(packs)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            packs = self._take_packs()
+        self._dispatch(packs)
+
+    def _take_packs(self):
+        # 所有附件都已排入且下載完畢時，剩餘不足一包的圖片也一併送出
+        final = self._closed and self._outstanding == 0
+        packs, pack, tokens = [], [], 0
+        for item_tokens, item in self._ready:
+            if pack and (
+                len(pack) >= config.VISION_BATCH_MAX_IMAGES
+                or tokens + item_tokens > config.VISION_BATCH_TOKEN_BUDGET
+            ):
+                packs.append(pack)
+                pack, tokens = [], 0
+            pack.append(item)
+            tokens += item_tokens
+        # 最後一包：已達上限或群組已結束才送出，否則留待後續圖片
+        if pack and (final or len(pack) >= config.VISION_BATCH_MAX_IMAGES):
+            packs.append(pack)
+            pack = []
+        sent = sum(len(p) for p in packs)
+        self._ready = self._ready[sent:]
+        return packs
+
+    def _dispatch(self, packs):
+        for pack in packs:
+            try:
+                self._workers._analyses.submit(self._workers._analyze_pack, pack)
+            except Exception as e:
+                print(f"⚠️ 多圖分析排程失敗: {e}")
+                for att, local_path, _, result in pack:
+                    _settle(result, att, local_path, state=FAILED)
+
+
+def link_only(att) -> AttachmentData:
+    """不下載的附件 (只保留 Asana 連結)"""
+    return _attachment_data(att, None, None)
+
+
+def _settle(result: Future, att, local_path=None, analysis=None, state=None):
+    """
+    設定 Future 結果 (已設定過則略過)；任何失敗路徑都會呼叫，確保 resolve() 不會永遠等待
+
+    無分析結果時為僅連結 / 僅下載的 AttachmentData (state 為 EMPTY / FAILED 時記錄分析狀態)；
+    連資料都無法封裝時改為 set_exception
+    """
+    if result.done():
+        return
+    try:
+        result.set_result(_attachment_data(att, local_path, analysis, state))
+    except Exception as e:
+        if not result.done():
+            result.set_exception(e)
+
+
+def _attachment_data(att, local_path, analysis, state=None):
+    # 封裝資料為 AttachmentData 物件，讓後續的流程能用 .ocr_text 拿到 AI 的分析結果
+    if analysis:
+        state = OK
+    # 重試時 att 帶有先前的嘗試次數 (見 asana_api._process_attachments_with_llm)
+    attempts = att.get("analysis_attempts") or 0
+    return AttachmentData(
+        gid=att["gid"],
+        name=att["name"],
+        download_url=att.get("download_url"),
+        local_path=local_path,
+        ocr_text=analysis,  # 這裡存的是 LLM 的分析結果
+        analysis_state=state,
+        analysis_attempts=attempts + 1 if state else attempts,
+    )
+
+
+_workers = None
+_workers_lock = threading.Lock()
+
+
+def get_workers() -> AttachmentWorkers:
+    """取得共用的附件 worker (同一次執行中所有任務共用同一組執行緒與主機限制)"""
+    global _workers
+    with _workers_lock:
+        if _workers is None:
+            _workers = AttachmentWorkers()
+        return _workers
+
+
+def resolve(items):
+    """將 submit() 回傳的 Future 與已沿用的 AttachmentData 混合列表，等待並轉為 AttachmentData 列表"""
+    return [item.result() if isinstance(item, Future) else item for item in items]
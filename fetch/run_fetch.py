@@ -1,31 +1,378 @@
 import os
 import sys
-import json
 import datetime
-import dataclasses
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from asana import Configuration, ApiClient
 from asana.api.projects_api import ProjectsApi
 from asana.api.tasks_api import TasksApi
 from asana.api.stories_api import StoriesApi
 from asana.api.attachments_api import AttachmentsApi
 from asana.api.sections_api import SectionsApi
+from asana.rest import ApiException
 
 from core import config, utils
 from core.models import AsanaApis
-from fetch import asana_api, sync_manager
+from core.raw_store import get_raw_store
+from fetch import asana_api, attachment_policy, attachment_workers, sync_manager
+from fetch.run_journal import DeferredAttachments, RunJournal
+from services import local_ocr
 
 
-# JSON 編碼器：處理 dataclass (AttachmentData) 轉 dict
-class EnhancedJSONEncoder(json.JSONEncoder):
-    def default(self, o):
-        if dataclasses.is_dataclass(o):
-            return dataclasses.asdict(o)
-        return super().default(o)
+# 第一階段：精簡掃描欄位 (只需判斷是否異動與完成；區段由列舉來源得知)
+TASK_SCAN_FIELDS = "gid,modified_at,completed"
+# 第二階段：僅對篩選後的任務抓取詳情
+TASK_DETAIL_FIELDS = "gid,name,created_at,modified_at,completed,due_on,notes,memberships.project.gid,memberships.section.gid,custom_fields.name,custom_fields.display_value"
+# 每頁筆數 (Asana 上限 100)
+TASK_PAGE_SIZE = 100
 
+# 掃描進度 (供進度列顯示)；列舉與抓詳情的執行緒會同時累加，以鎖保護
+_scan_stats = {"scanned": 0, "unchanged": 0, "resumed": 0, "failed": 0}
+_scan_lock = threading.Lock()
 
-def run_fetch():
+
+def _count_scan(key):
+    with _scan_lock:
+        _scan_stats[key] += 1
+
+
+def _parse_sync_threshold(last_sync):
+    """
+    將上次同步時間轉為比對門檻 (回推 5 分鐘緩衝)
+
+    Returns:
+        str: ISO 時間字串；格式無法解析時回傳 None (視為全量)
+    """
+    try:
+        # 嘗試格式 1 (含微秒): 2025-12-16T10:00:00.123456Z
+        last_sync_dt = datetime.datetime.strptime(last_sync, "%Y-%m-%dT%H:%M:%S.%fZ")
+    except ValueError:
+        try:
+            # 嘗試格式 2 (無微秒): 2025-12-16T10:00:00Z
+            last_sync_dt = datetime.datetime.strptime(last_sync, "%Y-%m-%dT%H:%M:%SZ")
+        except ValueError:
+            # 如果都失敗，直接當作沒同步過
+            print("⚠️ 時間格式解析失敗，重置同步時間。")
+            return None
+
+    # 設定時區並回推 5 分鐘緩衝
+    threshold_dt = last_sync_dt.replace(tzinfo=datetime.timezone.utc) - datetime.timedelta(
+        minutes=5
+    )
+    return threshold_dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _iter_section_tasks(apis, section_gids, workers=None):
+    """
+    並行列舉多個區段的任務並合併為單一串流 (只列舉未被排除的區段)
+
+    * 每個區段一個生產者，逐頁讀取 get_tasks_for_section 後放入有界佇列
+    * 消費端停止讀取時 (例如中途取消)，生產者會隨之結束
+
+    Args:
+        apis (AsanaApis): API 集合
+        section_gids (List[str]): 要列舉的區段 GID
+        workers (int): 同時列舉的區段數
+
+    Yields:
+        tuple: (任務 dict, 區段 GID)
+    """
+    workers = workers or config.FETCH_SECTION_WORKERS
+    results = queue.Queue(maxsize=TASK_PAGE_SIZE * 2)
+    stop = threading.Event()
+    done_marker = object()
+
+    def _put(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(sec_gid):
+        try:
+            tasks_res = apis.tasks.get_tasks_for_section(
+                sec_gid,
+                opts={"limit": TASK_PAGE_SIZE, "opt_fields": TASK_SCAN_FIELDS},
+            )
+            for t in tasks_res:
+                if not _put((utils.ensure_dict(t), sec_gid)):
+                    return
+        except Exception as e:
+            # 列舉不完整：本次執行不可推進同步時間戳記
+            _count_scan("failed")
+            print(f"\n⚠️ 列舉區段失敗 {sec_gid}: {e}")
+        finally:
+            _put(done_marker)
+
+    with _scan_lock:
+        _scan_stats.update(dict.fromkeys(_scan_stats, 0))
+    executor = ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        for sec_gid in section_gids:
+            executor.submit(_produce, sec_gid)
+        remaining = len(section_gids)
+        while remaining:
+            item = results.get()
+            if item is done_marker:
+                remaining -= 1
+                continue
+            _count_scan("scanned")
+            yield item
+    finally:
+        stop.set()
+        executor.shutdown(wait=True)
+
+
+def _select_tasks(tasks, threshold, raw_store, known=None, done=None):
+    """
+    串流篩選：只放行已完成且 (增量模式下) 異動時間晚於門檻的任務。
+    增量模式下，變回未完成的任務會同時從原始資料中刪除；
+    modified_at 與已存紀錄相同的任務直接沿用，不再呼叫任何 API 或 LLM；
+    續傳時，執行日誌中已完成的任務也直接略過。
+
+    Args:
+        tasks (Iterable[tuple]): (任務, 區段 GID) 串流
+        threshold (str): 增量門檻 (ISO 字串)，None 表示全量
+        raw_store: 原始資料儲存後端 (用於清理)
+        known (dict): 已存紀錄的 {gid: modified_at}，None 表示不比對 (強制重抓)
+        done (set): 執行日誌中已完成的 GID (續傳用)
+
+    Yields:
+        tuple: 需要擷取的 (任務, 區段 GID)
+    """
+    for t, sec_gid in tasks:
+        if threshold and t["modified_at"] <= threshold:
+            continue
+
+        if not t.get("completed"):
+            # --- 清理邏輯：處理變回未完成的任務 ---
+            if threshold:
+                try:
+                    if raw_store.delete(t["gid"]):
+                        print(f"\n🗑️ 任務已變回未完成，刪除舊資料: {t['gid']}")
+                except:
+                    pass
+            continue
+
+        if done and t["gid"] in done:
+            _count_scan("resumed")
+            continue
+
+        if known is not None and known.get(t["gid"]) == t["modified_at"]:
+            _count_scan("unchanged")
+            continue
+
+        yield t, sec_gid
+
+
+def _iter_task_details(apis, tasks, workers=None):
+    """
+    並行抓取篩選後任務的完整詳情 (保持原順序)；同時進行中的請求數有上限，
+    上游串流只會被預先讀取 workers * 2 筆。
+
+    Args:
+        apis (AsanaApis): API 集合
+        tasks (Iterable[tuple]): 篩選出的 (任務, 區段 GID)
+        workers (int): 並行數
+
+    Yields:
+        tuple: (任務詳情, 區段 GID)；抓取失敗者略過並印出警告
+    """
+    workers = workers or config.FETCH_DETAIL_WORKERS
+
+    def _fetch(t):
+        return utils.ensure_dict(
+            apis.tasks.get_task(t["gid"], opts={"opt_fields": TASK_DETAIL_FIELDS})
+        )
+
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for t, sec_gid in tasks:
+            pending.append((t, sec_gid, executor.submit(_fetch, t)))
+            while len(pending) >= workers * 2:
+                item = _take_detail(*pending.popleft())
+                if item:
+                    yield item
+        while pending:
+            item = _take_detail(*pending.popleft())
+            if item:
+                yield item
+
+
+def _take_detail(task, sec_gid, future):
+    try:
+        return future.result(), sec_gid
+    except Exception as e:
+        _count_scan("failed")
+        print(f"\n⚠️ 抓取任務詳情失敗 {task['gid']}: {e}")
+        return None
+
+
+def _resolve_expiry(apis, t):
+    """
+    效期欄位 (EXPIRY_FIELD_NAME)：已有值直接使用；空值時以建立日 + 1 年寫回 Asana，
+    結果存入 t["calculated_expiry_date"]
+    """
+    # 效期檢查與回寫機制 (SSOT)
+    target_expiry_gid = None
+    current_expiry_val = None
+
+    # 1. 動態查找：在該任務的 custom_fields 中尋找目標欄位
+    if t.get("custom_fields"):
+        for cf in t["custom_fields"]:
+            # 比對名稱 (從 config 讀取，例如 "知識截止日")
+            if cf["name"] == config.EXPIRY_FIELD_NAME:
+                target_expiry_gid = cf["gid"]
+                # 取得目前的值 (可能是 None, 或者 dict 包含 date)
+                # Asana API 回傳結構通常是 cf['display_value'] (字串) 或 cf['date_value'] (物件)
+                # 這裡我們先看 display_value 是否有值
+                current_expiry_val = cf.get("display_value")
+                break
+
+    # 2. 判斷邏輯
+    final_expiry_date = None
+
+    if target_expiry_gid:
+        if current_expiry_val:
+            # A. 已經有值 -> 直接使用
+            final_expiry_date = current_expiry_val
+        else:
+            # B. 為空值 -> 推算 1 年後 -> 寫回 Asana
+            c_at = t["created_at"][:10]
+            c_date = datetime.datetime.strptime(c_at, "%Y-%m-%d")
+            new_expiry_date = (c_date + datetime.timedelta(days=365)).strftime(
+                "%Y-%m-%d"
+            )
+
+            # 執行寫回
+            utils.update_task_custom_field(
+                apis.tasks, t["gid"], target_expiry_gid, new_expiry_date
+            )
+
+            # 更新記憶體中的資料，確保存入 JSON 的是新日期
+            final_expiry_date = new_expiry_date
+        # 手動更新 t 物件內的 custom_fields 顯示值，以便後續 process_data 讀到最新的
+        for cf in t["custom_fields"]:
+            if cf["gid"] == target_expiry_gid:
+                cf["display_value"] = final_expiry_date
+                break
+
+    # (可選) 將計算出的 final_expiry_date 塞入 t 的一個暫存欄位，方便後續取用
+    t["calculated_expiry_date"] = final_expiry_date
+
+
+def _build_package(apis, t, sec_name, att_dir, existing, curr_time_iso):
+    """抓取任務的留言、附件與子任務，組成原始資料包 (existing 為已存紀錄時只處理新增部分)"""
+    task_attachments, story_attachment_map, stories, subtasks = asana_api.fetch_task_context(
+        t["gid"], apis, att_dir, existing
+    )
+    return {
+        "metadata": t,
+        "section_name": sec_name,
+        "stories": stories,
+        "task_attachments": task_attachments,
+        "story_attachment_map": story_attachment_map,
+        "subtasks": subtasks,
+        "fetched_at": curr_time_iso,
+    }
+
+
+def _build_apis(token):
+    conf = Configuration()
+    conf.access_token = token
+    client = ApiClient(configuration=conf)
+    return AsanaApis(
+        ProjectsApi(client),
+        TasksApi(client),
+        StoriesApi(client),
+        AttachmentsApi(client),
+        SectionsApi(client),
+    )
+
+
+def _requeue_deferred(apis, queue, att_dir):
+    """上次中斷或下載失敗的延後附件：重新取得附件資訊 (下載網址會過期) 後排入背景佇列"""
+    items = queue.items()
+    if not items:
+        return
+    print(f"⏳ 重試上次未完成的延後附件 ({len(items)} 個)")
+    workers = attachment_workers.get_workers()
+    for task_gid, att_gid, parent_gid in items:
+        try:
+            att = utils.ensure_dict(
+                apis.attachments.get_attachment(
+                    att_gid, opts={"opt_fields": attachment_policy.ATTACHMENT_OPT_FIELDS}
+                )
+            )
+        except ApiException as e:
+            if e.status == 404:
+                # 附件已刪除
+                queue.done(task_gid, att_gid)
+            else:
+                print(f"⚠️ 取得附件資訊失敗 {att_gid}: {e}")
+            continue
+        except Exception as e:
+            print(f"⚠️ 取得附件資訊失敗 {att_gid}: {e}")
+            continue
+        workers.defer(att, parent_gid, att_dir, task_gid, analyze=attachment_policy.analyzable(att))
+
+
+def _apply_deferred(raw_store, deferred, queue):
+    """
+    將延後下載完成的附件回填至任務紀錄 (依附件 GID 取代原本僅連結的項目)；
+    下載成功者自待辦清單移除，失敗者保留供下次重試
+
+    Returns:
+        list: 已回填並重新寫入的資料包
+    """
+    patched = []
+    for tid, results in deferred.items():
+        data = raw_store.get(tid)
+        if not data:
+            # 任務已刪除
+            queue.done(tid)
+            continue
+        for a in results:
+            if a.local_path:
+                queue.done(tid, a.gid)
+        by_gid = {str(a.gid): a for a in results}
+        lists = [data.get("task_attachments") or []]
+        lists.extend((data.get("story_attachment_map") or {}).values())
+        lists.extend(sub.get("attachments") or [] for sub in data.get("subtasks") or [])
+        for alist in lists:
+            for i, a in enumerate(alist):
+                if str(a.get("gid")) in by_gid:
+                    alist[i] = by_gid[str(a["gid"])]
+        raw_store.put(data)
+        patched.append(data)
+    return patched
+
+
+def _drain_deferred(raw_store, queue, safe_proj_name, on_task=None):
+    """等待延後附件完成並回填紀錄 (管線模式再交給下一階段更新)；等待前先將待辦清單寫入磁碟"""
+    workers = attachment_workers.get_workers()
+    queue.track(workers.pending_deferred())
+    queue.save()
+    deferred = workers.drain_deferred()
+    if deferred:
+        print(f"\n⏳ 等待延後下載的附件 ({sum(map(len, deferred.values()))} 個)...")
+    for data_package in _apply_deferred(raw_store, deferred, queue):
+        if on_task:
+            on_task(safe_proj_name, data_package)
+    queue.save()
+
+
+def run_fetch(force=False, on_task=None):
     """
     執行第一階段：資料擷取
+    Args:
+        force (bool): True 時不比對已存紀錄，所有符合條件的任務都重新擷取
+        on_task (callable): 每筆任務寫入後呼叫 on_task(safe_proj_name, 資料包)，供管線模式交給下一階段
     Returns:
         str: 處理的專案資料夾名稱 (safe_proj_name)，若取消或失敗回傳 None
     """
@@ -50,20 +397,21 @@ def run_fetch():
     PROJECT_ID = selected["project"]
 
     # API Setup
-    conf = Configuration()
-    conf.access_token = selected["token"]
-    client = ApiClient(configuration=conf)
-    apis = AsanaApis(
-        ProjectsApi(client),
-        TasksApi(client),
-        StoriesApi(client),
-        AttachmentsApi(client),
-        SectionsApi(client),
-    )
+    apis = _build_apis(selected["token"])
     sync_mgr = sync_manager.SyncManager()
 
     print(f"⏳ 連線至 [{selected['name']}]...")
 
+    # 上次執行若中斷 (日誌仍在)，可沿用其設定與開始時間從未完成處續傳
+    journal = RunJournal(PROJECT_ID)
+    resume = journal.load()
+    if resume:
+        header, done = resume
+        print(f"\n⏯️ 發現未完成的擷取 (開始於 {header['curr_time_iso']}，已完成 {len(done)} 筆)")
+        if input("👉 從中斷處續傳? (y/n)：").strip().lower() != "y":
+            journal.discard()
+            resume = None
+
     # 掃描與黑名單設定
     blacklist = set()
 
@@ -77,255 +425,332 @@ def run_fetch():
         # 建立 Section Map
         sections_map = {s["gid"]: utils.clean_filename(s["name"]) for s in all_sections}
         sections_map["uncategorized"] = "未分類"
-        print("\n🚫 選擇排除區段 (Enter 跳過)：")
-        # 過濾掉沒意義的區段名稱，只顯示有效的
-        ui_sections = [
-            s
-            for s in all_sections
-            if s["name"] not in ["Untitled section", "未命名區段"]
-        ]
-
-        for i, s in enumerate(ui_sections, 1):
-            print(f"  {i}. {s['name']}")
-
-        blk_in = input("👉 編號 (如 1,3)：").strip()
-        if blk_in:
-            for p in blk_in.split(","):
-                if p.strip().isdigit():
-                    idx = int(p.strip())
-                    if 1 <= idx <= len(ui_sections):
-                        target_gid = ui_sections[idx - 1]["gid"]
-                        blacklist.add(target_gid)
-                        print(f"   ⛔ 已排除: {ui_sections[idx-1]['name']}")
+        if resume:
+            blacklist = set(resume[0].get("blacklist") or [])
+        else:
+            print("\n🚫 選擇排除區段 (Enter 跳過)：")
+            # 過濾掉沒意義的區段名稱，只顯示有效的
+            ui_sections = [
+                s
+                for s in all_sections
+                if s["name"] not in ["Untitled section", "未命名區段"]
+            ]
+
+            for i, s in enumerate(ui_sections, 1):
+                print(f"  {i}. {s['name']}")
+
+            blk_in = input("👉 編號 (如 1,3)：").strip()
+            if blk_in:
+                for p in blk_in.split(","):
+                    if p.strip().isdigit():
+                        idx = int(p.strip())
+                        if 1 <= idx <= len(ui_sections):
+                            target_gid = ui_sections[idx - 1]["gid"]
+                            blacklist.add(target_gid)
+                            print(f"   ⛔ 已排除: {ui_sections[idx-1]['name']}")
     except Exception as e:
         print(f"❌ API Error: {e}")
         return None
 
     # 執行全量同步或增量同步
-    curr_time_iso = datetime.datetime.now(datetime.timezone.utc).strftime(
-        "%Y-%m-%dT%H:%M:%S.%fZ"
-    )
-    print("\n🔍 掃描全專案 Metadata...")
-    tasks_res = apis.tasks.get_tasks_for_project(
-        PROJECT_ID,
-        opts={
-            "opt_fields": "gid,name,created_at,modified_at,completed,due_on,notes,memberships.project.gid,memberships.section.gid,custom_fields.name,custom_fields.display_value"
-        },
-    )
-    all_tasks_raw = [utils.ensure_dict(t) for t in tasks_res]
     last_sync = sync_mgr.get_last_sync(PROJECT_ID)
 
-    print(f"\n專案: {proj_name} | 總筆數: {len(all_tasks_raw)}")
+    print(f"\n專案: {proj_name}")
     print(f"上次同步: {last_sync or '無'}")
-    mode = input("1. 🚀 增量同步 (只抓異動)\n2. 🛠️ 全量同步\n👉 ").strip()
-    final_tasks = []
-
-    if mode == "1":
-        if not last_sync:
-            print("⚠️ 無上次紀錄，將執行全量同步 (僅已完成)。")
-            final_tasks = [t for t in all_tasks_raw if t.get("completed")]
-        else:
-            try:
-                # 嘗試格式 1 (含微秒): 2025-12-16T10:00:00.123456Z
-                last_sync_dt = datetime.datetime.strptime(
-                    last_sync, "%Y-%m-%dT%H:%M:%S.%fZ"
-                )
-            except ValueError:
-                try:
-                    # 嘗試格式 2 (無微秒): 2025-12-16T10:00:00Z
-                    last_sync_dt = datetime.datetime.strptime(
-                        last_sync, "%Y-%m-%dT%H:%M:%SZ"
-                    )
-                except ValueError:
-                    # 如果都失敗，直接當作沒同步過
-                    print("⚠️ 時間格式解析失敗，重置同步時間。")
-                    last_sync_dt = None
-
-            if last_sync_dt:
-                # 設定時區並回推 5 分鐘緩衝
-                threshold_dt = last_sync_dt.replace(
-                    tzinfo=datetime.timezone.utc
-                ) - datetime.timedelta(minutes=5)
-                threshold = threshold_dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
-                print(f"🔍 比對異動中 ( > {threshold})...")
-
-                # 篩選：時間夠新 AND 已完成
-                final_tasks = [
-                    t
-                    for t in all_tasks_raw
-                    if t["modified_at"] > threshold and t.get("completed")
-                ]
-
-                # --- 清理邏輯：處理變回未完成的任務 ---
-                safe_proj_name = utils.clean_filename(proj_name)
-                json_storage_dir = os.path.join(
-                    config.RAW_DIR, safe_proj_name, "json_tasks"
-                )
-
-                for t in all_tasks_raw:
-                    if t["modified_at"] > threshold and not t.get("completed"):
-                        c_at = t["created_at"][:10].replace("-", "")
-                        fname = f"{c_at}_{t['gid']}.json"
-                        fpath = os.path.join(json_storage_dir, fname)
-                        if os.path.exists(fpath):
-                            try:
-                                os.remove(fpath)
-                                print(f"🗑️ 任務已變回未完成，刪除舊 JSON: {t['name']}")
-                            except:
-                                pass
-            else:
-                final_tasks = [t for t in all_tasks_raw if t.get("completed")]
 
+    if resume:
+        # 續傳：沿用中斷那次的開始時間、模式與門檻，完成後時間戳記推進到原本的開始時間
+        header, done = resume
+        curr_time_iso = header["curr_time_iso"]
+        mode = header["mode"]
+        threshold = header.get("threshold")
+        force = header.get("force", False)
+        print(f"⏯️ 續傳{'增量' if mode == '1' else '全量'}同步，略過已完成的 {len(done)} 筆")
     else:
-        # 全量模式：只抓已完成
-        final_tasks = [t for t in all_tasks_raw if t.get("completed")]
-
-    print(f"✅ 符合條件且已完成的任務: {len(final_tasks)} 筆")
+        done = None
+        curr_time_iso = datetime.datetime.now(datetime.timezone.utc).strftime(
+            "%Y-%m-%dT%H:%M:%S.%fZ"
+        )
+        mode = input("1. 🚀 增量同步 (只抓異動)\n2. 🛠️ 全量同步\n👉 ").strip()
 
-    if not final_tasks:
-        if mode == "1" and input("❓ 更新時間戳記? (y/n): ").lower() == "y":
-            sync_mgr.save_sync_time(PROJECT_ID, curr_time_iso)
-        return None
+        threshold = None
+        if mode == "1":
+            if not last_sync:
+                print("⚠️ 無上次紀錄，將執行全量同步 (僅已完成)。")
+            else:
+                threshold = _parse_sync_threshold(last_sync)
+                if threshold:
+                    print(f"🔍 比對異動中 ( > {threshold})...")
 
     # 資料夾路徑設定
-    # Use config for raw root if possible or just use what config defines
-    # config.RAW_DIR is defined.
     safe_proj_name = utils.clean_filename(proj_name)
     proj_dir = os.path.join(config.RAW_DIR, safe_proj_name)
     att_dir = os.path.join(proj_dir, "attachments")
-    json_dir = os.path.join(proj_dir, "json_tasks")
 
     os.makedirs(att_dir, exist_ok=True)
-    os.makedirs(json_dir, exist_ok=True)
+    raw_store = get_raw_store(safe_proj_name)
 
-    print(f"\n🚀 開始擷取 {len(final_tasks)} 筆任務...")
-    print(f"📂 Raw Data: {proj_dir}")
+    # 已存紀錄的 gid → modified_at，未異動的任務直接沿用
+    known = None if force else raw_store.modified_index()
+    if force:
+        print("⚠️ 強制模式：忽略已存紀錄，全部重新擷取")
 
-    # .迴圈下載
-    for idx, t in enumerate(final_tasks):
-        sys.stdout.write(f"\r   進度 ({idx+1}/{len(final_tasks)}): {t['name'][:15]}...")
-        sys.stdout.flush()
-        sec_gid = next(
-            (
-                m["section"]["gid"]
-                for m in t.get("memberships", [])
-                if m.get("project")
-                and m["project"]["gid"] == PROJECT_ID
-                and m.get("section")
-            ),
-            "uncategorized",
+    if resume:
+        journal.resume()
+    else:
+        journal.start(
+            {
+                "curr_time_iso": curr_time_iso,
+                "mode": mode,
+                "threshold": threshold,
+                "force": force,
+                "blacklist": sorted(blacklist),
+            }
         )
 
-        if sec_gid in blacklist:
-            # 這裡不 print 跳過訊息以免洗版，默默跳過即可
-            continue
+    print("\n🔍 逐頁掃描專案任務，符合條件者立即擷取...")
+    print(f"📂 Raw Data: {proj_dir}")
 
-        sec_name = sections_map.get(sec_gid, "未分類")
+    # 串流管線：各區段並行分頁列舉 (黑名單區段不列舉) → 篩選 (含未完成清理) → 並行抓詳情 → 擷取
+    included_sections = [s["gid"] for s in all_sections if s["gid"] not in blacklist]
+    tasks_stream = _iter_section_tasks(apis, included_sections)
+    selected_stream = _select_tasks(tasks_stream, threshold, raw_store, known, done)
+    detail_stream = _iter_task_details(apis, selected_stream)
+
+    stats = {"fetched": 0, "failed": 0}
+    checkpoint = []
+
+    def _checkpoint():
+        raw_store.commit()
+        # 延後附件的待辦清單先於日誌寫入，中斷後續傳略過的任務仍會重試其附件
+        deferred_queue.track(attachment_workers.get_workers().pending_deferred())
+        deferred_queue.save()
+        journal.mark_done(checkpoint)
+        checkpoint.clear()
+
+    asana_api.reset_stats()
+    local_ocr.ocr_stats.update(dict.fromkeys(local_ocr.ocr_stats, 0))
+    attachment_policy.reset_stats()
+    deferred_queue = DeferredAttachments(PROJECT_ID)
+    try:
+        _requeue_deferred(apis, deferred_queue, att_dir)
+        for t, sec_gid in detail_stream:
+            stats["fetched"] += 1
+            sys.stdout.write(
+                f"\r   擷取 #{stats['fetched']} (已掃描 {_scan_stats['scanned']}): {t['name'][:15]}..."
+            )
+            sys.stdout.flush()
 
-        tid = t["gid"]
+            tid = t["gid"]
 
-        # 效期檢查與回寫機制 (SSOT)
+            _resolve_expiry(apis, t)
 
-        target_expiry_gid = None
-        current_expiry_val = None
+            try:
+                # 差異模式：已有紀錄的任務只處理新留言與新附件 (強制模式則完整重抓)
+                existing = raw_store.get(tid) if known and tid in known else None
+                data_package = _build_package(
+                    apis, t, sections_map.get(sec_gid, "未分類"), att_dir, existing, curr_time_iso
+                )
+                # 存檔 (依 RAW_STORE_BACKEND 寫入 JSON 或封裝分片)
+                raw_store.put(data_package)
+            except Exception as e:
+                stats["failed"] += 1
+                print(f" Error: {e}")
+                continue
+
+            # 每 FETCH_CHECKPOINT_EVERY 筆：先 commit 原始資料，再將這批 GID 寫入日誌
+            checkpoint.append(tid)
+            if len(checkpoint) >= config.FETCH_CHECKPOINT_EVERY:
+                _checkpoint()
+
+            if on_task:
+                on_task(safe_proj_name, data_package)
+
+        # 低優先佇列中延後的大型附件：等待完成後回填紀錄
+        _drain_deferred(raw_store, deferred_queue, safe_proj_name, on_task)
+
+    finally:
+        # 中斷 (含 Ctrl+C) 時也保存已寫入的任務，下次從此處續傳
+        _checkpoint()
+        journal.close()
+        raw_store.close()
+
+    print(
+        f"\n✅ 掃描 {_scan_stats['scanned']} 筆，符合條件且已完成的任務: {stats['fetched']} 筆"
+        f" (未異動沿用 {_scan_stats['unchanged']} 筆"
+        + (f"，續傳略過 {_scan_stats['resumed']} 筆" if resume else "")
+        + ")"
+    )
+    ds = asana_api.delta_stats
+    print(
+        f"📎 附件：新處理 {ds['new_attachments']}，沿用 {ds['reused_attachments']}；新留言 {ds['new_stories']} 則"
+    )
+    if config.ENABLE_LOCAL_OCR:
+        oc = local_ocr.ocr_stats
+        print(f"🔤 本機 OCR 路由：文字分析 {oc['text']}，送 vision {oc['vision']}")
+    print(f"🚦 附件策略：{attachment_policy.format_stats()}")
+
+    failed = stats["failed"] + _scan_stats["failed"]
+    if failed:
+        # 日誌保留：下次執行可續傳，只重試失敗與未完成的任務
+        print(f"⚠️ {failed} 項失敗，同步時間戳記不更新；下次執行可從中斷處續傳並重試")
+        return safe_proj_name if stats["fetched"] else None
+    journal.finish()
+
+    if not stats["fetched"] and not done:
+        if mode == "1" and input("❓ 更新時間戳記? (y/n): ").lower() == "y":
+            sync_mgr.save_sync_time(PROJECT_ID, curr_time_iso)
+        return None
 
-        # 1. 動態查找：在該任務的 custom_fields 中尋找目標欄位
-        if t.get("custom_fields"):
-            for cf in t["custom_fields"]:
-                # 比對名稱 (從 config 讀取，例如 "知識截止日")
-                if cf["name"] == config.EXPIRY_FIELD_NAME:
-                    target_expiry_gid = cf["gid"]
-                    # 取得目前的值 (可能是 None, 或者 dict 包含 date)
-                    # Asana API 回傳結構通常是 cf['display_value'] (字串) 或 cf['date_value'] (物件)
-                    # 這裡我們先看 display_value 是否有值
-                    current_expiry_val = cf.get("display_value")
-                    break
+    if mode == "1":
+        sync_mgr.save_sync_time(PROJECT_ID, curr_time_iso)
+        print(f"\n✅ 增量擷取完成！")
+    else:
+        print(f"\n✅ 全量擷取完成！")
 
-        # 2. 判斷邏輯
-        final_expiry_date = None
+    return safe_proj_name
 
-        if target_expiry_gid:
-            if current_expiry_val:
-                # A. 已經有值 -> 直接使用
-                final_expiry_date = current_expiry_val
-            else:
-                # B. 為空值 -> 推算 1 年後 -> 寫回 Asana
-                c_at = t["created_at"][:10]
-                c_date = datetime.datetime.strptime(c_at, "%Y-%m-%d")
-                new_expiry_date = (c_date + datetime.timedelta(days=365)).strftime(
-                    "%Y-%m-%d"
-                )
 
-                # 執行寫回
-                utils.update_task_custom_field(
-                    apis.tasks, tid, target_expiry_gid, new_expiry_date
-                )
+def _project_section(t, project_id):
+    """任務在指定專案中的區段 GID；已不在該專案時回傳 None"""
+    for m in t.get("memberships") or []:
+        if (m.get("project") or {}).get("gid") == project_id:
+            return (m.get("section") or {}).get("gid") or "uncategorized"
+    return None
 
-                # 更新記憶體中的資料，確保存入 JSON 的是新日期
-                final_expiry_date = new_expiry_date
-            # 手動更新 t 物件內的 custom_fields 顯示值，以便後續 process_data 讀到最新的
-            for cf in t["custom_fields"]:
-                if cf["gid"] == target_expiry_gid:
-                    cf["display_value"] = final_expiry_date
-                    break
 
-        # (可選) 將計算出的 final_expiry_date 塞入 t 的一個暫存欄位，方便後續取用
-        t["calculated_expiry_date"] = final_expiry_date
+def fetch_tasks(profile, gids, deleted=(), on_task=None):
+    """
+    依 GID 擷取指定任務 (Webhook 常駐模式使用)：不掃描整個專案、不互動、不推進同步時間戳記
 
-        try:
-            task_attachments, story_attachment_map, stories, subtasks = (
-                asana_api.fetch_task_context(tid, apis, att_dir)
-            )
+    * 任務只有在 API 確認已不存在 (get_task 回應 404) 時才從原始資料刪除；deleted 事件只是提示，
+      任務仍存在時照一般規則重新擷取 (事件來源無法完全信任，不可單憑事件刪除知識庫文件)
+    * 子任務的事件改為重新擷取所屬的主任務
+    * 未完成、已移出專案或位於 WEBHOOK_EXCLUDED_SECTIONS 的任務從原始資料刪除 (與增量同步的清理規則相同)
+    * modified_at 與已存紀錄相同的任務略過
 
-            # Re-calculate section (redundant but safe)
-            sec_gid = next(
-                (
-                    m["section"]["gid"]
-                    for m in t.get("memberships", [])
-                    if m.get("project")
-                    and m["project"]["gid"] == PROJECT_ID
-                    and m.get("section")
-                ),
-                "uncategorized",
-            )
-            sec_name = sections_map.get(sec_gid, "未分類")
-
-            data_package = {
-                "metadata": t,
-                "section_name": sec_name,
-                "stories": stories,
-                "task_attachments": task_attachments,
-                "story_attachment_map": story_attachment_map,
-                "subtasks": subtasks,
-                "fetched_at": curr_time_iso,
-            }
-            # 存檔(.json)
-            c_at = t["created_at"][:10].replace("-", "")
-            fname = f"{c_at}_{tid}.json"
-            with open(os.path.join(json_dir, fname), "w", encoding="utf-8") as f:
-                json.dump(
-                    data_package,
-                    f,
-                    cls=EnhancedJSONEncoder,
-                    ensure_ascii=False,
-                    indent=2,
-                )
-        except Exception as e:
-            print(f" Error: {e}")
-            continue
+    Args:
+        profile (dict): Asana Profile (name / token / project)
+        gids (Iterable[str]): 要重新擷取的任務 GID
+        deleted (Iterable[str]): 事件標示為已刪除的任務 GID (仍以 API 確認)
+        on_task (callable): 每筆任務寫入後呼叫 on_task(safe_proj_name, 資料包)
 
-    if mode == "1":
-        sync_mgr.save_sync_time(PROJECT_ID, curr_time_iso)
-        print(f"\n✅ 增量擷取完成！")
-    else:
-        print(f"\n✅ 全量擷取完成！")
+    Returns:
+        tuple: (safe_proj_name, 失敗的 GID 列表, 應自知識庫移除的 GID 列表)；
+               無法取得專案資訊時 safe_proj_name 為 None
+    """
+    project_id = profile["project"]
+    pending = {str(g) for g in gids} | {str(g) for g in deleted}
+    apis = _build_apis(profile["token"])
+    try:
+        proj_name = utils.ensure_dict(apis.projects.get_project(project_id, opts={}))["name"]
+        sections_map = {
+            s["gid"]: utils.clean_filename(s["name"])
+            for s in map(utils.ensure_dict, apis.sections.get_sections_for_project(project_id, opts={}))
+        }
+        sections_map["uncategorized"] = "未分類"
+    except Exception as e:
+        print(f"❌ API Error: {e}")
+        return None, sorted(pending), []
 
-    return safe_proj_name
+    safe_proj_name = utils.clean_filename(proj_name)
+    att_dir = os.path.join(config.RAW_DIR, safe_proj_name, "attachments")
+    os.makedirs(att_dir, exist_ok=True)
+    raw_store = get_raw_store(safe_proj_name)
+    known = raw_store.modified_index()
+    curr_time_iso = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    stats = {"fetched": 0, "removed": 0, "unchanged": 0}
+    failed = []
+    # 確認已刪除或不再符合同步條件的任務 (不論原始資料是否存在，下游產出都要移除)
+    removed = []
+    deferred_queue = DeferredAttachments(project_id)
+
+    def _get(gid):
+        return utils.ensure_dict(
+            apis.tasks.get_task(gid, opts={"opt_fields": TASK_DETAIL_FIELDS + ",parent.gid"})
+        )
+
+    try:
+        _requeue_deferred(apis, deferred_queue, att_dir)
+
+        # 1. 並行抓取詳情；子任務改抓主任務 (可能多層)
+        details, seen = {}, set(pending)
+        with ThreadPoolExecutor(max_workers=config.FETCH_DETAIL_WORKERS) as executor:
+            while pending:
+                futures = {gid: executor.submit(_get, gid) for gid in pending}
+                pending = set()
+                for gid, future in futures.items():
+                    try:
+                        t = future.result()
+                    except ApiException as e:
+                        if e.status == 404:
+                            # API 確認任務已刪除
+                            removed.append(gid)
+                            if raw_store.delete(gid):
+                                stats["removed"] += 1
+                        else:
+                            failed.append(gid)
+                            print(f"⚠️ 抓取任務詳情失敗 {gid}: {e}")
+                        continue
+                    except Exception as e:
+                        failed.append(gid)
+                        print(f"⚠️ 抓取任務詳情失敗 {gid}: {e}")
+                        continue
+                    parent_gid = (t.pop("parent", None) or {}).get("gid")
+                    if parent_gid:
+                        if parent_gid not in seen:
+                            seen.add(parent_gid)
+                            pending.add(parent_gid)
+                        continue
+                    details[gid] = t
+
+        # 2. 篩選與擷取
+        for tid, t in details.items():
+            sec_gid = _project_section(t, project_id)
+            if (
+                sec_gid is None
+                or not t.get("completed")
+                or sec_gid in config.WEBHOOK_EXCLUDED_SECTIONS
+            ):
+                removed.append(tid)
+                if raw_store.delete(tid):
+                    stats["removed"] += 1
+                continue
+            if known.get(tid) == t["modified_at"]:
+                stats["unchanged"] += 1
+                continue
+            try:
+                _resolve_expiry(apis, t)
+                existing = raw_store.get(tid) if tid in known else None
+                data_package = _build_package(
+                    apis, t, sections_map.get(sec_gid, "未分類"), att_dir, existing, curr_time_iso
+                )
+                raw_store.put(data_package)
+            except Exception as e:
+                failed.append(tid)
+                print(f"⚠️ 擷取任務失敗 {tid}: {e}")
+                continue
+            stats["fetched"] += 1
+            if on_task:
+                on_task(safe_proj_name, data_package)
+
+        _drain_deferred(raw_store, deferred_queue, safe_proj_name, on_task)
+    finally:
+        deferred_queue.track(attachment_workers.get_workers().pending_deferred())
+        deferred_queue.save()
+        raw_store.close()
+
+    print(
+        f"📥 擷取 {stats['fetched']} 筆，刪除 {stats['removed']} 筆，未異動 {stats['unchanged']} 筆"
+        + (f"，失敗 {len(failed)} 筆" if failed else "")
+    )
+    return safe_proj_name, failed, removed
 
 
 if __name__ == "__main__":
     # 允許獨立執行
-    proj = run_fetch()
+    # python -m fetch.run_fetch --force：忽略已存紀錄，全部重新擷取
+    proj = run_fetch(force="--force" in sys.argv[1:])
     if proj:
         # 這裡可以選擇是否自動接續，或僅單獨執行
         print("獨立執行完成。")
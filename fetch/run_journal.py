@@ -0,0 +1,137 @@
+# 檔案用途：擷取執行日誌 (Run Journal)，逐批記錄已完成的任務，讓中斷的 run_fetch 可從未完成處續傳。
+
+import os
+from typing import Iterable, Optional, Set, Tuple
+
+from core import config, serializer
+
+
+class RunJournal:
+    """
+    單一專案的擷取日誌：fetch_journal/<專案 GID>.jsonl
+
+    * 第一行為 start 紀錄：本次執行的 curr_time_iso、同步模式、門檻、排除區段等
+    * 之後每行為一批已完成 (且已寫入原始資料) 的任務 GID，寫入後立即 fsync
+    * 執行完整結束後刪除；檔案仍存在即代表上次執行未完成，同步時間戳記尚未推進
+    """
+
+    def __init__(self, project_id):
+        os.makedirs(config.FETCH_JOURNAL_DIR, exist_ok=True)
+        self.path = os.path.join(config.FETCH_JOURNAL_DIR, f"{project_id}.jsonl")
+        self._fh = None
+
+    def load(self) -> Optional[Tuple[dict, Set[str]]]:
+        """
+        讀取未完成的日誌
+
+        Returns:
+            (start 紀錄, 已完成 GID 集合)；無日誌時回傳 None
+        """
+        if not os.path.exists(self.path):
+            return None
+        header, done = None, set()
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    entry = serializer.loads(line)
+                except ValueError:
+                    # 寫到一半中斷的最後一行，視為未完成
+                    continue
+                if entry.get("type") == "start":
+                    header = entry
+                elif entry.get("type") == "done":
+                    done.update(entry.get("gids") or [])
+        if header is None:
+            return None
+        return header, done
+
+    def _append(self, entry: dict):
+        if self._fh is None:
+            self._fh = open(self.path, "ab")
+        self._fh.write(serializer.dumps_bytes(entry) + b"\n")
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+
+    def start(self, header: dict):
+        """開始新的執行 (覆寫舊日誌)"""
+        self.discard()
+        self._append(dict(header, type="start"))
+
+    def resume(self):
+        """沿用既有日誌，後續完成的任務繼續追加"""
+        self._fh = open(self.path, "ab")
+
+    def mark_done(self, gids: Iterable[str]):
+        """記錄一批已完成的任務 (呼叫前原始資料須已 commit)"""
+        gids = [str(g) for g in gids]
+        if gids:
+            self._append({"type": "done", "gids": gids})
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def discard(self):
+        """刪除日誌 (放棄續傳)"""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def finish(self):
+        """執行完整結束：刪除日誌，之後才可推進同步時間戳記"""
+        self.discard()
+
+
+class DeferredAttachments:
+    """
+    延後下載附件的待辦清單：fetch_journal/<專案 GID>.deferred.json
+
+    * 內容為 {任務 GID: {附件 GID: 父物件 GID}}；排入背景佇列的附件在日誌 checkpoint 與等待前寫入
+    * 下載成功並回填紀錄後才移除；執行中斷或下載失敗時保留，下次執行重新取得下載網址後再排入
+    * 清單為空時刪除檔案
+    """
+
+    def __init__(self, project_id):
+        os.makedirs(config.FETCH_JOURNAL_DIR, exist_ok=True)
+        self.path = os.path.join(config.FETCH_JOURNAL_DIR, f"{project_id}.deferred.json")
+        self.pending = {}
+        if os.path.exists(self.path):
+            try:
+                self.pending = serializer.load_file(self.path)
+            except (OSError, ValueError):
+                self.pending = {}
+
+    def items(self) -> Iterable[Tuple[str, str, str]]:
+        """(任務 GID, 附件 GID, 父物件 GID)"""
+        return [
+            (task_gid, att_gid, parent_gid)
+            for task_gid, atts in self.pending.items()
+            for att_gid, parent_gid in atts.items()
+        ]
+
+    def track(self, items: Iterable[Tuple[str, str, str]]):
+        """記錄排入背景佇列的附件"""
+        for task_gid, att_gid, parent_gid in items:
+            self.pending.setdefault(str(task_gid), {})[str(att_gid)] = str(parent_gid)
+
+    def done(self, task_gid, att_gid=None):
+        """附件已回填 (att_gid 為 None 時移除整個任務，例如任務已刪除)"""
+        task_gid = str(task_gid)
+        if att_gid is None:
+            self.pending.pop(task_gid, None)
+            return
+        atts = self.pending.get(task_gid)
+        if atts is not None:
+            atts.pop(str(att_gid), None)
+            if not atts:
+                del self.pending[task_gid]
+
+    def save(self):
+        if not self.pending:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        tmp = self.path + ".tmp"
+        serializer.dump_file(self.pending, tmp, indent=True)
+        os.replace(tmp, self.path)
@@ -2,16 +2,22 @@ import sys
 import os
 
 # 載入模組
-from core import config
 from fetch import run_fetch
+from pipeline import run_pipeline, webhook_daemon
 from process import run_process
-from qa import run_qa
+from qa import run_qa, export_dataset
+from search import run_index
+
+# python main.py --force：擷取時忽略已存紀錄，全部重新抓取
+FORCE_FETCH = "--force" in sys.argv[1:]
+# python main.py --reindex：QA 生成前先以磁碟上的 Markdown 重新對齊文件索引
+REINDEX = "--reindex" in sys.argv[1:]
 
 
 def main():
     while True:
         print("1. 🔄 完整同步 (Fetch -> Process -> QA)")
-        print("   -> 下載新資料，並自動生成文件 (推薦日常使用)")
+        print("   -> 下載新資料，並自動生成文件 (管線模式，擷取同時生成，推薦日常使用)")
         print("")
         print("2. 📥 僅擷取原始資料 (Stage 1 Only)")
         print("   -> 僅下載 JSON 與圖片，不生成 Markdown")
@@ -19,30 +25,24 @@ def main():
         print("3. 📝 僅重新生成文件 (Stage 2 Only)")
         print("   -> 不連網，僅根據現有 JSON 重產 Markdown (改排版用)")
         print("4. 🧠 僅生成 QA 資料集 (Stage 3)")
+        print("5. 🔎 更新全文檢索索引 (知識文件 + QA)")
+        print("6. 📦 匯出 QA 訓練資料集 (JSONL.zst / Parquet)")
+        print("7. 📡 Webhook 常駐同步")
+        print("   -> 接收 Asana webhook，只擷取並生成有異動的任務 (Ctrl+C 結束)")
         print("")
         print("q. 離開")
 
         choice = input("\n👉 請選擇模式: ").strip().lower()
 
         if choice == "1":
-            # --- 完整流程 ---
-            print("\n>>> 啟動第一階段：資料擷取 <<<")
-            target_proj = run_fetch.run_fetch()
-
-            if target_proj:
-                print(f"\n>>> 啟動第二階段：文件生成 ({target_proj}) <<<")
-                run_process.run_process(target_proj)
-                if config.ENABLE_LLM_ANALYSIS:
-                    print(f"\n>>> [Step 3] 啟動 QA 萃取 ({target_proj}) <<<")
-                    run_qa.run_qa_generation(target_proj)
-                else:
-                    print("\n⚠️ LLM 功能未開啟，跳過 QA 生成。")
-            else:
-                print("\n⚠️ 第一階段未完成或取消，流程中止。")
+            # --- 完整流程 (管線模式：擷取、文件生成、QA 同時進行) ---
+            print("\n>>> 啟動完整同步 (擷取 → 文件生成 → QA) <<<")
+            if not run_pipeline.run_pipeline(force=FORCE_FETCH):
+                print("\n⚠️ 擷取未完成、取消或無新任務。")
 
         elif choice == "2":
             # --- 僅擷取 ---
-            run_fetch.run_fetch()
+            run_fetch.run_fetch(force=FORCE_FETCH)
 
         elif choice == "3":
             # --- 僅生成 ---
@@ -53,7 +53,16 @@ def main():
             # 獨立執行 QA 生成
             # 這裡可以簡單做個選單讓使用者選專案，或是直接跑
             # 為了簡單，這裡讓 generate_qa 跑全量，或者可以修改 generate_qa 讓它跳出選單
-            run_qa.run_qa_generation()
+            run_qa.run_qa_generation(reindex=REINDEX)
+
+        elif choice == "5":
+            run_index.run_index()
+
+        elif choice == "6":
+            export_dataset.export_dataset()
+
+        elif choice == "7":
+            webhook_daemon.run_daemon()
 
         elif choice == "q":
             print("👋 再見！")
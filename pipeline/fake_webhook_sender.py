@@ -0,0 +1,115 @@
+# 檔案用途：本機測試用的假 Asana webhook 發送端：模擬握手、連續編輯的事件爆量與錯誤簽章，驗證 webhook_daemon 的行為。
+
+import secrets
+import sys
+import time
+
+import requests
+
+from core import serializer
+from pipeline.webhook_daemon import sign
+
+
+def handshake(url, secret=None):
+    """
+    模擬建立 webhook 時的握手
+
+    Returns:
+        str: 握手成功時回傳使用的 secret；被拒絕 (daemon 未以 --accept-handshake 啟動或已有 secret) 時回傳 None
+    """
+    secret = secret or secrets.token_hex(16)
+    r = requests.post(url, headers={"X-Hook-Secret": secret}, timeout=10)
+    ok = r.status_code in (200, 204) and r.headers.get("X-Hook-Secret") == secret
+    print(f"🤝 握手: HTTP {r.status_code} {'✅' if ok else '❌'}")
+    return secret if ok else None
+
+
+def send_events(url, secret, events, bad_signature=False):
+    """送出一次事件請求 (以 secret 簽章)，回傳 HTTP 狀態碼"""
+    body = serializer.dumps_bytes({"events": events})
+    signature = sign(secret, body)
+    if bad_signature:
+        signature = signature[::-1]
+    r = requests.post(
+        url,
+        data=body,
+        headers={"Content-Type": "application/json", "X-Hook-Signature": signature},
+        timeout=10,
+    )
+    return r.status_code
+
+
+def task_event(gid, action="changed"):
+    return {
+        "action": action,
+        "resource": {"gid": str(gid), "resource_type": "task"},
+        "parent": None,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+    }
+
+
+def story_event(task_gid):
+    return {
+        "action": "added",
+        "resource": {"gid": secrets.token_hex(4), "resource_type": "story", "resource_subtype": "comment_added"},
+        "parent": {"gid": str(task_gid), "resource_type": "task"},
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+    }
+
+
+def simulate(url, gids, burst=5, interval=0.2, secret=None, deleted=()):
+    """
+    模擬一段編輯爆量：每個任務送出 burst 次變更 (任務與留言事件交錯)，另送一次錯誤簽章
+
+    Args:
+        url (str): daemon 網址
+        gids (List[str]): 任務 GID
+        burst (int): 每個任務的事件數
+        interval (float): 每次請求間隔秒數
+        secret (str): daemon 已保存的 secret；None 時先握手
+        deleted (List[str]): 送出 deleted 事件的任務 GID
+    """
+    secret = secret or handshake(url)
+    if not secret:
+        print("❌ 握手被拒絕：請以 --accept-handshake 啟動 daemon，或以 --secret 提供 daemon 已保存的 secret")
+        return
+    sent = 0
+    for i in range(burst):
+        events = [task_event(g) if i % 2 == 0 else story_event(g) for g in gids]
+        status = send_events(url, secret, events)
+        sent += len(events)
+        print(f"📨 第 {i + 1}/{burst} 次：{len(events)} 個事件 → HTTP {status}")
+        time.sleep(interval)
+    if deleted:
+        status = send_events(url, secret, [task_event(g, "deleted") for g in deleted])
+        sent += len(deleted)
+        print(f"🗑️ 刪除事件 {len(deleted)} 個 → HTTP {status}")
+    # 心跳 (空事件) 與錯誤簽章
+    print(f"💓 心跳 → HTTP {send_events(url, secret, [])}")
+    print(f"🚫 錯誤簽章 → HTTP {send_events(url, secret, [task_event(gids[0])], bad_signature=True)} (預期 401)")
+    print(f"✅ 共送出 {sent} 個事件，涉及 {len(set(gids) | set(deleted))} 個任務")
+
+
+if __name__ == "__main__":
+    # python -m pipeline.fake_webhook_sender --url http://127.0.0.1:8787/ --gid 123 --gid 456 [--burst 5] [--delete 789] [--secret xxx]
+    args = sys.argv[1:]
+
+    def _values(name):
+        return [args[i + 1] for i, a in enumerate(args) if a == name and i + 1 < len(args)]
+
+    def _arg(name, default=None):
+        values = _values(name)
+        return values[-1] if values else default
+
+    gids = _values("--gid")
+    if not gids:
+        print("❌ 請以 --gid 指定至少一個任務 GID")
+        sys.exit(1)
+    simulate(
+        _arg("--url", "http://127.0.0.1:8787/"),
+        gids,
+        burst=int(_arg("--burst", "5")),
+        interval=float(_arg("--interval", "0.2")),
+        secret=_arg("--secret"),
+        deleted=_values("--delete"),
+    )
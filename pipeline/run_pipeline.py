@@ -0,0 +1,349 @@
+# 檔案用途：管線模式的完整同步：擷取、遮罩渲染與 QA 生成同時進行，以有界佇列串接各階段。
+
+import os
+import sys
+import queue
+import threading
+from asana import Configuration, ApiClient
+
+from core import config, serializer
+from core.doc_index import DocIndex
+from core.raw_store import get_raw_store, to_plain
+from fetch import run_fetch
+from process import run_process
+from qa import run_qa
+from qa.qa_cache import QACache
+from search import run_index
+
+# 佇列結束標記
+_DONE = object()
+
+# 管線統計由處理與 QA 兩個執行緒同時累加，以鎖保護
+_stats_lock = threading.Lock()
+
+
+def _count(stats, key):
+    with _stats_lock:
+        stats[key] += 1
+
+
+def _drain(inbox):
+    """階段中止後持續取出佇列直到結束標記，避免上游卡在 put()"""
+    while inbox.get() is not _DONE:
+        pass
+
+
+def _load_retry():
+    """上次未完成的工作：{"process": {專案: [GID]}, "qa": {專案: [GID]}}"""
+    if os.path.exists(config.PIPELINE_RETRY_FILE):
+        try:
+            return serializer.load_file(config.PIPELINE_RETRY_FILE)
+        except (OSError, ValueError):
+            pass
+    return {"process": {}, "qa": {}}
+
+
+def _group(items):
+    """{(專案, GID)} → {專案: [GID]}"""
+    grouped = {}
+    for proj, gid in sorted(items):
+        grouped.setdefault(proj, []).append(gid)
+    return grouped
+
+
+def _save_retry(pending, qa_missing):
+    if not pending and not qa_missing:
+        if os.path.exists(config.PIPELINE_RETRY_FILE):
+            os.remove(config.PIPELINE_RETRY_FILE)
+        return
+    os.makedirs(os.path.dirname(config.PIPELINE_RETRY_FILE), exist_ok=True)
+    serializer.dump_file(
+        {"process": _group(pending), "qa": _group(qa_missing)}, config.PIPELINE_RETRY_FILE, indent=True
+    )
+
+
+def _qa_retry_items(retry):
+    """上次記錄待補 QA 的 {(專案, GID)}；舊格式 (只記專案名稱) 改為檢查該專案的全部文件"""
+    qa = retry.get("qa") or {}
+    if isinstance(qa, dict):
+        return {(proj, str(gid)) for proj, gids in qa.items() for gid in gids}
+    doc_index = DocIndex()
+    try:
+        return {
+            (proj, row["gid"]) for proj in qa for row in doc_index.select_documents(proj, status="completed")
+        }
+    finally:
+        doc_index.close()
+
+
+def _missing_qa(items):
+    """
+    找出快取中沒有對應目前內文之 QA 的文件 (QA 呼叫失敗、批次失敗或中斷)
+
+    Args:
+        items (Iterable[tuple]): (專案, GID)
+
+    Returns:
+        dict: {(專案, GID): 文件相對路徑}；已刪除或非 completed 的文件不列入
+    """
+    items = set(items)
+    if not items:
+        return {}
+    missing = {}
+    doc_index = DocIndex()
+    try:
+        qa_cache = QACache(run_qa.QA_CACHE_VERSION)
+        for proj, gid in items:
+            doc = doc_index.get(gid)
+            if not doc or doc["status"] != "completed":
+                continue
+            if not qa_cache.lookup(gid, doc["content_hash"]):
+                missing[(proj, gid)] = doc["path"]
+    finally:
+        doc_index.close()
+    return missing
+
+
+def remove_documents(gids):
+    """
+    移除任務在知識庫中的產出：文件 Markdown、QA 檔、QA 快取與文件索引紀錄
+    (全文 / 向量索引於下次 run_index 時隨檔案與快取一併移除)
+
+    Args:
+        gids (Iterable[str]): 已刪除、變回未完成或移出專案的任務 GID
+
+    Returns:
+        List[str]: 被移除文件的相對路徑 (供 run_index 只同步這些檔案)
+    """
+    gids = [str(g) for g in gids]
+    if not gids:
+        return []
+    removed = []
+    doc_index = DocIndex()
+    qa_cache = QACache(run_qa.QA_CACHE_VERSION)
+    try:
+        for gid in gids:
+            doc = doc_index.get(gid)
+            cached = qa_cache.delete(gid)
+            rel_path = (doc or {}).get("path") or (cached or {}).get("rel_path")
+            if rel_path:
+                for root_dir in (config.PROCESSED_DIR, config.QA_DIR):
+                    fpath = os.path.join(root_dir, rel_path)
+                    if os.path.exists(fpath):
+                        os.remove(fpath)
+            if rel_path and (doc or cached):
+                removed.append(rel_path)
+            doc_index.delete(gid)
+    finally:
+        doc_index.close()
+        qa_cache.save()
+    return removed
+
+
+def _process_stage(inbox, outbox, stats, pending, changed):
+    """
+    第二階段 worker：每收到一筆擷取完成的任務即遮罩、渲染並寫入文件索引，
+    完成的文件再交給 QA 階段 (outbox 為 None 時不產生 QA)；成功者自 pending 移除，
+    新舊檔案路徑記入 changed {(專案, GID): {相對路徑}} 供檢索索引只同步這些檔案
+    """
+    doc_index = None
+    try:
+        doc_index = DocIndex()
+        client = None
+        if config.ENABLE_LLM_ANALYSIS and os.getenv("ENABLE_UPLOAD_PREVIEW") == "True":
+            conf = Configuration()
+            conf.access_token = config.load_asana_profiles()[0]["token"]
+            client = ApiClient(configuration=conf)
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                break
+            proj, data = item
+            gid = str(data["metadata"]["gid"])
+            try:
+                # 移到其他區段時舊路徑也要同步 (自檢索索引移除)
+                old = doc_index.get(gid)
+                doc = run_process.process_task(to_plain(data), proj, doc_index, client)
+                # 逐筆 commit：QA 與檢索端可立即查到新文件
+                doc_index.commit()
+                paths = changed.setdefault((proj, gid), set())
+                paths.add(doc["rel_path"])
+                if old:
+                    paths.add(old["path"])
+                _count(stats, "processed")
+            except Exception as e:
+                _count(stats, "failed")
+                print(f"\n⚠️ 文件生成失敗 {data['metadata'].get('gid')}: {e}")
+                continue
+            pending.discard((proj, gid))
+            if outbox is not None and doc["meta"].get("status") == "completed":
+                outbox.put(doc)
+    except Exception as e:
+        # 階段中止：其餘任務留在 pending，下次執行重試
+        _count(stats, "failed")
+        print(f"\n❌ 文件生成階段中止: {e}")
+        _drain(inbox)
+    finally:
+        if doc_index is not None:
+            doc_index.close()
+        if outbox is not None:
+            outbox.put(_DONE)
+
+
+def _flush(generator, stats):
+    try:
+        generator.flush()
+    except Exception as e:
+        # 整包失敗：不寫入快取，結束後的補生成會重試
+        _count(stats, "failed")
+        print(f"\n⚠️ QA 批次生成失敗: {e}")
+
+
+def _qa_stage(inbox, stats):
+    """
+    第三階段 worker：逐份生成 QA；佇列閒置超過 PIPELINE_QA_IDLE_FLUSH 秒時，
+    先送出累積中的批次，避免新任務等待整包湊滿
+    """
+    qa_cache = None
+    try:
+        qa_cache = QACache(run_qa.QA_CACHE_VERSION)
+        generator = run_qa.QAGenerator(qa_cache)
+        while True:
+            try:
+                doc = inbox.get(timeout=config.PIPELINE_QA_IDLE_FLUSH)
+            except queue.Empty:
+                _flush(generator, stats)
+                continue
+            if doc is _DONE:
+                break
+            try:
+                hit, job = run_qa.prepare_qa_job(doc, qa_cache)
+                if hit:
+                    _count(stats, "qa_cached")
+                elif job:
+                    generator.submit(job)
+                    _count(stats, "qa")
+            except Exception as e:
+                _count(stats, "failed")
+                print(f"\n⚠️ QA 生成失敗 {doc['meta'].get('gid')}: {e}")
+        _flush(generator, stats)
+    except Exception as e:
+        _count(stats, "failed")
+        print(f"\n❌ QA 階段中止: {e}")
+        _drain(inbox)
+    finally:
+        if qa_cache is not None:
+            qa_cache.save()
+
+
+def run_pipeline(force=False, fetch=None):
+    """
+    完整同步 (管線模式)：擷取到的每筆任務立即進入遮罩與渲染，完成的文件立即進入 QA 生成。
+
+    * 擷取在主執行緒進行 (含互動選單)，處理與 QA 各一個背景執行緒
+    * 階段間以 PIPELINE_QUEUE_SIZE 長度的佇列串接，下游忙碌時上游暫停 (背壓)
+    * 只處理本次擷取到的任務；未異動而沿用的任務不重新生成
+    * 文件生成失敗或中斷的任務記錄於 PIPELINE_RETRY_FILE，下次執行時從原始資料重新送入
+    * 結束後只對本次 (及上次) QA 未寫入快取的文件補生成；仍失敗者記錄 GID，下次再補
+    * 檢索索引只同步本次異動的檔案，不重新掃描整個知識庫
+    * 近似重複分群需要整批文件，管線模式不進行 (可另以選單 4 重跑)
+
+    Args:
+        force (bool): 傳給 run_fetch，忽略已存紀錄全部重新擷取
+        fetch (callable): 取代 run_fetch 的擷取函式 fetch(on_task) → 專案資料夾名稱 (Webhook 模式只擷取指定任務)
+
+    Returns:
+        str: 處理的專案資料夾名稱，若取消或無新任務回傳 None
+    """
+    with_qa = config.ENABLE_LLM_ANALYSIS
+    if not with_qa:
+        print("\n⚠️ LLM 功能未開啟，將跳過 QA 生成。")
+
+    retry = _load_retry()
+    # 已送入處理階段、尚未成功生成的任務 {(專案, GID)}
+    pending = set()
+    # 本次生成的文件 {(專案, GID): {相對路徑}}
+    changed = {}
+
+    to_process = queue.Queue(maxsize=config.PIPELINE_QUEUE_SIZE)
+    to_qa = queue.Queue(maxsize=config.PIPELINE_QUEUE_SIZE) if with_qa else None
+    stats = {"processed": 0, "qa": 0, "qa_cached": 0, "failed": 0}
+
+    workers = [
+        threading.Thread(
+            target=_process_stage, args=(to_process, to_qa, stats, pending, changed), daemon=True
+        )
+    ]
+    if with_qa:
+        workers.append(threading.Thread(target=_qa_stage, args=(to_qa, stats), daemon=True))
+    for w in workers:
+        w.start()
+
+    def on_task(proj, data):
+        pending.add((proj, str(data["metadata"]["gid"])))
+        to_process.put((proj, data))
+
+    target_proj = None
+    try:
+        if fetch is None:
+            target_proj = run_fetch.run_fetch(force=force, on_task=on_task)
+        else:
+            target_proj = fetch(on_task)
+
+        # 上次生成失敗的任務：從原始資料重新送入 (本次已擷取者略過)
+        retried = 0
+        for proj, gids in (retry.get("process") or {}).items():
+            raw_store = get_raw_store(proj)
+            try:
+                for gid in gids:
+                    if (proj, gid) in pending:
+                        continue
+                    data = raw_store.get(gid)
+                    if data:
+                        on_task(proj, data)
+                        retried += 1
+            finally:
+                raw_store.close()
+        if retried:
+            print(f"\n🔁 重試上次生成失敗的任務 {retried} 筆")
+    finally:
+        # 擷取結束 (或中斷) 後，等待已送出的任務全部處理完畢
+        to_process.put(_DONE)
+        if to_process.qsize() > 1 or (to_qa is not None and to_qa.qsize()):
+            print("\n⏳ 等待文件生成與 QA 完成...")
+        for w in workers:
+            w.join()
+        qa_missing = _missing_qa(set(changed) | _qa_retry_items(retry)) if with_qa else {}
+        _save_retry(pending, qa_missing)
+
+    print(
+        f"\n✅ 管線完成：生成文件 {stats['processed']} 份"
+        + (f"，QA 生成 {stats['qa']} 份 (快取沿用 {stats['qa_cached']})" if with_qa else "")
+        + (f"，失敗 {stats['failed']} 筆" if stats["failed"] else "")
+    )
+    if pending:
+        print(f"⚠️ {len(pending)} 筆任務文件生成失敗，下次執行時重試")
+    sys.stdout.flush()
+
+    # 補生成：只處理快取中缺少 QA 的文件 (QA 呼叫失敗、批次失敗或上次中斷)
+    for proj, gids in _group(qa_missing).items():
+        print(f"\n🔁 [{proj}] 補生成缺少的 QA ({len(gids)} 份)")
+        try:
+            run_qa.run_qa_generation(proj, gids=gids)
+        except Exception as e:
+            print(f"\n⚠️ QA 補生成失敗，下次執行時重試: {e}")
+    if qa_missing:
+        for key, rel_path in qa_missing.items():
+            changed.setdefault(key, set()).add(rel_path)
+        qa_missing = _missing_qa(qa_missing)
+        _save_retry(pending, qa_missing)
+
+    if changed:
+        run_index.run_index(
+            rel_paths=set().union(*changed.values()), gids=[gid for _, gid in changed]
+        )
+    return target_proj
+
+
+if __name__ == "__main__":
+    run_pipeline(force="--force" in sys.argv[1:])
@@ -0,0 +1,368 @@
+# 檔案用途：Webhook 常駐同步：接收 Asana webhook 事件 (握手 + 簽章驗證)，依任務 GID 合併連續事件後，只將異動任務送入擷取 → 處理 → QA 管線。
+
+import hmac
+import hashlib
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from core import config, serializer
+from fetch import run_fetch
+from pipeline import run_pipeline
+from search import run_index
+
+# 單次事件請求的大小上限 (Asana 每次最多 100 個事件)
+MAX_BODY_BYTES = 1024 * 1024
+
+
+def load_secret(project_id):
+    """讀取專案已保存的 webhook secret；尚未握手時回傳 None"""
+    if not os.path.exists(config.WEBHOOK_SECRET_FILE):
+        return None
+    return serializer.load_file(config.WEBHOOK_SECRET_FILE).get(str(project_id))
+
+
+def save_secret(project_id, secret):
+    secrets = {}
+    if os.path.exists(config.WEBHOOK_SECRET_FILE):
+        secrets = serializer.load_file(config.WEBHOOK_SECRET_FILE)
+    secrets[str(project_id)] = secret
+    os.makedirs(os.path.dirname(config.WEBHOOK_SECRET_FILE), exist_ok=True)
+    serializer.dump_file(secrets, config.WEBHOOK_SECRET_FILE, indent=True)
+
+
+def sign(secret: str, body: bytes) -> str:
+    """X-Hook-Signature：以 secret 對請求本文做 HMAC-SHA256 (hex)"""
+    return hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+def event_task(event: dict):
+    """
+    事件對應的任務
+
+    * 任務本身的事件 → 該任務 (action 為 deleted 時標記為刪除)
+    * 留言、附件等掛在任務下的事件 → 父任務
+    * 其他 (專案、區段本身的異動) → 不處理
+
+    Returns:
+        tuple: (任務 GID, 是否已刪除)；無對應任務時回傳 None
+    """
+    resource = event.get("resource") or {}
+    parent = event.get("parent") or {}
+    if resource.get("resource_type") == "task" and resource.get("gid"):
+        return str(resource["gid"]), event.get("action") == "deleted"
+    if parent.get("resource_type") == "task" and parent.get("gid"):
+        return str(parent["gid"]), False
+    return None
+
+
+class EventCoalescer:
+    """
+    依任務 GID 合併事件
+
+    * 同一任務的連續事件只記錄第一次與最後一次收到的時間
+    * 最後一個事件後靜默 WEBHOOK_COALESCE_SECONDS 秒，或第一個事件已等待 WEBHOOK_MAX_DELAY_SECONDS 秒，才可取出
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pending = {}  # gid → [first_seen, last_seen, deleted]
+        self._retries = {}  # gid → 重試次數
+        self.stats = {"events": 0, "coalesced": 0}
+
+    def add(self, gid, deleted=False):
+        now = time.monotonic()
+        with self._lock:
+            self.stats["events"] += 1
+            entry = self._pending.get(gid)
+            if entry is None:
+                self._pending[gid] = [now, now, deleted]
+            else:
+                self.stats["coalesced"] += 1
+                entry[1] = now
+                entry[2] = entry[2] or deleted
+        self._wake.set()
+
+    def retry(self, gids, deleted=()):
+        """失敗的任務重新排入 (每個 GID 最多 WEBHOOK_MAX_RETRIES 次；deleted 中的 GID 保留刪除標記)"""
+        deleted = set(deleted)
+        for gid in gids:
+            with self._lock:
+                count = self._retries.get(gid, 0) + 1
+                self._retries[gid] = count
+            if count > config.WEBHOOK_MAX_RETRIES:
+                print(f"⚠️ 任務 {gid} 重試 {config.WEBHOOK_MAX_RETRIES} 次仍失敗，等待下一個事件")
+                with self._lock:
+                    self._retries.pop(gid, None)
+                continue
+            self.add(gid, gid in deleted)
+
+    def take_ready(self):
+        """
+        取出已可處理的任務 (最多 WEBHOOK_BATCH_MAX_TASKS 筆)
+
+        Returns:
+            tuple: (要擷取的 GID 列表, 已刪除的 GID 列表, 距離下一筆可處理的秒數 (無待處理時為 None))
+        """
+        now = time.monotonic()
+        gids, deleted, wait = [], [], None
+        with self._lock:
+            self._wake.clear()
+            for gid, (first, last, is_deleted) in list(self._pending.items()):
+                due = min(last + config.WEBHOOK_COALESCE_SECONDS, first + config.WEBHOOK_MAX_DELAY_SECONDS)
+                if due > now or len(gids) + len(deleted) >= config.WEBHOOK_BATCH_MAX_TASKS:
+                    wait = min(wait, due - now) if wait is not None else max(0.0, due - now)
+                    continue
+                del self._pending[gid]
+                (deleted if is_deleted else gids).append(gid)
+        return gids, deleted, wait
+
+    def wait(self, timeout):
+        """等待新事件或逾時"""
+        self._wake.wait(timeout)
+
+    def wake(self):
+        self._wake.set()
+
+    def succeeded(self, gids):
+        with self._lock:
+            for gid in gids:
+                self._retries.pop(gid, None)
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    # self.server.webhook 為 WebhookDaemon
+
+    def log_message(self, format, *args):
+        # 不輸出每筆請求的存取紀錄
+        pass
+
+    def _reply(self, status, headers=None):
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        daemon = self.server.webhook
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            self._reply(413)
+            return
+        body = self.rfile.read(length) if length else b""
+
+        # 1. 握手：建立 webhook 時 Asana 送出 X-Hook-Secret，原樣回傳並保存
+        hook_secret = self.headers.get("X-Hook-Secret")
+        if hook_secret:
+            if not daemon.accept_handshake(hook_secret):
+                self._reply(403)
+                return
+            self._reply(200, {"X-Hook-Secret": hook_secret})
+            return
+
+        # 2. 事件：驗證 X-Hook-Signature
+        signature = self.headers.get("X-Hook-Signature") or ""
+        secret = daemon.secret
+        if not secret or not hmac.compare_digest(sign(secret, body), signature):
+            daemon.stats["rejected"] += 1
+            print("⚠️ Webhook 簽章驗證失敗，已拒絕")
+            self._reply(401)
+            return
+        try:
+            events = serializer.loads(body).get("events") or []
+        except (ValueError, AttributeError):
+            self._reply(400)
+            return
+        # 先回應 (Asana 要求在時限內回覆)，實際擷取由同步執行緒處理
+        self._reply(200)
+        daemon.accept_events(events)
+
+
+class WebhookDaemon:
+    """
+    Webhook 常駐同步
+
+    * HTTP 執行緒：處理握手與事件，驗證簽章後將任務 GID 交給 EventCoalescer，立即回應
+    * 同步執行緒：取出合併後的任務，以 run_pipeline(fetch=run_fetch.fetch_tasks) 只處理這些任務
+    * 同一時間只執行一批；執行期間收到的事件累積到下一批
+    """
+
+    def __init__(self, profile, host=None, port=None, accept_handshake=False):
+        self.profile = profile
+        self.project_id = str(profile["project"])
+        self.secret = load_secret(self.project_id)
+        # 預設拒絕所有握手 (否則任何先連上此埠的人都能設定 secret 並送出簽章有效的事件)；
+        # 只有 register() 建立 webhook 期間，或本機測試明確指定 accept_handshake 且尚無 secret 時才允許
+        self.allow_handshake = bool(accept_handshake) and self.secret is None
+        self.coalescer = EventCoalescer()
+        self.stats = {"batches": 0, "rejected": 0}
+        self._stop = threading.Event()
+        self.server = ThreadingHTTPServer(
+            (host or config.WEBHOOK_HOST, port if port is not None else config.WEBHOOK_PORT),
+            _WebhookHandler,
+        )
+        self.server.webhook = self
+        self.server.daemon_threads = True
+
+    @property
+    def address(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def accept_handshake(self, secret) -> bool:
+        if not self.allow_handshake:
+            if self.secret:
+                print("⚠️ 已有 webhook secret，拒絕新的握手 (刪除 webhook_secrets.json 中的專案項目後可重新建立)")
+            else:
+                print("⚠️ 非建立 webhook 期間，拒絕握手 (請以 --register 建立 webhook)")
+            return False
+        self.secret = secret
+        self.allow_handshake = False
+        save_secret(self.project_id, secret)
+        print("🤝 Webhook 握手完成，已保存 secret")
+        return True
+
+    def accept_events(self, events):
+        for event in events:
+            target = event_task(event)
+            if target:
+                self.coalescer.add(*target)
+
+    def register(self, target_url):
+        """
+        在 Asana 建立專案 webhook (Asana 會在建立過程中對 target_url 握手，伺服器須已啟動且可從外部連線)
+        """
+        from asana import ApiClient, Configuration
+        from asana.api.webhooks_api import WebhooksApi
+
+        conf = Configuration()
+        conf.access_token = self.profile["token"]
+        self.allow_handshake = True
+        try:
+            WebhooksApi(ApiClient(configuration=conf)).create_webhook(
+                {
+                    "data": {
+                        "resource": self.project_id,
+                        "target": target_url,
+                        "filters": [
+                            {"resource_type": "task"},
+                            {"resource_type": "story", "action": "added"},
+                            {"resource_type": "attachment", "action": "added"},
+                        ],
+                    }
+                },
+                opts={},
+            )
+            print(f"✅ 已建立 webhook → {target_url}")
+        except Exception as e:
+            print(f"❌ 建立 webhook 失敗: {e}")
+        finally:
+            self.allow_handshake = False
+
+    def _sync_loop(self):
+        while not self._stop.is_set():
+            gids, deleted, wait = self.coalescer.take_ready()
+            if not (gids or deleted):
+                self.coalescer.wait(wait if wait is not None else 1.0)
+                continue
+            self.stats["batches"] += 1
+            cs = self.coalescer.stats
+            print(
+                f"\n📡 [Webhook] 第 {self.stats['batches']} 批：更新 {len(gids)} 筆，刪除 {len(deleted)} 筆"
+                f" (累計事件 {cs['events']}，合併 {cs['coalesced']})"
+            )
+            failed = []
+            removed = []
+
+            def _fetch(on_task):
+                nonlocal failed, removed
+                proj, failed, removed = run_fetch.fetch_tasks(self.profile, gids, deleted, on_task)
+                return proj
+
+            try:
+                run_pipeline.run_pipeline(fetch=_fetch)
+                # 已刪除 / 不再符合條件的任務：移除 Markdown、QA 檔、QA 快取與索引
+                paths = run_pipeline.remove_documents(removed)
+                if paths:
+                    run_index.run_index(rel_paths=paths, gids=removed)
+            except Exception as e:
+                print(f"❌ 同步失敗: {e}")
+                failed = gids + deleted
+            self.coalescer.succeeded([g for g in gids + deleted if g not in failed])
+            self.coalescer.retry(failed, deleted)
+            sys.stdout.flush()
+
+    def serve_forever(self):
+        """啟動伺服器與同步執行緒，直到 stop() 或 Ctrl+C"""
+        sync = threading.Thread(target=self._sync_loop, name="webhook-sync", daemon=True)
+        sync.start()
+        try:
+            self.server.serve_forever()
+        finally:
+            self._stop.set()
+            self.coalescer.wake()
+            sync.join()
+            self.server.server_close()
+
+    def stop(self):
+        self.server.shutdown()
+
+
+def run_daemon(profile_index=None, register_url=None, port=None, accept_handshake=False):
+    """
+    Webhook 常駐同步入口
+
+    Args:
+        profile_index (int): Profile 編號 (1 起算)；None 時互動選擇
+        register_url (str): 指定時啟動後向 Asana 建立 webhook (公開可連線的網址)
+        port (int): 監聽埠，預設 WEBHOOK_PORT
+        accept_handshake (bool): 尚無 secret 時接受任何來源的握手 (僅供本機以 fake_webhook_sender 測試)
+    """
+    profiles = config.load_asana_profiles()
+    if not profiles:
+        print("❌ .env 設定錯誤")
+        return
+    if profile_index is None:
+        print("請選擇專案 Profile：")
+        for i, p in enumerate(profiles):
+            print(f"  {i+1}) {p['name']}")
+        choice = input("\n👉 請輸入編號 (n離開)：").strip()
+        if not choice.isdigit():
+            return
+        profile_index = int(choice)
+    if not (1 <= profile_index <= len(profiles)):
+        print("❌ 選項無效")
+        return
+
+    daemon = WebhookDaemon(profiles[profile_index - 1], port=port, accept_handshake=accept_handshake)
+    print(f"\n📡 [Webhook] 常駐同步 [{daemon.profile['name']}]，監聽 {daemon.address} (Ctrl+C 結束)")
+    if daemon.secret is None:
+        if register_url or daemon.allow_handshake:
+            print("⏳ 尚未握手：等待建立 webhook 時送出 X-Hook-Secret")
+        else:
+            print("⚠️ 尚未握手且未指定 --register，所有事件都會被拒絕")
+    if register_url:
+        threading.Thread(target=daemon.register, args=(register_url,), daemon=True).start()
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 已停止 Webhook 常駐同步")
+
+
+if __name__ == "__main__":
+    # python -m pipeline.webhook_daemon [--profile N] [--register https://公開網址/] [--port 8787] [--accept-handshake]
+    args = sys.argv[1:]
+
+    def _arg(name):
+        return args[args.index(name) + 1] if name in args and args.index(name) + 1 < len(args) else None
+
+    run_daemon(
+        profile_index=int(_arg("--profile")) if _arg("--profile") else None,
+        register_url=_arg("--register"),
+        port=int(_arg("--port")) if _arg("--port") else None,
+        accept_handshake="--accept-handshake" in args,
+    )
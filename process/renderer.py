@@ -6,6 +6,39 @@ import re
 from core import utils
 
 
+def build_document_meta(data, safe_title):
+    """
+    產生文件檔頭 (YAML frontmatter) 的欄位，供渲染與文件索引共用
+
+    Args:
+        data (dict): 任務 JSON 資料
+        safe_title (str): 已遮罩的任務標題
+
+    Returns:
+        dict: gid, title, status, created_date, modified_at, expiry_date, section
+    """
+    t = data["metadata"]
+    c_at = t["created_at"][:10]
+
+    # 嘗試從 calculated_expiry_date (若有) 或其他邏輯取得 expiry
+    # 原始邏輯：+365天
+    # 這裡保留原始呈現邏輯，或可以改為讀取 t.get("calculated_expiry_date")
+    # 但 t["expiry_date"] 不一定存在，原程式是現場算
+    exp = (
+        datetime.datetime.strptime(c_at, "%Y-%m-%d") + datetime.timedelta(days=365)
+    ).strftime("%Y-%m-%d")
+
+    return {
+        "gid": t["gid"],
+        "title": utils.clean_filename(safe_title),
+        "status": "completed" if t.get("completed") else "active",
+        "created_date": c_at,
+        "modified_at": t.get("modified_at"),
+        "expiry_date": exp,
+        "section": data["section_name"],
+    }
+
+
 def render_markdown(data, mask_func):
     """
     輸入:
@@ -72,16 +105,8 @@ def render_markdown(data, mask_func):
 
     # 1. Metadata
     safe_title = mask_func(t["name"])
-    c_at = t["created_at"][:10]
-    
-    # 嘗試從 calculated_expiry_date (若有) 或其他邏輯取得 expiry
-    # 原始邏輯：+365天
-    # 這裡保留原始呈現邏輯，或可以改為讀取 t.get("calculated_expiry_date")
-    # 但 t["expiry_date"] 不一定存在，原程式是現場算
-    exp = (
-        datetime.datetime.strptime(c_at, "%Y-%m-%d") + datetime.timedelta(days=365)
-    ).strftime("%Y-%m-%d")
-    status_str = "completed" if t.get("completed") else "active"
+    doc_meta = build_document_meta(data, safe_title)
+    c_at = doc_meta["created_date"]
 
     # 提取自訂欄位
     cf_data = {}
@@ -93,13 +118,13 @@ def render_markdown(data, mask_func):
     md = [
         "---",
         "type: task",
-        f"gid: {t['gid']}",
-        f'title: "{utils.clean_filename(safe_title)}"',
-        f"status: {status_str}",
-        f"created_date: {c_at}",
-        f"modified_at: {t.get('modified_at')}",
-        f"expiry_date: {exp}",
-        f"section: \"{data['section_name']}\"",
+        f"gid: {doc_meta['gid']}",
+        f'title: "{doc_meta["title"]}"',
+        f"status: {doc_meta['status']}",
+        f"created_date: {doc_meta['created_date']}",
+        f"modified_at: {doc_meta['modified_at']}",
+        f"expiry_date: {doc_meta['expiry_date']}",
+        f"section: \"{doc_meta['section']}\"",
     ]
     for k, v in cf_data.items():
         md.append(f'cf_{utils.clean_filename(k)}: "{mask_func(v)}"')
@@ -1,11 +1,11 @@
 import os
-import json
-import glob
 import sys
 import re
 from asana import Configuration, ApiClient
 
 from core import config, utils
+from core.doc_index import DocIndex
+from core.raw_store import get_raw_store
 from process import renderer
 from services import llm_processor
 
@@ -103,6 +103,97 @@ def collect_texts_to_mask(data):
     return list(texts)
 
 
+def process_task(data, target_proj, doc_index, client=None):
+    """
+    處理單一任務：批次遮罩 → 渲染 Markdown → 存檔 → 更新文件索引 (不 commit)
+
+    Args:
+        data (dict): 原始任務資料包 (純 dict)
+        target_proj (str): 專案資料夾名稱
+        doc_index (DocIndex): 文件索引
+        client (ApiClient): 寫回遮罩預覽用的 Asana Client
+
+    Returns:
+        dict: rel_path, meta, content_hash, body (供 QA 直接使用)
+    """
+    t = data["metadata"]
+
+    # 批次遮罩 (Batch Masking)
+    mask_lookup = {}
+
+    if config.ENABLE_LLM_ANALYSIS:
+        # 1. 收集所有字串
+        all_texts = collect_texts_to_mask(data)
+
+        # 2. 一次性送給 LLM(讓llm_processor 內部自動分批處理以符合 token 限制, LLM 會看到 <<<ASSET_123>>> 並保留它)
+        mask_lookup = llm_processor.mask_batch_texts(all_texts)
+
+    # 3. 定義快速查找函式
+    def _mask(txt):
+        if not txt:
+            return ""
+        if not config.ENABLE_LLM_ANALYSIS:
+            return txt
+
+        # A. 先保護傳入的文字 (因為 lookup key 是保護過的)
+        protected_txt = protect_asana_links(txt)
+
+        # B. 查表取得遮罩後結果
+        masked_txt = mask_lookup.get(protected_txt, protected_txt)
+
+        # C. 還原連結 (讓 markdown_render 能讀到 ID)
+        final_txt = restore_asana_links(masked_txt)
+
+        return final_txt
+
+    # 渲染與存檔
+    md_lines = renderer.render_markdown(data, _mask)
+
+    # Raw Data 相對路徑
+    final_md_lines = []
+    path_prefix = f"../../../raw_data/{target_proj}/attachments/"
+    for line in md_lines:
+        line = line.replace("../attachments/", path_prefix)
+        final_md_lines.append(line)
+
+    final_md_content = "\n".join(final_md_lines)
+    # 存檔
+    sec_dir = os.path.join(config.PROCESSED_DIR, target_proj, data["section_name"])
+    os.makedirs(sec_dir, exist_ok=True)
+
+    safe_title = _mask(t["name"])
+    c_at = t["created_at"][:10].replace("-", "")
+    fname = f"{c_at}_{utils.clean_filename(safe_title)}.md"
+    if len(fname) > 100:
+        fname = fname[:100] + ".md"
+
+    out_path = os.path.join(sec_dir, fname)
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write(final_md_content)
+
+    # 更新文件索引
+    _, body = utils.split_frontmatter(final_md_content)
+    meta = renderer.build_document_meta(data, safe_title)
+    rel_path = os.path.relpath(out_path, config.PROCESSED_DIR)
+    content_hash = utils.hash_text(body)
+    doc_index.upsert(target_proj, meta, rel_path, content_hash)
+
+    # 寫回預覽
+    if config.ENABLE_LLM_ANALYSIS and os.getenv("ENABLE_UPLOAD_PREVIEW") == "True":
+        preview_stories = []
+        for s in data["stories"]:
+            if s["resource_subtype"] == "comment_added":
+                u = _mask(s.get("created_by", {}).get("name", "User"))
+                txt = _mask(s["text"])
+                preview_stories.append(f"{u}: {txt}")
+
+        utils.post_masking_preview(
+            client, t["gid"], final_md_content
+        )  # 直接傳送檔案內容
+
+    return {"rel_path": rel_path, "meta": meta, "content_hash": content_hash, "body": body}
+
+
 def run_process(target_proj_name=None):
     if not os.path.exists(config.RAW_DIR):
         print("❌ 找不到原始資料")
@@ -129,8 +220,7 @@ def run_process(target_proj_name=None):
         except:
             return
 
-    json_path = os.path.join(config.RAW_DIR, target_proj, "json_tasks")
-    output_proj_path = os.path.join(config.PROCESSED_DIR, target_proj)
+    raw_store = get_raw_store(target_proj)
 
     # 準備 API (用於預覽)
     profiles = config.load_asana_profiles()
@@ -139,84 +229,23 @@ def run_process(target_proj_name=None):
     conf.access_token = token
     client = ApiClient(configuration=conf)
 
-    files = glob.glob(os.path.join(json_path, "*.json"))
-    print(f"\n🚀 [Stage 2] 開始處理 {len(files)} 個檔案...")
+    total = len(raw_store)
+    print(f"\n🚀 [Stage 2] 開始處理 {total} 個檔案...")
     print(f"🔒 遮罩: {'True' if config.ENABLE_LLM_ANALYSIS else 'False'}")
 
-    for i, fpath in enumerate(files):
-        sys.stdout.write(f"\r   進度: {i+1}/{len(files)}...")
-        sys.stdout.flush()
-
-        with open(fpath, "r", encoding="utf-8") as f:
-            data = json.load(f)
-
-        t = data["metadata"]
+    # 文件索引：記錄每份 Markdown 的檔頭欄位與內文雜湊，供 QA 等下游直接查詢
+    doc_index = DocIndex()
 
-        # 批次遮罩 (Batch Masking)
-        mask_lookup = {}
-
-        if config.ENABLE_LLM_ANALYSIS:
-            # 1. 收集所有字串
-            all_texts = collect_texts_to_mask(data)
-
-            # 2. 一次性送給 LLM(讓llm_processor 內部自動分批處理以符合 token 限制, LLM 會看到 <<<ASSET_123>>> 並保留它)
-            mask_lookup = llm_processor.mask_batch_texts(all_texts)
-
-        # 3. 定義快速查找函式
-        def _mask(txt):
-            if not txt:
-                return ""
-            if not config.ENABLE_LLM_ANALYSIS:
-                return txt
-
-            # A. 先保護傳入的文字 (因為 lookup key 是保護過的)
-            protected_txt = protect_asana_links(txt)
-
-            # B. 查表取得遮罩後結果
-            masked_txt = mask_lookup.get(protected_txt, protected_txt)
-
-            # C. 還原連結 (讓 markdown_render 能讀到 ID)
-            final_txt = restore_asana_links(masked_txt)
-
-            return final_txt
-
-        # 渲染與存檔
-        md_lines = renderer.render_markdown(data, _mask)
-
-        # Raw Data 相對路徑
-        final_md_lines = []
-        path_prefix = f"../../../raw_data/{target_proj}/attachments/"
-        for line in md_lines:
-            line = line.replace("../attachments/", path_prefix)
-            final_md_lines.append(line)
-
-        final_md_content = "\n".join(final_md_lines)
-        # 存檔
-        sec_dir = os.path.join(output_proj_path, data["section_name"])
-        os.makedirs(sec_dir, exist_ok=True)
-
-        safe_title = _mask(t["name"])
-        c_at = t["created_at"][:10].replace("-", "")
-        fname = f"{c_at}_{utils.clean_filename(safe_title)}.md"
-        if len(fname) > 100:
-            fname = fname[:100] + ".md"
-
-        with open(os.path.join(sec_dir, fname), "w", encoding="utf-8") as f:
-            f.write("\n".join(final_md_lines))
-
-        # 寫回預覽
-        if config.ENABLE_LLM_ANALYSIS and os.getenv("ENABLE_UPLOAD_PREVIEW") == "True":
-            preview_stories = []
-            for s in data["stories"]:
-                if s["resource_subtype"] == "comment_added":
-                    u = _mask(s.get("created_by", {}).get("name", "User"))
-                    txt = _mask(s["text"])
-                    preview_stories.append(f"{u}: {txt}")
+    for i, data in enumerate(raw_store.iter_records()):
+        sys.stdout.write(f"\r   進度: {i+1}/{total}...")
+        sys.stdout.flush()
 
-            utils.post_masking_preview(
-                client, t["gid"], final_md_content
-            )  # 直接傳送檔案內容
+        process_task(data, target_proj, doc_index, client)
+        if (i + 1) % 100 == 0:
+            doc_index.commit()
 
+    doc_index.close()
+    raw_store.close()
     print(f"\n✅ 處理完成！")
 
 
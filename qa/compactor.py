@@ -0,0 +1,270 @@
+# 檔案用途：QA 輸入壓縮 (Context Compaction)，在送進 LLM 前移除雜訊並依優先順序控制 token 預算（純轉換，無 I/O）。
+
+import re
+from typing import List, Tuple
+
+from core import config, utils
+
+# 雜訊樣式
+_ASSET_URL = re.compile(r"https://app\.asana\.com/[^\s)]*asset_id=\d+")
+_MD_LINK = re.compile(r"\[([^\]\n]*)\]\((?:[^()\s]|\([^()\s]*\))*\)")
+_BARE_URL = re.compile(r"https?://[^\s)>\]]+")
+_NOT_DOWNLOADED = " (未下載)"
+
+# 結構樣式 (對應 process/renderer.py 的輸出)
+_SECTION_HEADER = re.compile(r"^## ")
+_STORY_HEADER = re.compile(r"^> \*\*(.+?) \((\d{4}-\d{2}-\d{2})\)\*\*:\s*$")
+_OCR_HEADER = re.compile(r"^(?P<prefix>[ >]*)🖼️ \*\*內容分析\*\*")
+
+# 系統自動產生的留言 (例如 post_masking_preview 回寫的預覽)
+_SYSTEM_CHATTER = ("🔒 **[系統自動生成]",)
+
+# 引用前文至少需達此長度才視為重複引用 (避免誤判短句)
+_MIN_QUOTE_CHARS = 40
+
+# 預算優先順序：數字越小越重要
+PRIORITY_HEADER = 0  # 標題、基本資訊、任務描述 (含表單欄位)
+PRIORITY_LAST_COMMENTS = 1  # 最後 N 則留言 (通常是結論)
+PRIORITY_SUBTASKS = 2
+PRIORITY_OLD_COMMENTS = 3
+PRIORITY_ATTACHMENTS = 4
+
+
+def _normalize(text):
+    """去除引用符號與多餘空白，用於比對重複內容"""
+    lines = [ln.lstrip("> ").strip() for ln in text.split("\n")]
+    return re.sub(r"\s+", " ", " ".join(ln for ln in lines if ln)).strip()
+
+
+def strip_link_noise(text):
+    """
+    移除連結雜訊：Asana get_asset 連結、本地附件路徑、裸露網址
+    * Markdown 連結保留顯示文字
+    """
+    text = _ASSET_URL.sub("", text)
+    text = _MD_LINK.sub(lambda m: m.group(1).replace(_NOT_DOWNLOADED, ""), text)
+    text = _BARE_URL.sub("", text)
+    return text
+
+
+def dedupe_ocr_blocks(lines: List[str], seen: set) -> List[str]:
+    """
+    移除重複的圖片分析區塊 (同一張截圖常在描述、留言中重複出現)
+
+    Args:
+        lines (List[str]): Markdown 行
+        seen (set): 已出現過的區塊內容 (跨區塊共用)
+
+    Returns:
+        List[str]: 去重後的行
+    """
+    out = []
+    i = 0
+    while i < len(lines):
+        m = _OCR_HEADER.match(lines[i])
+        if not m:
+            out.append(lines[i])
+            i += 1
+            continue
+
+        prefix = m.group("prefix")
+        j = i + 1
+        # 區塊延續行：與標頭相同前綴且不是空的引用行
+        while (
+            j < len(lines)
+            and prefix
+            and lines[j].startswith(prefix)
+            and lines[j].strip(" >")
+            and not _OCR_HEADER.match(lines[j])
+        ):
+            j += 1
+
+        key = _normalize("\n".join(lines[i + 1 : j]))
+        if key and key in seen:
+            out.append(f"{prefix}🖼️ (同前述圖片分析，略)")
+        else:
+            if key:
+                seen.add(key)
+            out.extend(lines[i:j])
+        i = j
+    return out
+
+
+def _split_blocks(body) -> List[dict]:
+    """
+    依 renderer 的章節結構切分區塊，並標註優先順序
+
+    Returns:
+        List[dict]: {"kind", "priority", "lines"}，順序與原文一致
+    """
+    blocks = []
+    current = {"kind": "header", "priority": PRIORITY_HEADER, "lines": []}
+    in_stories = False
+
+    lines = body.split("\n")
+    for idx, line in enumerate(lines):
+        # 章節前的分隔線 "---" 歸入下一章節，避免黏在上一則留言尾端
+        if line == "---" and idx + 1 < len(lines) and _SECTION_HEADER.match(lines[idx + 1]):
+            continue
+
+        if _SECTION_HEADER.match(line):
+            blocks.append(current)
+            in_stories = "討論紀錄" in line
+            if in_stories:
+                kind, priority = "stories_title", PRIORITY_HEADER
+            elif "子任務" in line:
+                kind, priority = "subtasks", PRIORITY_SUBTASKS
+            elif "其他附件" in line:
+                kind, priority = "attachments", PRIORITY_ATTACHMENTS
+            else:
+                kind, priority = "header", PRIORITY_HEADER
+            separator = ["---"] if idx > 0 and lines[idx - 1] == "---" else []
+            current = {"kind": kind, "priority": priority, "lines": separator + [line]}
+            continue
+
+        if in_stories and _STORY_HEADER.match(line):
+            blocks.append(current)
+            current = {"kind": "story", "priority": PRIORITY_OLD_COMMENTS, "lines": [line]}
+            continue
+
+        current["lines"].append(line)
+
+    blocks.append(current)
+    return [b for b in blocks if b["lines"]]
+
+
+def _collapse_stories(blocks: List[dict]) -> List[dict]:
+    """
+    移除系統自動留言、完全重複的留言，並將引用前文的長段落收斂為一行
+    """
+    result = []
+    earlier = []
+    for b in blocks:
+        if b["kind"] != "story":
+            result.append(b)
+            continue
+
+        content = "\n".join(b["lines"][1:])
+        norm = _normalize(content)
+        if not norm or norm.startswith(_SYSTEM_CHATTER):
+            continue
+        if norm in earlier:
+            continue
+
+        for prev in earlier:
+            if len(prev) >= _MIN_QUOTE_CHARS and prev in norm:
+                norm = norm.replace(prev, "(引用前文，略)")
+                b = dict(b, lines=[b["lines"][0], f"> {norm}", ""])
+
+        earlier.append(_normalize(content))
+        result.append(b)
+
+    # 最後 N 則留言提升優先順序
+    stories = [b for b in result if b["kind"] == "story"]
+    keep_last = max(0, config.QA_KEEP_LAST_COMMENTS)
+    for b in stories[len(stories) - keep_last :] if keep_last else []:
+        b["priority"] = PRIORITY_LAST_COMMENTS
+    return result
+
+
+def _truncate_to_budget(text, budget):
+    """將單一文字截斷至預算內 (二分搜尋字元數)"""
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if utils.estimate_tokens(text[:mid]) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
+
+
+def enforce_budget(blocks: List[dict], budget: int) -> List[dict]:
+    """
+    依優先順序丟棄區塊直到符合 token 預算；同優先順序先丟較早的留言
+
+    Args:
+        blocks (List[dict]): 區塊列表
+        budget (int): token 上限 (<=0 表示不限制)
+
+    Returns:
+        List[dict]: 保留的區塊 (維持原順序)
+    """
+    costs = [utils.estimate_tokens("\n".join(b["lines"])) for b in blocks]
+    total = sum(costs)
+    if budget <= 0 or total <= budget:
+        return blocks
+
+    dropped = set()
+    order = sorted(
+        range(len(blocks)),
+        key=lambda i: (-blocks[i]["priority"], i),
+    )
+    for i in order:
+        if total <= budget or blocks[i]["priority"] == PRIORITY_HEADER:
+            break
+        dropped.add(i)
+        total -= costs[i]
+
+    kept = []
+    omitted = 0
+    for i, b in enumerate(blocks):
+        if i in dropped:
+            if b["kind"] == "story":
+                omitted += 1
+            continue
+        if omitted:
+            kept.append(
+                {"kind": "note", "priority": PRIORITY_HEADER, "lines": [f"> …(省略 {omitted} 則留言)", ""]}
+            )
+            omitted = 0
+        kept.append(b)
+
+    # 僅剩最高優先區塊仍超出預算：截斷尾端
+    text = join_blocks(kept)
+    if utils.estimate_tokens(text) > budget:
+        text = _truncate_to_budget(text, budget) + "\n…(內容過長已截斷)"
+        kept = [{"kind": "header", "priority": PRIORITY_HEADER, "lines": [text]}]
+    return kept
+
+
+def clean_blocks(body) -> List[dict]:
+    """執行壓縮步驟 1~3 (不含預算控制)，回傳區塊列表"""
+    blocks = _split_blocks(strip_link_noise(body))
+    seen_ocr = set()
+    for b in blocks:
+        b["lines"] = dedupe_ocr_blocks(b["lines"], seen_ocr)
+    return _collapse_stories(blocks)
+
+
+def join_blocks(blocks: List[dict]) -> str:
+    return "\n".join(ln for b in blocks for ln in b["lines"])
+
+
+def compact_markdown(body, budget=None, blocks=None) -> Tuple[str, dict]:
+    """
+    壓縮 QA 輸入內文
+
+    步驟：
+        1. 移除連結雜訊 (get_asset、附件路徑、網址)
+        2. 去除重複的圖片分析區塊
+        3. 收斂系統留言與重複引用
+        4. 依優先順序控制 token 預算 (表單欄位與最後留言優先)
+
+    Args:
+        body (str): Markdown 內文 (不含檔頭)
+        budget (int): token 上限，預設為 config.QA_TOKEN_BUDGET
+        blocks (List[dict]): 已由 clean_blocks(body) 取得的區塊 (呼叫端已清理時傳入，省去重複解析)
+
+    Returns:
+        tuple: (壓縮後內文, {"tokens_before": int, "tokens_after": int})
+    """
+    if budget is None:
+        budget = config.QA_TOKEN_BUDGET
+    tokens_before = utils.estimate_tokens(body)
+
+    if blocks is None:
+        blocks = clean_blocks(body)
+    text = join_blocks(enforce_budget(blocks, budget))
+
+    return text, {"tokens_before": tokens_before, "tokens_after": utils.estimate_tokens(text)}
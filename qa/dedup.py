@@ -0,0 +1,174 @@
+# 檔案用途：以 MinHash / LSH 找出提問內容近似重複的任務，讓每個群組只生成一次 QA（純運算，無 I/O）。
+
+import re
+from typing import List
+
+import numpy as np
+
+from core import config
+
+# 表單中的提問欄位 (Question 的唯一來源，見 run_qa.QA_SYSTEM_PROMPT)
+_QUESTION_FIELDS = ("提問人問題主旨", "提問人問題內文")
+# 任一表單欄位標籤，用於判斷欄位內容的結尾
+_FORM_LABEL = re.compile(r"(提問人[^\s:：]{0,10}|Line 客服平台連結)\s*[:：]?")
+_DESCRIPTION = re.compile(r"## 📝 任務描述\n(.*?)(?:\n## |\Z)", re.DOTALL)
+# 比對前移除空白與標點，只保留文字本身
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+
+_SHINGLE_SIZE = 3
+_MAX_QUESTION_CHARS = 500
+_SEED = 0x5EED
+
+
+def extract_question(body) -> str:
+    """
+    從任務描述中取出提問主旨與內文；若無表單欄位，退回任務描述開頭
+
+    Args:
+        body (str): Markdown 內文
+
+    Returns:
+        str: 用於比對的提問文字
+    """
+    parts = []
+    for field in _QUESTION_FIELDS:
+        idx = body.find(field)
+        if idx < 0:
+            continue
+        rest = body[idx + len(field) :].lstrip(" :：\n")
+        nxt = _FORM_LABEL.search(rest)
+        parts.append(rest[: nxt.start()] if nxt else rest[:_MAX_QUESTION_CHARS])
+
+    if not parts:
+        m = _DESCRIPTION.search(body)
+        parts.append(m.group(1) if m else body)
+
+    return " ".join(p.strip() for p in parts)[:_MAX_QUESTION_CHARS]
+
+
+def _normalize(text) -> str:
+    return _NON_WORD.sub("", text).lower()
+
+
+def _shingle_hashes(texts: List[str]):
+    """
+    將所有文件的字元 3-gram 一次轉為 64-bit 雜湊 (全向量化)
+
+    Returns:
+        tuple: (雜湊陣列 uint64, 每個雜湊所屬的文件索引 int64)
+    """
+    norm = [_normalize(t) for t in texts]
+    lengths = np.fromiter((len(t) for t in norm), dtype=np.int64, count=len(norm))
+    codes = np.frombuffer("".join(norm).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+
+    k = _SHINGLE_SIZE
+    n_pos = len(codes) - k + 1
+    if n_pos <= 0:
+        return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64)
+
+    # 多項式組合 k 個字元，再做一次位元混合 (splitmix64)
+    h = np.zeros(n_pos, dtype=np.uint64)
+    for j in range(k):
+        h = h * np.uint64(1_000_003) + codes[j : j + n_pos]
+    h ^= h >> np.uint64(31)
+    h *= np.uint64(0x9E3779B97F4A7C15)
+    h ^= h >> np.uint64(29)
+
+    # 排除跨越文件邊界的 shingle
+    doc_ids = np.repeat(np.arange(len(norm), dtype=np.int64), lengths)
+    valid = doc_ids[: n_pos] == doc_ids[k - 1 : k - 1 + n_pos]
+    return h[valid], doc_ids[:n_pos][valid]
+
+
+def minhash_signatures(texts: List[str], num_perm=None) -> np.ndarray:
+    """
+    計算 MinHash 簽章
+
+    Args:
+        texts (List[str]): 提問文字
+        num_perm (int): 雜湊函數數量
+
+    Returns:
+        np.ndarray: (文件數, num_perm) 的 uint64 矩陣；沒有任何 shingle 的文件整列為最大值
+    """
+    num_perm = num_perm or config.QA_DEDUP_NUM_PERM
+    n = len(texts)
+    sig = np.full((n, num_perm), np.iinfo(np.uint64).max, dtype=np.uint64)
+
+    hashes, doc_ids = _shingle_hashes(texts)
+    if len(hashes) == 0:
+        return sig
+
+    # 每份文件的 shingle 已連續排列，以 reduceat 取各段最小值
+    present, starts = np.unique(doc_ids, return_index=True)
+
+    rng = np.random.default_rng(_SEED)
+    a = rng.integers(1, np.iinfo(np.int64).max, size=num_perm, dtype=np.int64).astype(np.uint64) | np.uint64(1)
+    b = rng.integers(0, np.iinfo(np.int64).max, size=num_perm, dtype=np.int64).astype(np.uint64)
+
+    # 逐一雜湊函數計算 (multiply-shift，uint64 溢位即取模)，避免 (num_perm x shingles) 的大矩陣
+    for p in range(num_perm):
+        permuted = hashes * a[p] + b[p]
+        sig[present, p] = np.minimum.reduceat(permuted, starts)
+    return sig
+
+
+class _UnionFind:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, x):
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, x, y):
+        rx, ry = self.find(x), self.find(y)
+        if rx != ry:
+            self.parent[max(rx, ry)] = min(rx, ry)
+
+
+def cluster_near_duplicates(texts: List[str], threshold=None, bands=None) -> List[int]:
+    """
+    以 LSH 分桶找出近似重複的文件並分群
+
+    Args:
+        texts (List[str]): 提問文字
+        threshold (float): 估計 Jaccard 相似度門檻
+        bands (int): LSH band 數 (num_perm 必須可整除)
+
+    Returns:
+        List[int]: 每份文件的群組編號 (群組內最小的文件索引)
+    """
+    threshold = config.QA_DEDUP_THRESHOLD if threshold is None else threshold
+    bands = bands or config.QA_DEDUP_BANDS
+    n = len(texts)
+    if n < 2:
+        return list(range(n))
+
+    sig = minhash_signatures(texts)
+    num_perm = sig.shape[1]
+    rows = num_perm // bands
+    empty = (sig == np.iinfo(np.uint64).max).all(axis=1)
+
+    uf = _UnionFind(n)
+    for band in range(bands):
+        # 將 band 內的 rows 個值壓成單一 64-bit 桶鍵 (碰撞會在下方以完整簽章驗證排除)
+        keys = np.zeros(n, dtype=np.uint64)
+        for col in sig[:, band * rows : (band + 1) * rows].T:
+            keys = keys * np.uint64(0x100000001B3) ^ col
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+
+        # 同桶的相鄰文件即為候選，再以完整簽章驗證相似度
+        same = sorted_keys[1:] == sorted_keys[:-1]
+        left, right = order[:-1][same], order[1:][same]
+        if len(left) == 0:
+            continue
+        similarity = (sig[left] == sig[right]).mean(axis=1)
+        keep = (similarity >= threshold) & ~empty[left] & ~empty[right]
+        for x, y in zip(left[keep].tolist(), right[keep].tolist()):
+            uf.union(x, y)
+
+    return [uf.find(i) for i in range(n)]
@@ -0,0 +1,268 @@
+# 檔案用途：將 QA 語料匯出為訓練 / 評估用的分片資料集 (JSONL.zst 與 Parquet)，串流寫出並支援依 GID 增量追加。
+
+import os
+import sys
+import json
+import glob
+import datetime
+
+from core import config, serializer, utils
+from core.doc_index import DocIndex
+from qa import qa_cache
+
+MANIFEST_FILE = "manifest.json"
+
+# 欄位順序與型別 (Parquet schema 亦依此建立)
+COLUMNS = (
+    "gid",
+    "section",
+    "category",
+    "tags",
+    "question",
+    "answer",
+    "created_date",
+    "expiry_date",
+    "source_path",
+)
+
+
+def _parse_date(value):
+    try:
+        return datetime.date.fromisoformat(str(value)) if value else None
+    except ValueError:
+        return None
+
+
+class JsonlZstShardWriter:
+    """JSONL 分片 (安裝 zstandard 時壓縮為 .jsonl.zst，否則退回 .jsonl.gz)"""
+
+    def __init__(self, out_dir, run_id):
+        self.out_dir = out_dir
+        self.run_id = run_id
+        self.shard_no = 0
+        self.rows_in_shard = 0
+        self.fh = None
+        self._raw = None
+        try:
+            import zstandard
+
+            self._zstd = zstandard
+            self.ext = "jsonl.zst"
+        except ImportError:
+            print("⚠️ 未安裝 zstandard，JSONL 改以 gzip 壓縮 (pip install zstandard)")
+            self._zstd = None
+            self.ext = "jsonl.gz"
+
+    def _open(self):
+        path = os.path.join(self.out_dir, f"part-{self.run_id}-{self.shard_no:04d}.{self.ext}")
+        if self._zstd:
+            self._raw = open(path, "wb")
+            self.fh = self._zstd.ZstdCompressor(level=10).stream_writer(self._raw)
+        else:
+            import gzip
+
+            self.fh = gzip.open(path, "wb")
+        self.rows_in_shard = 0
+
+    def write_batch(self, rows):
+        for row in rows:
+            if self.fh is None or self.rows_in_shard >= config.EXPORT_SHARD_ROWS:
+                self.close()
+                self._open()
+                self.shard_no += 1
+            record = dict(row)
+            for k in ("created_date", "expiry_date"):
+                record[k] = record[k].isoformat() if record[k] else None
+            self.fh.write(serializer.dumps_bytes(record) + b"\n")
+            self.rows_in_shard += 1
+
+    def close(self):
+        if self.fh is not None:
+            self.fh.close()
+            self.fh = None
+        if self._raw is not None:
+            self._raw.close()
+            self._raw = None
+
+
+class ParquetShardWriter:
+    """Parquet 分片 (需安裝 pyarrow)；每個批次寫成一個 row group，記憶體只保留一批"""
+
+    def __init__(self, out_dir, run_id):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.pq = pq
+        self.out_dir = out_dir
+        self.run_id = run_id
+        self.shard_no = 0
+        self.rows_in_shard = 0
+        self.writer = None
+        self.schema = pa.schema(
+            [
+                ("gid", pa.string()),
+                ("section", pa.string()),
+                ("category", pa.string()),
+                ("tags", pa.list_(pa.string())),
+                ("question", pa.string()),
+                ("answer", pa.string()),
+                ("created_date", pa.date32()),
+                ("expiry_date", pa.date32()),
+                ("source_path", pa.string()),
+            ]
+        )
+
+    def _open(self):
+        path = os.path.join(self.out_dir, f"part-{self.run_id}-{self.shard_no:04d}.parquet")
+        self.writer = self.pq.ParquetWriter(path, self.schema, compression="zstd")
+        self.rows_in_shard = 0
+        self.shard_no += 1
+
+    def write_batch(self, rows):
+        while rows:
+            if self.writer is None or self.rows_in_shard >= config.EXPORT_SHARD_ROWS:
+                self.close()
+                self._open()
+            take = rows[: config.EXPORT_SHARD_ROWS - self.rows_in_shard]
+            rows = rows[len(take) :]
+            table = self.pa.Table.from_pydict(
+                {c: [r[c] for r in take] for c in COLUMNS}, schema=self.schema
+            )
+            self.writer.write_table(table)
+            self.rows_in_shard += len(take)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+def _load_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST_FILE)
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except:
+            pass
+    return {"rows": {}, "runs": []}
+
+
+def _save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def iter_qa_rows():
+    """
+    逐筆產生資料集列 (來源：QA 快取的有效結果 + 文件索引的 Metadata)；
+    快取檔以串流方式讀取，不會整份載入記憶體
+
+    Yields:
+        dict: 依 COLUMNS 欄位組成的資料列
+    """
+    doc_index = DocIndex()
+    try:
+        for gid, result, rel_path in qa_cache.iter_valid_results():
+            doc = doc_index.get(gid) or {}
+            parts = (rel_path or "").replace(os.sep, "/").split("/")
+            yield {
+                "gid": str(gid),
+                "section": doc.get("section") or (parts[1] if len(parts) > 2 else None),
+                "category": result.get("category"),
+                "tags": [str(t) for t in result.get("tags") or []],
+                "question": result.get("question"),
+                "answer": result.get("answer"),
+                "created_date": _parse_date(doc.get("created_date")),
+                "expiry_date": _parse_date(doc.get("expiry_date")),
+                "source_path": doc.get("path") or rel_path,
+            }
+    finally:
+        doc_index.close()
+
+
+def export_dataset(full=False):
+    """
+    匯出 QA 資料集
+
+    * 增量模式 (預設)：只追加新增或內容變動的 GID，寫成本次執行的新分片；
+      同一 GID 出現在多個分片時，以 run_id (時間排序) 較新者為準，manifest.json 記錄每個 GID 的最新分片。
+      已匯出但不再有效 (任務刪除、改判無效或成為近似重複) 的 GID 記錄於該次 run 的 deletions (tombstone)，
+      讀取端依 run_id 順序套用分片後再移除這些 GID。
+    * 全量模式 (full=True)：清除既有分片後重新匯出 (可用來壓實重複列)。
+
+    Args:
+        full (bool): 是否全量重建
+    """
+    out_dir = config.QA_DATASET_DIR
+    os.makedirs(out_dir, exist_ok=True)
+
+    if full:
+        for f in glob.glob(os.path.join(out_dir, "part-*")):
+            os.remove(f)
+        manifest = {"rows": {}, "runs": []}
+    else:
+        manifest = _load_manifest(out_dir)
+
+    # run_id 依時間排序且精確到微秒，確保增量分片不會覆寫前次結果
+    run_id = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    writers = [JsonlZstShardWriter(out_dir, run_id)]
+    try:
+        writers.append(ParquetShardWriter(out_dir, run_id))
+    except ImportError:
+        print("⚠️ 未安裝 pyarrow，略過 Parquet 匯出 (pip install pyarrow)")
+
+    print(f"\n📦 [Export] 匯出 QA 資料集 ({'全量' if full else '增量'})...")
+    batch = []
+    exported = unchanged = 0
+    seen = set()
+
+    def flush():
+        for w in writers:
+            w.write_batch(batch)
+
+    try:
+        for row in iter_qa_rows():
+            seen.add(row["gid"])
+            row_hash = utils.hash_text(json.dumps(row, ensure_ascii=False, default=str, sort_keys=True))
+            prev = manifest["rows"].get(row["gid"])
+            if prev and prev["hash"] == row_hash:
+                unchanged += 1
+                continue
+
+            batch.append(row)
+            manifest["rows"][row["gid"]] = {"hash": row_hash, "run": run_id}
+            exported += 1
+            if len(batch) >= config.EXPORT_BATCH_ROWS:
+                flush()
+                batch = []
+                sys.stdout.write(f"\r   已寫出 {exported} 筆...")
+                sys.stdout.flush()
+        if batch:
+            flush()
+    finally:
+        for w in writers:
+            w.close()
+
+    # 串流完整讀完才計算 tombstone (讀取失敗時上方已拋出例外，不會誤刪)
+    deletions = sorted(gid for gid in manifest["rows"] if gid not in seen)
+    for gid in deletions:
+        del manifest["rows"][gid]
+
+    if exported or deletions:
+        manifest["runs"].append({"run": run_id, "rows": exported, "deletions": deletions})
+        _save_manifest(out_dir, manifest)
+
+    print(
+        f"\n✅ 匯出完成：新增/更新 {exported} 筆，未變動 {unchanged} 筆"
+        + (f"，移除 {len(deletions)} 筆" if deletions else "")
+        + f" → {out_dir}"
+    )
+
+
+if __name__ == "__main__":
+    export_dataset(full="--full" in sys.argv[1:])
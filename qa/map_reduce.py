@@ -0,0 +1,143 @@
+# 檔案用途：超長任務的 Map-Reduce QA 生成（依留言邊界切塊 → 並行萃取事實 → 合併後單次生成 QA）。
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from core import config, serializer, utils
+from qa import compactor
+from services import openai_client
+
+MAP_SYSTEM_PROMPT = """
+    你是一名企業知識庫整理助手。你會收到一段 Asana 任務的討論紀錄或子任務片段（Markdown 格式）。
+
+    請萃取片段中「已發生且已被證實」的事實，整理為精簡的事實清單：
+    - 問題現象、錯誤代碼、系統提示訊息
+    - 已確認的原因與判斷條件
+    - 實際採取的處理步驟與最終結果
+    - 圖片分析中已出現的操作步驟
+
+    規則：
+    - 不推論、不補寫、不合併未定論的說法
+    - 保留原文中的遮罩標記（如 [人員]、[PHONE]、[REFERENCE_ID]）
+    - 每則事實一句話，標註發言日期（若有）
+    - 無實質內容（如 OK、收到、已轉交）可忽略
+
+    請回傳 JSON 物件：{"facts": ["事實1", "事實2"]}
+    IMPORTANT: You must output valid JSON format.
+"""
+
+
+def _split_oversized(text, max_tokens) -> List[str]:
+    """單一區塊超過上限時，依行切分"""
+    pieces, current, current_tokens = [], [], 0
+    for line in text.split("\n"):
+        line_tokens = utils.estimate_tokens(line) + 1
+        if current and current_tokens + line_tokens > max_tokens:
+            pieces.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(line)
+        current_tokens += line_tokens
+    if current:
+        pieces.append("\n".join(current))
+    return pieces
+
+
+def chunk_blocks(blocks: List[dict], chunk_tokens: int) -> Tuple[str, List[str]]:
+    """
+    依留言 / 章節邊界切塊
+
+    Args:
+        blocks (List[dict]): compactor.clean_blocks 的輸出
+        chunk_tokens (int): 每塊 token 上限
+
+    Returns:
+        tuple: (標題與任務描述 (Reduce 階段原文保留), 其餘內容的切塊列表)
+    """
+    header_lines = []
+    chunks, current, current_tokens = [], [], 0
+
+    for b in blocks:
+        text = "\n".join(b["lines"])
+        if b["kind"] == "header":
+            header_lines.append(text)
+            continue
+        if b["kind"] in ("attachments", "stories_title"):
+            # 附件總覽與章節標題對事實萃取無幫助
+            continue
+
+        block_tokens = utils.estimate_tokens(text)
+        pieces = [text] if block_tokens <= chunk_tokens else _split_oversized(text, chunk_tokens)
+        for piece in pieces:
+            piece_tokens = utils.estimate_tokens(piece)
+            if current and current_tokens + piece_tokens > chunk_tokens:
+                chunks.append("\n".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece_tokens
+
+    if current:
+        chunks.append("\n".join(current))
+    return "\n".join(header_lines), chunks
+
+
+def summarize_chunk(chunk: str) -> Optional[List[str]]:
+    """
+    Map：將單一切塊整理為事實清單
+
+    Returns:
+        List[str]: 事實清單；呼叫失敗回傳 None
+    """
+    try:
+        client = openai_client.get_azure_openai_client()
+        response = client.chat.completions.create(
+            model=openai_client.get_chat_deployment_name(),
+            messages=[
+                {"role": "system", "content": MAP_SYSTEM_PROMPT},
+                {"role": "user", "content": chunk},
+            ],
+            response_format={"type": "json_object"},
+            temperature=0.1,
+        )
+        facts = serializer.loads(response.choices[0].message.content).get("facts", [])
+        return [str(f).strip() for f in facts if str(f).strip()]
+    except Exception as e:
+        print(f"❌ 事實萃取失敗: {e}")
+        return None
+
+
+def needs_map_reduce(blocks: List[dict]) -> bool:
+    """清理後內文是否超過單次呼叫門檻"""
+    if not config.ENABLE_QA_MAP_REDUCE:
+        return False
+    return utils.estimate_tokens(compactor.join_blocks(blocks)) > config.QA_MAP_REDUCE_THRESHOLD
+
+
+def build_reduce_input(blocks: List[dict]) -> Tuple[Optional[str], int]:
+    """
+    執行 Map 階段並組出 Reduce 階段的輸入
+
+    Args:
+        blocks (List[dict]): compactor.clean_blocks 的輸出
+
+    Returns:
+        tuple: (Reduce 輸入內文, 切塊數)；任一切塊失敗時內文為 None (避免以殘缺事實生成 QA)
+    """
+    header, chunks = chunk_blocks(blocks, config.QA_MAP_CHUNK_TOKENS)
+
+    # 任務描述本身過長時仍需限制 (Question 只取表單欄位，保留開頭即可)
+    if utils.estimate_tokens(header) > config.QA_MAP_CHUNK_TOKENS:
+        header = compactor.enforce_budget(
+            [{"kind": "header", "priority": compactor.PRIORITY_HEADER, "lines": [header]}],
+            config.QA_MAP_CHUNK_TOKENS,
+        )[0]["lines"][0]
+
+    with ThreadPoolExecutor(max_workers=max(1, config.QA_MAP_WORKERS)) as pool:
+        results = list(pool.map(summarize_chunk, chunks))
+
+    if any(r is None for r in results):
+        return None, len(chunks)
+
+    facts = [f for r in results for f in r]
+    lines = [header, "", "## 🧾 討論與處理重點 (依時間順序彙整)"]
+    lines.extend(f"- {f}" for f in facts)
+    return "\n".join(lines), len(chunks)
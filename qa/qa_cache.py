@@ -0,0 +1,173 @@
+# 檔案用途：QA 結果快取（以來源內文雜湊 + Prompt/模型版本為鍵），避免對未變動文件重複呼叫 LLM。
+
+import codecs
+import json
+import os
+
+from core import config, serializer
+
+QA_CACHE_FILE = os.path.join(config.QA_DIR, ".qa_cache.json")
+
+# 串流讀取時每次讀入的位元組數
+_STREAM_CHUNK = 1 << 20
+
+
+class QACache:
+    """
+    QA 結果快取。
+
+    結構: { source_gid: {"source_hash": ..., "version": ..., "result": {...}, "rel_path": ...} }
+    * result 會完整保存 LLM 回傳值，包含 `valid: false` 的判定，下次即可直接跳過。
+    """
+
+    # 累積多少筆異動才寫回磁碟 (避免每筆都重寫整個檔案)
+    SAVE_EVERY = 50
+
+    def __init__(self, version, filename=QA_CACHE_FILE):
+        self.filename = os.path.abspath(filename)
+        self.version = version
+        self.records = self._load()
+        self._dirty = 0
+
+    def _load(self):
+        if os.path.exists(self.filename):
+            try:
+                return serializer.load_file(self.filename)
+            except:
+                return {}
+        return {}
+
+    def lookup(self, gid, source_hash):
+        """
+        查詢快取
+
+        Returns:
+            dict: 快取紀錄 (含 result)；若內文或版本不同則回傳 None
+        """
+        rec = self.records.get(str(gid))
+        if not rec:
+            return None
+        if rec.get("source_hash") != source_hash or rec.get("version") != self.version:
+            return None
+        return rec
+
+    def store(self, gid, source_hash, result, rel_path=None):
+        self.records[str(gid)] = {
+            "source_hash": source_hash,
+            "version": self.version,
+            "result": result,
+            "rel_path": rel_path,
+        }
+        self._dirty += 1
+        if self._dirty >= self.SAVE_EVERY:
+            self.save()
+
+    def delete(self, gid):
+        """
+        移除來源任務的快取 (任務已刪除)；指向它的近似重複紀錄一併移除，下次改由其他成員重新生成
+
+        Returns:
+            dict: 被移除的紀錄；不存在時回傳 None
+        """
+        gid = str(gid)
+        rec = self.records.pop(gid, None)
+        for other, r in list(self.records.items()):
+            if str((r.get("result") or {}).get("duplicate_of")) == gid:
+                del self.records[other]
+        self._dirty += 1
+        return rec
+
+    def save(self):
+        if not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        tmp_path = self.filename + ".tmp"
+        serializer.dump_file(self.records, tmp_path, indent=False)
+        # 以 replace 寫入，避免中斷時留下半份檔案
+        os.replace(tmp_path, self.filename)
+        self._dirty = 0
+
+    def iter_valid_results(self):
+        """
+        逐筆回傳已產生 QA 檔的有效結果 (不含近似重複的連結紀錄)
+
+        Yields:
+            tuple: (source_gid, result, rel_path)
+        """
+        for gid, rec in self.records.items():
+            result = rec.get("result") or {}
+            if result.get("valid") and not result.get("duplicate_of"):
+                yield gid, result, rec.get("rel_path")
+
+
+def iter_records(filename=QA_CACHE_FILE):
+    """
+    串流讀取快取檔，逐筆解析頂層物件的鍵值 (記憶體只保留讀取區塊與單筆紀錄，不載入整個快取)
+
+    Yields:
+        tuple: (source_gid, 紀錄 dict)
+
+    Raises:
+        ValueError: 快取檔格式錯誤 (呼叫端不應將讀到一半的結果視為完整內容)
+    """
+    if not os.path.exists(filename):
+        return
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    with open(filename, "rb") as f:
+        buf, pos, eof = "", 0, False
+
+        def _more():
+            nonlocal buf, pos, eof
+            chunk = f.read(_STREAM_CHUNK)
+            eof = not chunk
+            buf = buf[pos:] + text.decode(chunk, final=eof)
+            pos = 0
+
+        def _peek(skip=""):
+            # 略過空白 (與 skip 中的字元)，回傳下一個字元；檔案結束回傳 ""
+            nonlocal pos
+            while True:
+                while pos < len(buf) and (buf[pos].isspace() or buf[pos] in skip):
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return buf[pos : pos + 1]
+                _more()
+
+        def _value():
+            # 值可能跨越讀取區塊：解析失敗且尚未讀完時補讀再試
+            nonlocal pos
+            while True:
+                try:
+                    value, pos = decoder.raw_decode(buf, pos)
+                    return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    _more()
+
+        if _peek() == "":
+            return
+        if _peek() != "{":
+            raise ValueError(f"QA 快取格式錯誤: {filename}")
+        pos += 1
+        while True:
+            c = _peek(",")
+            if c == "}":
+                return
+            if c != '"':
+                raise ValueError(f"QA 快取格式錯誤: {filename}")
+            gid = _value()
+            if _peek() != ":":
+                raise ValueError(f"QA 快取格式錯誤: {filename}")
+            pos += 1
+            _peek()
+            yield gid, _value()
+
+
+def iter_valid_results(filename=QA_CACHE_FILE):
+    """串流版的 QACache.iter_valid_results() (供匯出等只需逐筆讀取的場合)"""
+    for gid, rec in iter_records(filename):
+        result = rec.get("result") or {}
+        if result.get("valid") and not result.get("duplicate_of"):
+            yield gid, result, rec.get("rel_path")
@@ -1,13 +1,14 @@
 import os
 import sys
-import json
 import glob
-import re
 import yaml  # pip install pyyaml
 from openai import AzureOpenAI
 from dotenv import load_dotenv
 
-from core import config
+from core import config, serializer, utils
+from core.doc_index import DocIndex
+from qa import compactor, dedup, map_reduce
+from qa.qa_cache import QACache
 
 load_dotenv()
 
@@ -28,11 +29,8 @@ def extract_metadata_and_content(md_content):
     """
     分離 Markdown 的 YAML 檔頭與內文
     """
-    # 簡單 regex 抓取 --- 之間的內容
-    match = re.match(r"^---\n(.*?)\n---\n(.*)", md_content, re.DOTALL)
-    if match:
-        yaml_text = match.group(1)
-        body = match.group(2)
+    yaml_text, body = utils.split_frontmatter(md_content)
+    if yaml_text is not None:
         try:
             meta = yaml.safe_load(yaml_text)
             return meta, body
@@ -41,12 +39,7 @@ def extract_metadata_and_content(md_content):
     return {}, md_content
 
 
-def generate_qa(md_content):
-    """
-    輸入：Markdown 全文 (含圖片分析內容)
-    輸出：JSON 物件 { "question": "...", "answer": "..." }
-    """
-    system_prompt = """
+QA_SYSTEM_PROMPT = """
     你是一名企業知識庫 QA 整理專用 AI 助手，負責將 Asana 任務紀錄（Markdown 格式） 轉換為結構化、可審計、可追溯來源的 Q&A 資料。
 
     你的核心原則是：
@@ -164,99 +157,493 @@ def generate_qa(md_content):
     "valid": false
     }
 
-    """
+"""
 
+# 快取版本：Prompt 或模型部署變更時，既有快取自動失效
+QA_CACHE_VERSION = utils.hash_text(
+    f"{QA_SYSTEM_PROMPT}|{config.AZURE_OPENAI_CHAT_DEPLOYMENT}"
+    f"|{config.ENABLE_QA_COMPACTION}|{config.QA_TOKEN_BUDGET}|{config.QA_KEEP_LAST_COMMENTS}"
+    f"|{config.ENABLE_QA_MAP_REDUCE}|{config.QA_MAP_REDUCE_THRESHOLD}|{config.QA_MAP_CHUNK_TOKENS}"
+    f"|{config.ENABLE_QA_DEDUP}|{config.QA_DEDUP_THRESHOLD}"
+)[:16]
+
+
+def generate_qa(md_content):
+    """
+    輸入：Markdown 全文 (含圖片分析內容)
+    輸出：JSON 物件 { "question": "...", "answer": "..." }
+    """
     try:
         response = client.chat.completions.create(
             model=config.AZURE_OPENAI_CHAT_DEPLOYMENT,
             messages=[
-                {"role": "system", "content": system_prompt},
+                {"role": "system", "content": QA_SYSTEM_PROMPT},
                 {"role": "user", "content": md_content},
             ],
             response_format={"type": "json_object"},
             temperature=0.3,
         )
-        return json.loads(response.choices[0].message.content)
+        return serializer.loads(response.choices[0].message.content)
     except Exception as e:
         print(f"❌ QA 生成失敗: {e}")
         return None
 
 
-def run_qa_generation(target_proj_name=None):
+QA_BATCH_INSTRUCTION = """
+    【多文件批次模式】
+    本次輸入包含多份獨立的任務文件，每份以 <document source_gid="..."> 與 </document> 包覆。
+    請對每份文件「各自獨立」套用上述所有規則，文件之間不得互相引用或合併內容。
+
+    請回傳一個 JSON 物件，格式如下 (每份文件一筆，source_gid 必須與輸入一致)：
+    {
+    "results": [
+        {"source_gid": "...", "valid": true, "question": "...", "answer": "...", "category": "...", "tags": ["..."]},
+        {"source_gid": "...", "valid": false}
+    ]
+    }
+"""
+
+
+def generate_qa_batch(docs):
     """
+    將多份短文件合併為單次請求 (共用一次 system prompt)
+
     Args:
-        target_proj_name (str): 若有指定，只處理該專案；否則處理全部。
+        docs (List[tuple]): [(source_gid, Markdown 內文), ...]
+
+    Returns:
+        dict: { source_gid: QA 結果 }，僅包含模型有回傳且格式正確者；整批失敗回傳 None
     """
-    if not config.ENABLE_LLM_ANALYSIS:
-        print("⚠️ LLM 分析功能未開啟，跳過 QA 生成。")
-        return
+    user_content = "\n\n".join(
+        f'<document source_gid="{gid}">\n{content}\n</document>' for gid, content in docs
+    )
+    try:
+        response = client.chat.completions.create(
+            model=config.AZURE_OPENAI_CHAT_DEPLOYMENT,
+            messages=[
+                {"role": "system", "content": QA_SYSTEM_PROMPT + QA_BATCH_INSTRUCTION},
+                {"role": "user", "content": user_content},
+            ],
+            response_format={"type": "json_object"},
+            temperature=0.3,
+        )
+        payload = serializer.loads(response.choices[0].message.content)
+    except Exception as e:
+        print(f"❌ QA 批次生成失敗: {e}")
+        return None
 
-    # 搜尋來源
-    if target_proj_name:
-        search_path = os.path.join(config.PROCESSED_DIR, target_proj_name, "**", "*.md")
-    else:
-        search_path = os.path.join(config.PROCESSED_DIR, "**", "*.md")
+    expected = {str(gid) for gid, _ in docs}
+    results = {}
+    for item in payload.get("results") or []:
+        if not isinstance(item, dict):
+            continue
+        gid = str(item.pop("source_gid", ""))
+        if gid not in expected or "valid" not in item:
+            continue
+        if item["valid"] and not (item.get("question") and item.get("answer")):
+            continue
+        results[gid] = item
+    return results
 
-    md_files = glob.glob(search_path, recursive=True)
-    if not md_files:
-        print("❌ 找不到來源文件。")
-        return
 
-    print(f"\n🚀 [Stage 3] QA 生成中 (共 {len(md_files)} 檔)...")
+def build_qa_input(body, label):
+    """
+    準備送入 generate_qa 的內文
+
+    - 清理後仍超過 QA_MAP_REDUCE_THRESHOLD：切塊並行萃取事實 (Map)，再以合併事實生成 (Reduce)
+    - 其餘：壓縮至 QA_TOKEN_BUDGET 後單次呼叫
 
-    for i, fpath in enumerate(md_files):
-        # 顯示進度
-        sys.stdout.write(f"\r   處理中 ({i+1}/{len(md_files)})...")
-        sys.stdout.flush()
+    Args:
+        body (str): Markdown 內文
+        label (str): 進度顯示用的檔名
+
+    Returns:
+        str: 送入 generate_qa 的內文；Map 階段失敗時回傳 None
+    """
+    if not (config.ENABLE_QA_COMPACTION or config.ENABLE_QA_MAP_REDUCE):
+        return body
+
+    blocks = compactor.clean_blocks(body)
+
+    if map_reduce.needs_map_reduce(blocks):
+        qa_input, n_chunks = map_reduce.build_reduce_input(blocks)
+        if qa_input is not None:
+            print(
+                f"\r   🧩 {label}: {utils.estimate_tokens(body)} → {utils.estimate_tokens(qa_input)} tokens (Map-Reduce {n_chunks} 段)"
+            )
+        return qa_input
 
-        with open(fpath, "r", encoding="utf-8") as f:
-            raw_content = f.read()
+    if not config.ENABLE_QA_COMPACTION:
+        return body
 
-        # 1. 提取 Metadata (為了繼承 expiry_date)
-        meta, body = extract_metadata_and_content(raw_content)
+    qa_input, stats = compactor.compact_markdown(body, blocks=blocks)
+    print(f"\r   🗜️ {label}: {stats['tokens_before']} → {stats['tokens_after']} tokens")
+    return qa_input
 
-        # 簡單過濾：如果沒有 meta 或未完成，跳過
-        if not meta or meta.get("status") != "completed":
+
+def write_qa_file(qa_result, meta, rel_path):
+    """
+    將 QA 結果寫成 Markdown (含 Metadata)
+
+    Args:
+        qa_result (dict): LLM 回傳的有效 QA 結果
+        meta (dict): 來源文件的 YAML 檔頭
+        rel_path (str): 來源文件相對於 PROCESSED_DIR 的路徑
+
+    Returns:
+        str: 實際寫入的檔案完整路徑
+    """
+    save_path = os.path.join(config.QA_DIR, rel_path)
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+
+    qa_md_lines = [
+        "---",
+        "type: qa_pair",
+        f"source_gid: {meta.get('gid')}",
+    ]
+    # 近似重複群組：同一份 QA 亦代表其他來源任務
+    if qa_result.get("related_source_gids"):
+        qa_md_lines.append(
+            f"related_source_gids: [{', '.join(str(g) for g in qa_result['related_source_gids'])}]"
+        )
+    qa_md_lines += [
+        f"title: \"{meta.get('title')}\"",
+        f"created_date: {meta.get('created_date')}",
+        f"expiry_date: {meta.get('expiry_date')}",
+        f"section: \"{meta.get('section')}\"",
+        "---",
+        "\n",
+        f"# ❓ {qa_result['question']}",
+        "\n",
+        f"## 💡 解答",
+        f"{qa_result['answer']}",
+        "\n",
+        f"## 🏷️ 標籤",
+        f"{', '.join(qa_result.get('tags', []))}",
+        "\n",
+        f"> [查看原始文件](../../processed_data/{rel_path.replace(os.sep, '/')})",
+    ]
+
+    with open(save_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(qa_md_lines))
+    return save_path
+
+
+def remove_qa_file(rel_path):
+    """刪除過時的 QA 檔 (重新判定為無效，或成為近似重複群組的成員)"""
+    save_path = os.path.join(config.QA_DIR, rel_path)
+    if os.path.exists(save_path):
+        os.remove(save_path)
+
+
+_INDEX_META_FIELDS = ("status", "section", "title", "created_date", "expiry_date")
+
+
+def _reconcile_index(doc_index, target_proj_name=None):
+    """
+    將磁碟上的 Markdown 與文件索引對齊
+
+    * 索引中沒有的檔案 (升級前產生、或管線模式只索引了本次擷取的任務) 解析檔頭後補入
+    * 同一 GID 已有指向現存檔案的紀錄時不覆蓋 (避免改名後留下的舊檔取代新檔)
+    * 檔案已不存在的紀錄移除
+
+    Returns:
+        int: 補入的文件數
+    """
+    root = os.path.join(config.PROCESSED_DIR, target_proj_name) if target_proj_name else config.PROCESSED_DIR
+    on_disk = {
+        os.path.relpath(fpath, config.PROCESSED_DIR)
+        for fpath in glob.glob(os.path.join(root, "**", "*.md"), recursive=True)
+    }
+    indexed = {r["path"]: r for r in doc_index.select_documents(target_proj_name, status=None)}
+
+    added = 0
+    for rel_path in sorted(on_disk - indexed.keys()):
+        with open(os.path.join(config.PROCESSED_DIR, rel_path), "r", encoding="utf-8") as f:
+            meta, body = extract_metadata_and_content(f.read())
+        if not meta or not meta.get("gid"):
+            continue
+        known = doc_index.get(meta["gid"])
+        if known and known["path"] in on_disk:
             continue
+        # YAML 會將日期解析為 date 物件，索引一律存字串
+        fields = {k: (None if meta.get(k) is None else str(meta[k])) for k in _INDEX_META_FIELDS}
+        doc_index.upsert(
+            rel_path.split(os.sep)[0], dict(fields, gid=meta["gid"]), rel_path, utils.hash_text(body)
+        )
+        added += 1
+    for rel_path, row in indexed.items():
+        if rel_path not in on_disk:
+            doc_index.delete(row["gid"])
+    doc_index.commit()
+    return added
+
+
+def _collect_candidates(target_proj_name=None, gids=None, reindex=False):
+    """
+    挑選待生成 QA 的文件
 
-        # 2. 生成 QA
-        qa_result = generate_qa(body)
-
-        if qa_result and qa_result.get("valid"):
-            # 3. 準備存檔路徑
-            rel_path = os.path.relpath(fpath, config.PROCESSED_DIR)
-            save_path = os.path.join(config.QA_DIR, rel_path)
-
-            os.makedirs(os.path.dirname(save_path), exist_ok=True)
-
-            # 4. 製作 QA Markdown (含 Metadata)
-            qa_md_lines = [
-                "---",
-                "type: qa_pair",
-                f"source_gid: {meta.get('gid')}",
-                f"title: \"{meta.get('title')}\"",
-                f"created_date: {meta.get('created_date')}",
-                f"expiry_date: {meta.get('expiry_date')}",
-                f"section: \"{meta.get('section')}\"",
-                "---",
-                "\n",
-                f"# ❓ {qa_result['question']}",
-                "\n",
-                f"## 💡 解答",
-                f"{qa_result['answer']}",
-                "\n",
-                f"## 🏷️ 標籤",
-                f"{', '.join(qa_result.get('tags', []))}",
-                "\n",
-                f"> [查看原始文件](../../processed_data/{rel_path.replace(os.sep, '/')})",
+    以一次 SQL 查詢取得 status=completed 的文件與內文雜湊 (文件索引由 Stage 2 / 管線逐筆寫入)。
+    只有索引為空 (升級前產生的文件) 或指定 reindex 時，才先掃描磁碟上的 Markdown 與索引對齊。
+    指定 gids 時只由索引取出這些文件 (管線補生成)。
+
+    Returns:
+        List[dict]: 每筆包含 rel_path, meta, content_hash
+    """
+    doc_index = DocIndex()
+    try:
+        if gids is not None:
+            rows = [doc_index.get(gid) for gid in gids]
+            rows = [
+                r for r in rows
+                if r and r["status"] == "completed"
+                and (target_proj_name is None or r["project"] == target_proj_name)
             ]
+        else:
+            if reindex or doc_index.is_empty(target_proj_name):
+                added = _reconcile_index(doc_index, target_proj_name)
+                if added:
+                    print(f"🗂️ 文件索引補入 {added} 份未索引的文件")
+            rows = doc_index.select_documents(target_proj_name, status="completed")
+    finally:
+        doc_index.close()
+    return [
+        {
+            "rel_path": r["path"],
+            "meta": {
+                "gid": r["gid"],
+                "title": r["title"],
+                "created_date": r["created_date"],
+                "expiry_date": r["expiry_date"],
+                "section": r["section"],
+            },
+            "content_hash": r["content_hash"],
+        }
+        for r in rows
+    ]
+
+
+def _load_body(doc):
+    """取得文件內文 (已讀入者直接使用，否則開檔)"""
+    if doc.get("body") is not None:
+        return doc["body"]
+    fpath = os.path.join(config.PROCESSED_DIR, doc["rel_path"])
+    if not os.path.exists(fpath):
+        return None
+    with open(fpath, "r", encoding="utf-8") as f:
+        _, body = utils.split_frontmatter(f.read())
+    return body
+
+
+def prepare_qa_job(doc, qa_cache):
+    """
+    查快取並建立生成工作 (索引模式下命中者無需開檔)
+
+    Returns:
+        tuple: (是否命中快取, 生成工作 dict 或 None)
+    """
+    meta = doc["meta"]
+    rel_path = doc["rel_path"]
+
+    cached = qa_cache.lookup(meta.get("gid"), doc["content_hash"])
+    if cached:
+        # 快取命中但 QA 檔遺失 (例如被手動刪除)，直接以快取結果補寫
+        qa_result = cached["result"]
+        if (
+            qa_result.get("valid")
+            and not qa_result.get("duplicate_of")
+            and not os.path.exists(os.path.join(config.QA_DIR, rel_path))
+        ):
+            write_qa_file(qa_result, meta, rel_path)
+        return True, None
+
+    body = _load_body(doc)
+    if body is None:
+        return False, None
+    job = {
+        "doc": doc,
+        "meta": meta,
+        "rel_path": rel_path,
+        "body_hash": utils.hash_text(body),
+        "question": dedup.extract_question(body) if config.ENABLE_QA_DEDUP else None,
+        "size": len(body),
+        "duplicates": [],
+        # 內文隨工作保留至 submit() 建立輸入為止，不再重新開檔
+        "body": body,
+    }
+    doc.pop("body", None)
+    return False, job
+
+
+class QAGenerator:
+    """
+    逐一接收生成工作並寫入結果 (供批次流程與管線共用)
+
+    * ENABLE_QA_BATCH 時短文件累積成一包，共用一次 system prompt；包滿或呼叫 flush() 時送出
+    * 結果寫入 QA 快取與 QA Markdown；呼叫失敗者不寫入快取，下次重試 (failed 記錄件數)
+    """
+
+    def __init__(self, qa_cache):
+        self.qa_cache = qa_cache
+        self.pack = []
+        self.pack_tokens = 0
+        self.failed = 0
+
+    def save_result(self, job, qa_result):
+        if qa_result is None:
+            # 呼叫失敗不寫入快取，下次重試
+            self.failed += 1
+            return
+        if job["duplicates"]:
+            qa_result = dict(
+                qa_result,
+                related_source_gids=[d["meta"].get("gid") for d in job["duplicates"]],
+            )
+        self.qa_cache.store(job["meta"].get("gid"), job["body_hash"], qa_result, job["rel_path"])
+        if qa_result.get("valid"):
+            # 製作 QA Markdown (含 Metadata)
+            write_qa_file(qa_result, job["meta"], job["rel_path"])
+        else:
+            # 先前判定有效的文件改判無效：移除舊的 QA 檔
+            remove_qa_file(job["rel_path"])
+
+        # 同群組的其他來源：快取指向代表文件，不另產生重複的 QA 檔 (先前單獨生成的 QA 檔一併移除)
+        for d in job["duplicates"]:
+            self.qa_cache.store(
+                d["meta"].get("gid"),
+                d["body_hash"],
+                {"valid": qa_result.get("valid", False), "duplicate_of": job["meta"].get("gid")},
+                d["rel_path"],
+            )
+            remove_qa_file(d["rel_path"])
+
+    def flush(self):
+        """送出目前累積的批次"""
+        if not self.pack:
+            return
+        pack, self.pack, self.pack_tokens = self.pack, [], 0
+        results = None
+        if len(pack) > 1:
+            results = generate_qa_batch(
+                [(str(job["meta"].get("gid")), job["qa_input"]) for job in pack]
+            )
+        results = results or {}
+        for job in pack:
+            qa_result = results.get(str(job["meta"].get("gid")))
+            if qa_result is None:
+                # 整包失敗或模型漏回的文件，退回單檔呼叫
+                qa_result = generate_qa(job["qa_input"])
+            self.save_result(job, qa_result)
+
+    def submit(self, job):
+        """準備輸入並生成 (短文件可能先累積在批次中)"""
+        body = job.pop("body", None)
+        if body is None:
+            body = _load_body(job["doc"])
+        if body is None:
+            self.failed += 1
+            return
+
+        # 準備輸入 (壓縮 / 超長任務走 Map-Reduce)
+        qa_input = build_qa_input(body, job["rel_path"])
+        if qa_input is None:
+            # Map 階段失敗不寫入快取，下次重試
+            self.failed += 1
+            return
+
+        input_tokens = utils.estimate_tokens(qa_input)
+        if config.ENABLE_QA_BATCH and input_tokens <= config.QA_BATCH_MAX_DOC_TOKENS:
+            if self.pack and (
+                self.pack_tokens + input_tokens > config.QA_BATCH_TOKEN_BUDGET
+                or len(self.pack) >= config.QA_BATCH_MAX_DOCS
+            ):
+                self.flush()
+            job["qa_input"] = qa_input
+            self.pack.append(job)
+            self.pack_tokens += input_tokens
+            return
+
+        self.save_result(job, generate_qa(qa_input))
+
+
+def run_qa_generation(target_proj_name=None, gids=None, reindex=False):
+    """
+    Args:
+        target_proj_name (str): 若有指定，只處理該專案；否則處理全部。
+        gids (Iterable[str]): 若有指定，只處理這些任務的文件 (管線補生成)。
+        reindex (bool): 先以磁碟上的 Markdown 重新對齊文件索引 (手動搬移 / 刪除檔案後使用)。
+
+    Returns:
+        int: 生成失敗 (未寫入快取、下次重試) 的文件數
+    """
+    if not config.ENABLE_LLM_ANALYSIS:
+        print("⚠️ LLM 分析功能未開啟，跳過 QA 生成。")
+        return 0
+
+    candidates = _collect_candidates(target_proj_name, gids, reindex)
+    if not candidates:
+        print("❌ 找不到來源文件。")
+        return 0
+
+    print(f"\n🚀 [Stage 3] QA 生成中 (共 {len(candidates)} 檔)...")
+
+    # 快取：內文與 Prompt 版本皆未變動者直接跳過 (含 valid: false 的判定)
+    qa_cache = QACache(QA_CACHE_VERSION)
+    skipped = 0
+
+    # ==========================================
+    # 1. 查快取，挑出需要生成的文件 (索引模式下命中者無需開檔)
+    # ==========================================
+    jobs = []
+    for doc in candidates:
+        hit, job = prepare_qa_job(doc, qa_cache)
+        if hit:
+            skipped += 1
+        elif job:
+            jobs.append(job)
+
+    # ==========================================
+    # 2. 近似重複分群：每群只以「最完整」的成員生成一次
+    # ==========================================
+    if config.ENABLE_QA_DEDUP and len(jobs) > 1:
+        clusters = dedup.cluster_near_duplicates([job["question"] for job in jobs])
+        groups = {}
+        for job, cid in zip(jobs, clusters):
+            groups.setdefault(cid, []).append(job)
+
+        jobs = []
+        for members in groups.values():
+            rep = max(members, key=lambda job: job["size"])
+            rep["duplicates"] = [job for job in members if job is not rep]
+            # 沿用結果的成員不需生成，釋放內文
+            for job in rep["duplicates"]:
+                job.pop("body", None)
+            jobs.append(rep)
+
+        merged = sum(len(job["duplicates"]) for job in jobs)
+        if merged:
+            print(f"🔗 近似重複合併: {merged} 檔將沿用同群組的 QA 結果")
+
+    # ==========================================
+    # 3. 生成 QA
+    # ==========================================
+    generator = QAGenerator(qa_cache)
+    for i, job in enumerate(jobs):
+        # 顯示進度
+        sys.stdout.write(f"\r   處理中 ({i+1}/{len(jobs)})...")
+        sys.stdout.flush()
+        generator.submit(job)
 
-            with open(save_path, "w", encoding="utf-8") as f:
-                f.write("\n".join(qa_md_lines))
+    generator.flush()
+    qa_cache.save()
 
-    print(f"\n✅ QA 生成完成！儲存於: {config.QA_DIR}")
+    print(f"\n⏭️ 內容未變動而跳過: {skipped} 檔")
+    if generator.failed:
+        print(f"⚠️ {generator.failed} 檔生成失敗，下次執行時重試")
+    print(f"✅ QA 生成完成！儲存於: {config.QA_DIR}")
+    return generator.failed
 
 
 if __name__ == "__main__":
-    # 獨立執行時不指定專案，跑全量
-    run_qa_generation()
+    # 獨立執行時不指定專案，跑全量；--reindex 先以磁碟上的 Markdown 對齊文件索引
+    run_qa_generation(reindex="--reindex" in sys.argv[1:])
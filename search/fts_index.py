@@ -0,0 +1,315 @@
+# 檔案用途：知識庫全文檢索索引 (SQLite FTS5 + BM25)，支援中日韓文字斷詞、增量更新與排序查詢。
+
+import os
+import re
+import sqlite3
+from typing import List, Optional, Tuple
+
+import yaml
+
+from core import config, utils
+from qa import compactor
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    kind TEXT NOT NULL,
+    gid TEXT,
+    project TEXT,
+    section TEXT,
+    status TEXT,
+    expiry_date TEXT,
+    mtime REAL,
+    size INTEGER,
+    content_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_entries_gid ON entries (gid);
+CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5 (
+    title, body, qa, section, status, expiry_date,
+    tokenize = "unicode61 remove_diacritics 2"
+);
+"""
+
+# BM25 欄位權重 (順序同 entries_fts 欄位)：標題與 QA 問答較重要
+_BM25_WEIGHTS = (5.0, 1.0, 3.0, 0.5, 0.2, 0.2)
+
+# 中日韓字元以 bigram 斷詞，其餘 (英數) 以連續字元為一詞
+_CJK_CHARS = r"\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_TOKEN = re.compile(rf"(?P<cjk>[{_CJK_CHARS}]+)|(?P<word>[0-9A-Za-z\u00c0-\u024f]+)")
+
+
+def tokenize_text(text) -> List[str]:
+    """
+    CJK 感知斷詞：中日韓文字切為重疊 bigram (單字保留 unigram)，英數字轉小寫整詞
+
+    Args:
+        text (str): 任意文字
+
+    Returns:
+        List[str]: 詞彙列表
+    """
+    if not text:
+        return []
+    tokens = []
+    for m in _TOKEN.finditer(text):
+        run = m.group(0)
+        if m.group("cjk"):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i : i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run.lower())
+    return tokens
+
+
+def _tokenized(text) -> str:
+    return " ".join(tokenize_text(text))
+
+
+def _parse_markdown(raw):
+    """分離檔頭 (YAML) 與內文"""
+    yaml_text, body = utils.split_frontmatter(raw)
+    meta = {}
+    if yaml_text is not None:
+        try:
+            meta = yaml.safe_load(yaml_text) or {}
+        except Exception:
+            meta = {}
+    return meta, body
+
+
+class SearchIndex:
+    """
+    全文檢索索引
+
+    * 每個 Markdown 檔 (知識文件或 QA) 為一筆，以相對路徑為鍵
+    * 以 mtime / size 快速判斷是否變動，再以內容雜湊確認，只更新異動檔案
+    """
+
+    def __init__(self, db_path=config.SEARCH_INDEX_DB):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        self.conn.row_factory = sqlite3.Row
+        # WAL：建索引時不阻塞查詢端 (聊天機器人) 讀取
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+
+    # ------------------------------------------------------------------
+    # 寫入
+    # ------------------------------------------------------------------
+    def _upsert(self, path, kind, meta, title, body, qa_text, mtime, size, content_hash):
+        row = self.conn.execute("SELECT id FROM entries WHERE path = ?", (path,)).fetchone()
+        values = (
+            kind,
+            str(meta.get("source_gid") or meta.get("gid") or ""),
+            path.split("/")[1],
+            str(meta.get("section") or ""),
+            str(meta.get("status") or ("completed" if kind == "qa" else "")),
+            str(meta.get("expiry_date") or ""),
+            mtime,
+            size,
+            content_hash,
+        )
+        if row:
+            entry_id = row["id"]
+            self.conn.execute(
+                """UPDATE entries SET kind=?, gid=?, project=?, section=?, status=?, expiry_date=?,
+                   mtime=?, size=?, content_hash=? WHERE id=?""",
+                values + (entry_id,),
+            )
+            self.conn.execute("DELETE FROM entries_fts WHERE rowid = ?", (entry_id,))
+        else:
+            entry_id = self.conn.execute(
+                """INSERT INTO entries (path, kind, gid, project, section, status, expiry_date, mtime, size, content_hash)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (path,) + values,
+            ).lastrowid
+
+        self.conn.execute(
+            "INSERT INTO entries_fts (rowid, title, body, qa, section, status, expiry_date) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                entry_id,
+                _tokenized(title),
+                _tokenized(body),
+                _tokenized(qa_text),
+                _tokenized(values[3]),
+                values[4],
+                values[5],
+            ),
+        )
+
+    def _remove(self, entry_id):
+        self.conn.execute("DELETE FROM entries_fts WHERE rowid = ?", (entry_id,))
+        self.conn.execute("DELETE FROM entries WHERE id = ?", (entry_id,))
+
+    def update_tree(self, root_dir, kind, prefix) -> dict:
+        """
+        增量同步某個目錄樹
+
+        Args:
+            root_dir (str): 掃描目錄 (PROCESSED_DIR 或 QA_DIR)
+            kind (str): "doc" 或 "qa"
+            prefix (str): 存入索引的路徑前綴，用於區分不同目錄樹
+
+        Returns:
+            dict: {"added": int, "updated": int, "removed": int, "unchanged": int}
+        """
+        stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+        known = {
+            r["path"]: r
+            for r in self.conn.execute(
+                "SELECT id, path, mtime, size, content_hash FROM entries WHERE path LIKE ?",
+                (f"{prefix}/%",),
+            )
+        }
+        seen = set()
+
+        for dirpath, _, filenames in os.walk(root_dir):
+            for fname in filenames:
+                if not fname.endswith(".md"):
+                    continue
+                fpath = os.path.join(dirpath, fname)
+                rel = f"{prefix}/" + os.path.relpath(fpath, root_dir).replace(os.sep, "/")
+                seen.add(rel)
+                stats[self._sync_file(fpath, rel, kind, known.get(rel))] += 1
+
+        for rel, old in known.items():
+            if rel not in seen:
+                self._remove(old["id"])
+                stats["removed"] += 1
+
+        self.conn.commit()
+        return stats
+
+    def update_paths(self, root_dir, kind, prefix, rel_paths) -> dict:
+        """
+        只同步指定的檔案 (管線 / Webhook 模式傳入本次異動的文件，不掃描整個目錄樹)
+
+        Args:
+            root_dir (str): 檔案所在目錄 (PROCESSED_DIR 或 QA_DIR)
+            kind (str): "doc" 或 "qa"
+            prefix (str): 存入索引的路徑前綴
+            rel_paths (Iterable[str]): 相對於 root_dir 的路徑；檔案已不存在者自索引移除
+
+        Returns:
+            dict: {"added": int, "updated": int, "removed": int, "unchanged": int}
+        """
+        stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+        for rel_path in rel_paths:
+            rel = f"{prefix}/" + rel_path.replace(os.sep, "/")
+            old = self.conn.execute(
+                "SELECT id, path, mtime, size, content_hash FROM entries WHERE path = ?", (rel,)
+            ).fetchone()
+            fpath = os.path.join(root_dir, rel_path)
+            if not os.path.exists(fpath):
+                if old:
+                    self._remove(old["id"])
+                    stats["removed"] += 1
+                continue
+            stats[self._sync_file(fpath, rel, kind, old)] += 1
+        self.conn.commit()
+        return stats
+
+    def _sync_file(self, fpath, rel, kind, old) -> str:
+        """同步單一檔案，回傳統計鍵 (added / updated / unchanged)"""
+        st = os.stat(fpath)
+        if old and old["mtime"] == st.st_mtime and old["size"] == st.st_size:
+            return "unchanged"
+
+        with open(fpath, "r", encoding="utf-8") as f:
+            raw = f.read()
+        content_hash = utils.hash_text(raw)
+        if old and old["content_hash"] == content_hash:
+            # 只有 mtime 變動 (例如重新渲染出相同內容)
+            self.conn.execute(
+                "UPDATE entries SET mtime=?, size=? WHERE id=?",
+                (st.st_mtime, st.st_size, old["id"]),
+            )
+            return "unchanged"
+
+        meta, body = _parse_markdown(raw)
+        body = compactor.strip_link_noise(body)
+        if kind == "qa":
+            self._upsert(rel, kind, meta, meta.get("title") or "", "", body, st.st_mtime, st.st_size, content_hash)
+        else:
+            self._upsert(rel, kind, meta, meta.get("title") or "", body, "", st.st_mtime, st.st_size, content_hash)
+        return "updated" if old else "added"
+
+    # ------------------------------------------------------------------
+    # 查詢
+    # ------------------------------------------------------------------
+    def search(
+        self,
+        query: str,
+        limit: int = 10,
+        kind: Optional[str] = None,
+        section: Optional[str] = None,
+        status: Optional[str] = None,
+        valid_on: Optional[str] = None,
+        match_all: bool = False,
+    ) -> List[Tuple[str, float]]:
+        """
+        以 BM25 排序查詢，回傳任務 GID (同一 GID 的知識文件與 QA 取最佳分數)
+
+        Args:
+            query (str): 查詢字串 (可中英混合)
+            limit (int): 最多回傳筆數
+            kind (str): 限定 "doc" 或 "qa"
+            section (str): 限定區段名稱
+            status (str): 限定文件狀態
+            valid_on (str): YYYY-MM-DD，只回傳截止日未過期者
+            match_all (bool): True 時所有詞彙都必須出現；預設任一詞彙即可 (依分數排序)
+
+        Returns:
+            List[Tuple[str, float]]: [(gid, 分數)]，分數越高越相關
+        """
+        tokens = tokenize_text(query)
+        if not tokens:
+            return []
+        # 詞彙只含文字與數字，加上雙引號避免被解讀為 FTS 語法
+        match = (" AND " if match_all else " OR ").join(f'"{t}"' for t in dict.fromkeys(tokens))
+
+        sql = f"""
+            SELECT e.gid AS gid, -bm25(entries_fts, {', '.join(map(str, _BM25_WEIGHTS))}) AS score
+            FROM entries_fts JOIN entries e ON e.id = entries_fts.rowid
+            WHERE entries_fts MATCH ?
+        """
+        params = [match]
+        if kind:
+            sql += " AND e.kind = ?"
+            params.append(kind)
+        if section:
+            sql += " AND e.section = ?"
+            params.append(section)
+        if status:
+            sql += " AND e.status = ?"
+            params.append(status)
+        if valid_on:
+            sql += " AND (e.expiry_date = '' OR e.expiry_date >= ?)"
+            params.append(valid_on)
+        # bm25() 無法用於彙總函式，先取較多筆再依 GID 保留最佳分數
+        sql += " ORDER BY score DESC LIMIT ?"
+        params.append(limit * 5)
+
+        results = {}
+        for r in self.conn.execute(sql, params):
+            if r["gid"] not in results:
+                results[r["gid"]] = r["score"]
+            if len(results) >= limit:
+                break
+        return list(results.items())
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+def search(query, limit=10, **filters) -> List[Tuple[str, float]]:
+    """查詢捷徑：開啟預設索引並回傳排序後的 GID"""
+    index = SearchIndex()
+    try:
+        return index.search(query, limit=limit, **filters)
+    finally:
+        index.close()
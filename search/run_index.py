@@ -0,0 +1,87 @@
+# 檔案用途：建立 / 增量更新知識庫全文檢索索引，並提供簡易查詢介面。
+
+import os
+import time
+
+from core import config
+from search.fts_index import SearchIndex
+from search.vector_index import VectorIndex
+
+
+def run_index(rel_paths=None, gids=None):
+    """
+    執行索引更新：掃描 processed_data 與 qa_data，只重建異動檔案
+
+    Args:
+        rel_paths (Iterable[str], optional): 只同步這些文件 (相對路徑，知識文件與 QA 檔共用)，不掃描整個目錄樹
+        gids (Iterable[str], optional): 對應的來源任務，向量索引只在這些任務的 QA 有變動時重寫
+    """
+    print("\n🔎 [Index] 更新全文檢索索引...")
+    start = time.time()
+    if rel_paths is not None:
+        rel_paths = sorted(set(rel_paths))
+    index = SearchIndex()
+    try:
+        for root_dir, kind, label in (
+            (config.PROCESSED_DIR, "doc", "知識文件"),
+            (config.QA_DIR, "qa", "QA 資料集"),
+        ):
+            if rel_paths is not None:
+                stats = index.update_paths(root_dir, kind, kind, rel_paths)
+            elif not os.path.exists(root_dir):
+                continue
+            else:
+                stats = index.update_tree(root_dir, kind, kind)
+            print(
+                f"   {label}: 新增 {stats['added']} / 更新 {stats['updated']} / "
+                f"刪除 {stats['removed']} / 未變動 {stats['unchanged']}"
+            )
+    finally:
+        index.close()
+    print(f"✅ 索引更新完成 ({time.time() - start:.1f}s): {config.SEARCH_INDEX_DB}")
+
+    if config.ENABLE_VECTOR_INDEX:
+        run_vector_index(gids)
+
+
+def run_vector_index(gids=None):
+    """
+    更新 QA 向量索引：只對新增或內容變動的問題 / 答案產生向量
+
+    Args:
+        gids (Iterable[str], optional): 本次異動的來源任務 (見 VectorIndex.update)
+    """
+    print(f"\n🧭 [Index] 更新 QA 向量索引 (後端: {config.EMBEDDING_BACKEND})...")
+    start = time.time()
+    try:
+        stats = VectorIndex().update(gids=gids)
+    except ValueError as ve:
+        print(f"❌ 設定錯誤: {ve}")
+        return
+    print(
+        f"✅ 向量索引完成 ({time.time() - start:.1f}s): 沿用 {stats['reused']} / "
+        f"新產生 {stats['embedded']} / 移除 {stats['removed']}"
+    )
+
+
+def query_loop():
+    """互動式查詢 (Enter 離開)"""
+    index = SearchIndex()
+    try:
+        while True:
+            q = input("\n🔍 查詢 (Enter 離開)：").strip()
+            if not q:
+                break
+            start = time.perf_counter()
+            results = index.search(q, limit=10)
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"   {len(results)} 筆 ({elapsed:.1f} ms)")
+            for gid, score in results:
+                print(f"   - {gid}  (score {score:.2f})")
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    run_index()
+    query_loop()
@@ -0,0 +1,230 @@
+# 檔案用途：QA 向量索引 (memory-mapped 矩陣 + GID sidecar)，支援增量更新與 top-k 語意查詢。
+
+import os
+import json
+from typing import List, Tuple
+
+import numpy as np
+
+from core import config, utils
+from qa.qa_cache import QACache
+from services import embedding_client
+
+VECTORS_FILE = "vectors.npy"
+META_FILE = "vectors_meta.json"
+HNSW_FILE = "vectors.hnsw"
+
+# 每筆 QA 分別向量化問題與答案
+_FIELDS = ("question", "answer")
+
+
+def _qa_rows():
+    """
+    由 QA 快取取出所有有效 QA，展開為待向量化的列
+
+    Returns:
+        List[dict]: {"gid", "field", "hash", "text"}
+    """
+    rows = []
+    for gid, result, _ in QACache(version=None).iter_valid_results():
+        for field in _FIELDS:
+            text = str(result.get(field) or "")
+            rows.append({"gid": gid, "field": field, "hash": utils.hash_text(text), "text": text})
+    return rows
+
+
+class VectorIndex:
+    """
+    向量索引
+
+    * vectors.npy：(列數, 維度) 的 float16/float32 矩陣 (np.load mmap_mode="r" 讀取，不整份載入)
+    * vectors_meta.json：每列對應的 gid / field / 內容雜湊，以及向量後端名稱
+    * vectors.hnsw：(選用) 安裝 hnswlib 時建立的 HNSW 近似索引
+    """
+
+    def __init__(self, index_dir=config.VECTOR_INDEX_DIR):
+        self.index_dir = index_dir
+        self.meta = self._load_meta()
+        self._matrix = None
+        self._hnsw = None
+
+    def _path(self, name):
+        return os.path.join(self.index_dir, name)
+
+    def _load_meta(self):
+        if os.path.exists(self._path(META_FILE)):
+            try:
+                with open(self._path(META_FILE), "r", encoding="utf-8") as f:
+                    return json.load(f)
+            except:
+                pass
+        return {"backend": None, "dim": 0, "dtype": config.VECTOR_DTYPE, "rows": []}
+
+    @property
+    def matrix(self):
+        if self._matrix is None and os.path.exists(self._path(VECTORS_FILE)):
+            self._matrix = np.load(self._path(VECTORS_FILE), mmap_mode="r")
+        return self._matrix
+
+    # ------------------------------------------------------------------
+    # 更新
+    # ------------------------------------------------------------------
+    def update(self, backend=None, gids=None) -> dict:
+        """
+        增量更新：只對新增或內容變動的問題 / 答案呼叫向量後端
+
+        Args:
+            gids (Iterable[str], optional): 本次異動的來源任務；其 QA 與索引一致時直接略過，不重寫向量檔
+
+        Returns:
+            dict: {"reused": int, "embedded": int, "removed": int}
+        """
+        backend = backend or embedding_client.get_embedding_backend()
+        if gids is not None and not self._has_changes(backend, gids):
+            return {"reused": len(self.meta["rows"]), "embedded": 0, "removed": 0}
+        rows = _qa_rows()
+
+        # 向量後端變更時，舊向量不可混用
+        reusable = {}
+        if self.meta.get("backend") == backend.name and self.matrix is not None:
+            for i, r in enumerate(self.meta["rows"]):
+                reusable[(r["gid"], r["field"], r["hash"])] = i
+
+        keys = [(r["gid"], r["field"], r["hash"]) for r in rows]
+        todo = [i for i, key in enumerate(keys) if key not in reusable]
+        new_vectors = embedding_client.embed_in_batches(backend, [rows[i]["text"] for i in todo])
+
+        dim = new_vectors.shape[1] if len(todo) else self.meta.get("dim", 0)
+        dtype = np.dtype(config.VECTOR_DTYPE)
+        os.makedirs(self.index_dir, exist_ok=True)
+
+        tmp_path = self._path(VECTORS_FILE + ".tmp")
+        out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=dtype, shape=(len(rows), dim))
+        todo_pos = {row_idx: k for k, row_idx in enumerate(todo)}
+        for i, key in enumerate(keys):
+            if i in todo_pos:
+                out[i] = new_vectors[todo_pos[i]]
+            else:
+                out[i] = self.matrix[reusable[key]]
+        out.flush()
+        del out
+
+        # 釋放舊檔的 memmap 後再替換；舊的 HNSW 索引對應舊列編號，先行移除
+        self._matrix = None
+        self._hnsw = None
+        if os.path.exists(self._path(HNSW_FILE)):
+            os.remove(self._path(HNSW_FILE))
+        os.replace(tmp_path, self._path(VECTORS_FILE))
+
+        reused_old = {reusable[key] for key in keys if key in reusable}
+        removed = len(self.meta["rows"]) - len(reused_old)
+        self.meta = {
+            "backend": backend.name,
+            "dim": dim,
+            "dtype": dtype.name,
+            "rows": [{"gid": r["gid"], "field": r["field"], "hash": r["hash"]} for r in rows],
+        }
+        with open(self._path(META_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, ensure_ascii=False)
+
+        self._build_hnsw()
+        return {"reused": len(rows) - len(todo), "embedded": len(todo), "removed": removed}
+
+    def _has_changes(self, backend, gids) -> bool:
+        """檢查指定任務的有效 QA 是否與索引中的列 (內容雜湊) 不一致"""
+        if self.meta.get("backend") != backend.name or self.matrix is None:
+            return True
+        gids = {str(g) for g in gids}
+        known = {(r["gid"], r["field"]): r["hash"] for r in self.meta["rows"] if r["gid"] in gids}
+        records = QACache(version=None).records
+        for gid in gids:
+            result = (records.get(gid) or {}).get("result") or {}
+            valid = result.get("valid") and not result.get("duplicate_of")
+            for field in _FIELDS:
+                if not valid:
+                    if (gid, field) in known:
+                        return True
+                elif known.get((gid, field)) != utils.hash_text(str(result.get(field) or "")):
+                    return True
+        return False
+
+    def _build_hnsw(self):
+        """
+        安裝 hnswlib 時建立 HNSW 索引；未安裝則查詢時使用 NumPy 暴力搜尋
+
+        重建前先移除舊的 vectors.hnsw (列編號已隨矩陣改變)，未安裝或建立失敗時不會留下過時的索引
+        """
+        path = self._path(HNSW_FILE)
+        self._hnsw = None
+        if os.path.exists(path):
+            os.remove(path)
+        try:
+            import hnswlib
+        except ImportError:
+            return
+        if self.matrix is None or not len(self.matrix):
+            return
+        try:
+            index = hnswlib.Index(space="ip", dim=self.meta["dim"])
+            index.init_index(max_elements=len(self.matrix), ef_construction=200, M=16)
+            index.add_items(np.asarray(self.matrix, dtype=np.float32), np.arange(len(self.matrix)))
+            index.save_index(path)
+        except Exception as e:
+            print(f"⚠️ HNSW 索引建立失敗，查詢改用暴力搜尋: {e}")
+            if os.path.exists(path):
+                os.remove(path)
+
+    # ------------------------------------------------------------------
+    # 查詢
+    # ------------------------------------------------------------------
+    def _hnsw_index(self):
+        if self._hnsw is None and os.path.exists(self._path(HNSW_FILE)):
+            try:
+                import hnswlib
+            except ImportError:
+                return None
+            self._hnsw = hnswlib.Index(space="ip", dim=self.meta["dim"])
+            self._hnsw.load_index(self._path(HNSW_FILE))
+            self._hnsw.set_ef(64)
+        return self._hnsw
+
+    def search_vector(self, query_vec: np.ndarray, k: int = 10) -> List[Tuple[str, float]]:
+        """
+        以已正規化的查詢向量取 top-k (同一 GID 的問題 / 答案取最佳分數)
+
+        Returns:
+            List[Tuple[str, float]]: [(gid, cosine 相似度)]
+        """
+        matrix = self.matrix
+        if matrix is None or not len(matrix):
+            return []
+        query_vec = np.asarray(query_vec, dtype=np.float32).ravel()
+        n_candidates = min(len(matrix), k * len(_FIELDS))
+
+        hnsw = self._hnsw_index()
+        if hnsw is not None:
+            labels, distances = hnsw.knn_query(query_vec, k=n_candidates)
+            order, scores = labels[0], 1.0 - distances[0]
+        else:
+            # 分段計算內積，避免把 float16 矩陣整份轉為 float32
+            scores_all = np.empty(len(matrix), dtype=np.float32)
+            step = 65536
+            for start in range(0, len(matrix), step):
+                block = np.asarray(matrix[start : start + step], dtype=np.float32)
+                scores_all[start : start + step] = block @ query_vec
+            order = np.argpartition(-scores_all, n_candidates - 1)[:n_candidates]
+            order = order[np.argsort(-scores_all[order])]
+            scores = scores_all[order]
+
+        results = {}
+        for idx, score in zip(order.tolist(), scores.tolist()):
+            gid = self.meta["rows"][idx]["gid"]
+            if gid not in results:
+                results[gid] = float(score)
+        return sorted(results.items(), key=lambda x: -x[1])[:k]
+
+    def search(self, query: str, k: int = 10, backend=None) -> List[Tuple[str, float]]:
+        """以文字查詢 (使用建立索引時相同的向量後端)"""
+        backend = backend or embedding_client.get_embedding_backend()
+        query_vec = embedding_client.embed_in_batches(backend, [query])[0]
+        return self.search_vector(query_vec, k)
@@ -0,0 +1,177 @@
+"""檔案用途：PDF / XLSX / DOCX / 純文字附件的本機文字擷取 (逐頁 / 逐列串流，有字數上限)，取代送 vision 模型。"""
+
+import codecs
+import io
+import os
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import Iterator, Optional
+
+from core import config
+
+# pypdf / openpyxl 為選用相依；未安裝時該類型不擷取 (只保留連結)
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+_TEXT_EXTENSIONS = (".txt", ".csv", ".log", ".md", ".json", ".xml")
+_W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+KIND_LABELS = {"pdf": "PDF", "xlsx": "Excel", "docx": "Word", "text": "文字檔"}
+
+
+def detect_kind(name: str, content: bytes) -> Optional[str]:
+    """
+    依檔頭 (優先) 與副檔名判斷可擷取的文件類型
+
+    Returns:
+        str: "pdf"、"xlsx"、"docx"、"text"；不是可擷取的文件 (例如圖片) 回傳 None
+    """
+    ext = os.path.splitext(name or "")[1].lower()
+    head = content[:8] if content else b""
+    if head.startswith(b"%PDF"):
+        return "pdf"
+    if head.startswith(b"PK\x03\x04") and ext in (".xlsx", ".xlsm", ".docx"):
+        return "xlsx" if ext in (".xlsx", ".xlsm") else "docx"
+    if ext in _TEXT_EXTENSIONS:
+        return "text"
+    return None
+
+
+def _source(local_path, content):
+    """優先以本地檔案路徑開啟 (解析器可隨讀隨丟)，否則使用記憶體中的位元組"""
+    if local_path and os.path.exists(local_path):
+        return local_path
+    return io.BytesIO(content)
+
+
+def _iter_pdf(src) -> Iterator[str]:
+    reader = pypdf.PdfReader(src)
+    total = len(reader.pages)
+    for i in range(min(total, config.DOC_EXTRACT_MAX_PAGES)):
+        text = (reader.pages[i].extract_text() or "").strip()
+        if text:
+            yield f"### 第 {i + 1} 頁\n{text}"
+    if total > config.DOC_EXTRACT_MAX_PAGES:
+        yield f"(共 {total} 頁，僅擷取前 {config.DOC_EXTRACT_MAX_PAGES} 頁)"
+
+
+def _md_row(cells) -> str:
+    return "| " + " | ".join(str(c).replace("|", "\\|").replace("\n", " ") for c in cells) + " |"
+
+
+def _iter_xlsx(src) -> Iterator[str]:
+    # read_only：逐列讀取，不會一次載入整份工作表
+    wb = openpyxl.load_workbook(src, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            yield f"### 工作表：{ws.title}"
+            width = 0
+            for r, row in enumerate(ws.iter_rows(values_only=True)):
+                if r >= config.DOC_EXTRACT_MAX_ROWS:
+                    yield f"(僅擷取前 {config.DOC_EXTRACT_MAX_ROWS} 列)"
+                    break
+                cells = ["" if v is None else v for v in row]
+                while cells and cells[-1] == "":
+                    cells.pop()
+                if not cells:
+                    continue
+                if not width:
+                    # 第一個非空列視為表頭
+                    width = len(cells)
+                    yield _md_row(cells)
+                    yield _md_row(["---"] * width)
+                    continue
+                yield _md_row(cells + [""] * (width - len(cells)))
+    finally:
+        wb.close()
+
+
+def _iter_docx(src) -> Iterator[str]:
+    # 以 iterparse 串流解析 word/document.xml：段落逐段輸出，表格逐列轉為 Markdown
+    with zipfile.ZipFile(src) as zf, zf.open("word/document.xml") as f:
+        table_depth = 0
+        for event, el in ET.iterparse(f, events=("start", "end")):
+            if el.tag == _W_NS + "tbl":
+                table_depth += 1 if event == "start" else -1
+                continue
+            if event != "end":
+                continue
+            if el.tag == _W_NS + "tr":
+                cells = [
+                    "".join(t.text or "" for t in tc.iter(_W_NS + "t"))
+                    for tc in el.findall(_W_NS + "tc")
+                ]
+                if any(cells):
+                    yield _md_row(cells)
+                el.clear()
+            elif el.tag == _W_NS + "p" and table_depth == 0:
+                text = "".join(t.text or "" for t in el.iter(_W_NS + "t")).strip()
+                if text:
+                    yield text
+                el.clear()
+
+
+def _iter_text(src) -> Iterator[str]:
+    limit = config.DOC_EXTRACT_MAX_CHARS * 4
+    if isinstance(src, str):
+        with open(src, "rb") as f:
+            raw = f.read(limit)
+    else:
+        raw = src.read(limit)
+    # 讀滿上限時結尾可能切在多位元組字元中間：以 incremental decoder (final=False) 捨棄不完整的尾端，
+    # 避免整段 UTF-8 判定失敗而落到 latin-1 變成亂碼
+    truncated = len(raw) >= limit
+    for encoding in ("utf-8-sig", "big5", "latin-1"):
+        try:
+            yield codecs.getincrementaldecoder(encoding)().decode(raw, final=not truncated)
+            return
+        except UnicodeDecodeError:
+            continue
+
+
+_EXTRACTORS = {"pdf": _iter_pdf, "xlsx": _iter_xlsx, "docx": _iter_docx, "text": _iter_text}
+
+
+def available(kind: str) -> bool:
+    """該類型的解析器是否已安裝"""
+    if kind == "pdf":
+        return pypdf is not None
+    if kind == "xlsx":
+        return openpyxl is not None
+    return kind in _EXTRACTORS
+
+
+def extract_text(kind: str, local_path=None, content: bytes = None) -> Optional[str]:
+    """
+    擷取文件文字 (寫入附件的 ocr_text 欄位，後續與圖片分析結果一樣經過遮罩)
+
+    * 逐頁 / 逐段 / 逐列產生，累計超過 DOC_EXTRACT_MAX_CHARS 即停止，不會讀完整份大型文件
+    * PDF 最多 DOC_EXTRACT_MAX_PAGES 頁，Excel 每張工作表最多 DOC_EXTRACT_MAX_ROWS 列
+
+    Returns:
+        str: Markdown 文字；解析器未安裝或無文字 (例如沒有文字層的掃描 PDF) 時回傳 None
+
+    Raises:
+        Exception: 解析失敗 (檔案損毀等)，由呼叫端記錄為分析失敗以便重試
+    """
+    if not available(kind):
+        return None
+    parts, size = [], 0
+    for part in _EXTRACTORS[kind](_source(local_path, content)):
+        if size + len(part) > config.DOC_EXTRACT_MAX_CHARS:
+            parts.append(part[: max(0, config.DOC_EXTRACT_MAX_CHARS - size)])
+            parts.append(f"(內容過長，已截斷於 {config.DOC_EXTRACT_MAX_CHARS} 字)")
+            break
+        parts.append(part)
+        size += len(part)
+    body = "\n".join(p for p in parts if p).strip()
+    if not body:
+        return None
+    return f"**文件類型**：`{KIND_LABELS[kind]}`\n\n{body}"
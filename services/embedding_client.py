@@ -0,0 +1,85 @@
+"""檔案用途：文字向量化 (Embedding) 後端，支援 Azure OpenAI 與本機 CPU 模型，提供大批次呼叫。"""
+
+from typing import List
+
+import numpy as np
+
+from core import config
+from services import openai_client
+
+
+class AzureEmbeddingBackend:
+    """透過 Azure OpenAI embeddings API 產生向量"""
+
+    def __init__(self):
+        self.client = openai_client.get_azure_openai_client()
+        self.deployment = openai_client.get_embedding_deployment_name()
+        self.name = f"azure:{self.deployment}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        response = self.client.embeddings.create(model=self.deployment, input=texts)
+        # API 回傳順序以 index 為準
+        data = sorted(response.data, key=lambda d: d.index)
+        return np.asarray([d.embedding for d in data], dtype=np.float32)
+
+
+class LocalEmbeddingBackend:
+    """本機 CPU 模型 (sentence-transformers)，不需連網、不產生 API 費用"""
+
+    def __init__(self):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ValueError(
+                "EMBEDDING_BACKEND=local 需要安裝 sentence-transformers (pip install sentence-transformers)。"
+            )
+        self.model = SentenceTransformer(config.EMBEDDING_LOCAL_MODEL, device="cpu")
+        self.name = f"local:{config.EMBEDDING_LOCAL_MODEL}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return np.asarray(
+            self.model.encode(texts, batch_size=64, show_progress_bar=False), dtype=np.float32
+        )
+
+
+def get_embedding_backend():
+    """
+    依設定建立向量後端。
+
+    Returns:
+        AzureEmbeddingBackend | LocalEmbeddingBackend: 具備 name 屬性與 embed(texts) 方法的後端。
+
+    Raises:
+        ValueError: 後端名稱無效或必要設定缺漏時。
+    """
+    backend = (config.EMBEDDING_BACKEND or "azure").lower()
+    if backend == "azure":
+        return AzureEmbeddingBackend()
+    if backend == "local":
+        return LocalEmbeddingBackend()
+    raise ValueError(f"EMBEDDING_BACKEND 無效: {config.EMBEDDING_BACKEND} (可用: azure, local)")
+
+
+def embed_in_batches(backend, texts: List[str], batch_size=None) -> np.ndarray:
+    """
+    大批次向量化，並做 L2 正規化 (之後以內積即為 cosine 相似度)
+
+    Args:
+        backend: get_embedding_backend() 的回傳值
+        texts (List[str]): 待向量化文字
+        batch_size (int): 每批筆數，預設為 config.EMBEDDING_BATCH_SIZE
+
+    Returns:
+        np.ndarray: (len(texts), dim) 的 float32 矩陣
+    """
+    batch_size = batch_size or config.EMBEDDING_BATCH_SIZE
+    chunks = []
+    for start in range(0, len(texts), batch_size):
+        # 空字串會被 API 拒絕，以單一空白代替
+        batch = [t if t.strip() else " " for t in texts[start : start + batch_size]]
+        chunks.append(backend.embed(batch))
+    if not chunks:
+        return np.empty((0, 0), dtype=np.float32)
+    vectors = np.vstack(chunks)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
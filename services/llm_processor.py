@@ -1,10 +1,10 @@
 import os
+import json
 import base64
 import requests
-import json
 import math
 from dotenv import load_dotenv
-from core import config
+from core import config, serializer
 from services import openai_client
 
 load_dotenv()
@@ -18,6 +18,13 @@ def encode_image(image_path):
         return None
 
 
+def encode_image_bytes(data):
+    """將記憶體中的圖片位元組轉為 base64 (下載後直接分析，不必再讀檔)"""
+    if not data:
+        return None
+    return base64.b64encode(data).decode("utf-8")
+
+
 def _call_azure_openai(messages, max_tokens=800, response_format=None):
     """內部共用的 API 呼叫函式"""
     try:
@@ -47,14 +54,8 @@ def _call_azure_openai(messages, max_tokens=800, response_format=None):
 
 
 # --- 圖片分析  ---
-def analyze_image(image_path):
-    """分析圖片：OCR + 語意理解 + 遮罩"""
-    b64_img = encode_image(image_path)
-    if not b64_img:
-        return None
-
-    # Note: Prompt could be moved to a separate file, but keeping here for now.
-    system_prompt = """
+# Note: Prompt could be moved to a separate file, but keeping here for now.
+IMAGE_ANALYSIS_PROMPT = """
     ```markdown
     你是一名金融與保險業專用的資安與法遵導向 AI 助手，負責協助企業進行圖片內容分析、事件紀錄整理與內部知識庫建置。  
     你的首要原則為：資訊安全、個資保護、法規遵循（KYC / AML / 個資法 / 金融監理要求）。
@@ -169,8 +170,26 @@ def analyze_image(image_path):
 
     """
 
+
+def analyze_image(image_path):
+    """分析圖片：OCR + 語意理解 + 遮罩"""
+    b64_img = encode_image(image_path)
+    if not b64_img:
+        return None
+    return _analyze_b64(b64_img)
+
+
+def analyze_image_bytes(data):
+    """分析記憶體中的圖片位元組 (同 analyze_image，省去寫檔後再讀回)"""
+    b64_img = encode_image_bytes(data)
+    if not b64_img:
+        return None
+    return _analyze_b64(b64_img)
+
+
+def _analyze_b64(b64_img):
     messages = [
-        {"role": "system", "content": system_prompt},
+        {"role": "system", "content": IMAGE_ANALYSIS_PROMPT},
         {
             "role": "user",
             "content": [
@@ -184,6 +203,129 @@ def analyze_image(image_path):
     return _call_azure_openai(messages)
 
 
+MULTI_IMAGE_INSTRUCTION = """
+    【多圖批次模式】
+    本次輸入包含同一任務的多張圖片，每張圖片前有一行 attachment_gid="..." 標示其編號。
+    請對每張圖片「各自獨立」套用上述分析與遮罩規則，圖片之間不得互相引用或合併內容。
+
+    請回傳一個 JSON 物件，格式如下 (每張圖片一筆，attachment_gid 必須與輸入一致；
+    analysis 為依上述「輸出格式」產生的 Markdown 字串)：
+    {
+    "results": [
+        {"attachment_gid": "...", "analysis": "**圖片類型**：..."}
+    ]
+    }
+"""
+
+# 單張圖片分析的輸出 token 上限 (多圖請求依張數放大)
+IMAGE_ANALYSIS_MAX_TOKENS = 800
+
+
+def _image_size(data):
+    """從 PNG / GIF / JPEG 檔頭讀取寬高，無法辨識時回傳 None"""
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        return int.from_bytes(data[16:20], "big"), int.from_bytes(data[20:24], "big")
+    if data[:6] in (b"GIF87a", b"GIF89a") and len(data) >= 10:
+        return int.from_bytes(data[6:8], "little"), int.from_bytes(data[8:10], "little")
+    if data[:2] == b"\xff\xd8":
+        i = 2
+        while i + 9 < len(data):
+            if data[i] != 0xFF:
+                i += 1
+                continue
+            marker = data[i + 1]
+            seg_len = int.from_bytes(data[i + 2 : i + 4], "big")
+            # SOF0..SOF15 (排除 DHT / JPG / DAC)
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                return int.from_bytes(data[i + 7 : i + 9], "big"), int.from_bytes(data[i + 5 : i + 7], "big")
+            i += 2 + seg_len
+    return None
+
+
+def estimate_image_tokens(data):
+    """
+    估計一張圖片在 vision 請求中的 input token (high detail 計價規則)
+
+    先縮放至 2048x2048 以內、短邊 768，再以 512x512 切塊：85 + 170 * 切塊數；
+    無法讀取尺寸時以 VISION_TOKENS_PER_IMAGE 估計
+    """
+    size = _image_size(data or b"")
+    if not size or not all(size):
+        return config.VISION_TOKENS_PER_IMAGE
+    w, h = size
+    scale = min(1.0, 2048 / max(w, h))
+    w, h = w * scale, h * scale
+    scale = min(1.0, 768 / min(w, h))
+    w, h = w * scale, h * scale
+    return 85 + 170 * math.ceil(w / 512) * math.ceil(h / 512)
+
+
+def analyze_images_bytes(images):
+    """
+    多張圖片合併為單次請求 (共用一次 system prompt)
+
+    Args:
+        images (List[tuple]): [(attachment_gid, 圖片位元組), ...]
+
+    Returns:
+        dict: { attachment_gid: 分析結果 }，僅包含模型有回傳且格式正確者；整批失敗回傳 None
+    """
+    content = []
+    for gid, data in images:
+        content.append({"type": "text", "text": f'attachment_gid="{gid}"'})
+        content.append(
+            {
+                "type": "image_url",
+                "image_url": {"url": f"data:image/jpeg;base64,{encode_image_bytes(data)}"},
+            }
+        )
+    messages = [
+        {"role": "system", "content": IMAGE_ANALYSIS_PROMPT + MULTI_IMAGE_INSTRUCTION},
+        {"role": "user", "content": content},
+    ]
+    response_str = _call_azure_openai(
+        messages,
+        max_tokens=min(16000, IMAGE_ANALYSIS_MAX_TOKENS * len(images)),
+        response_format={"type": "json_object"},
+    )
+    if not response_str:
+        return None
+    try:
+        payload = serializer.loads(response_str)
+    except ValueError:
+        print("⚠️ 多圖分析回傳格式錯誤")
+        return None
+
+    expected = {str(gid) for gid, _ in images}
+    results = {}
+    for item in payload.get("results") or []:
+        if not isinstance(item, dict):
+            continue
+        gid = str(item.get("attachment_gid", ""))
+        analysis = item.get("analysis")
+        if gid in expected and isinstance(analysis, str) and analysis.strip():
+            results[gid] = analysis
+    return results
+
+
+OCR_TEXT_INSTRUCTION = """
+    【本機 OCR 文字模式】
+    本次輸入不是圖片，而是圖片經本機 OCR 取得的文字 (可能有少量辨識錯字或斷行)。
+    請將其視為該圖片的內容，依上述相同規則判斷類型、擷取關鍵資訊並遮罩，輸出相同的 Markdown 結構。
+"""
+
+
+def analyze_ocr_text(text):
+    """以本機 OCR 文字取代圖片進行分析 (純文字請求，不需傳送圖片)"""
+    if not text:
+        return None
+    messages = [
+        {"role": "system", "content": IMAGE_ANALYSIS_PROMPT + OCR_TEXT_INSTRUCTION},
+        {"role": "user", "content": text},
+    ]
+    return _call_azure_openai(messages, max_tokens=IMAGE_ANALYSIS_MAX_TOKENS)
+
+
 # --- 純文字內容遮罩 ---
 def mask_batch_texts(text_list):
     """
@@ -236,6 +378,7 @@ def mask_batch_texts(text_list):
 
         messages = [
             {"role": "system", "content": system_prompt},
+            # 送給模型的內容維持 ensure_ascii=False 與預設分隔符號 (中文不跳脫，不使用精簡格式)
             {"role": "user", "content": json.dumps(batch_data, ensure_ascii=False)},
         ]
 
@@ -252,7 +395,7 @@ def mask_batch_texts(text_list):
             )
 
             if response_str:
-                return json.loads(response_str)
+                return serializer.loads(response_str)
         except Exception as e:
             print(f"⚠️ 遮罩批次失敗 (長度 {current_char_count}): {e}")
             # 這裡可以考慮 retry 機制，或是 fallback 到 regex
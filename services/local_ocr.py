@@ -0,0 +1,140 @@
+"""檔案用途：本機 OCR (Tesseract) 快速路徑與路由：純文字截圖改走文字分析，需要版面理解的圖片才送 vision 模型。"""
+
+import io
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from core import config
+
+# pytesseract / Pillow 為選用相依；未安裝 (或系統沒有 tesseract 執行檔) 時一律送 vision
+try:
+    import pytesseract
+    from PIL import Image
+except ImportError:
+    pytesseract = None
+    Image = None
+
+# 路由統計 (本次執行)：text 走文字分析、vision 送圖片模型
+ocr_stats = {"text": 0, "vision": 0}
+_stats_lock = threading.Lock()
+
+# 中日韓文字與全形標點 (這些字之間不加空白)
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+_pool = None
+_pool_lock = threading.Lock()
+_available = None
+
+
+def available() -> bool:
+    """是否可使用本機 OCR (套件已安裝且找得到 tesseract 執行檔，只檢查一次)"""
+    global _available
+    if _available is None:
+        _available = False
+        if pytesseract is not None:
+            try:
+                pytesseract.get_tesseract_version()
+                _available = True
+            except Exception:
+                print("⚠️ 找不到 tesseract 執行檔，停用本機 OCR")
+    return _available
+
+
+def _join_words(words) -> str:
+    """行內字詞以空白連接，只有相鄰兩端都是中文字時不加空白 (chi_tra+eng 混排時英文字詞不會黏在一起)"""
+    text = ""
+    for word in words:
+        if text and not (_CJK_RE.match(text[-1]) and _CJK_RE.match(word[0])):
+            text += " "
+        text += word
+    return text
+
+
+def _ocr_image(data: bytes, lang: str) -> Optional[dict]:
+    """
+    (子行程執行) 對圖片位元組做 OCR
+
+    Returns:
+        dict: text (依行合併)、confidence (字詞平均信心 0-100)、low_conf_ratio、text_area (文字框面積佔比)；
+              非圖片或解碼失敗回傳 None
+    """
+    try:
+        img = Image.open(io.BytesIO(data))
+        img.load()
+    except Exception:
+        return None
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+
+    d = pytesseract.image_to_data(img, lang=lang, output_type=pytesseract.Output.DICT)
+    lines, confs, area = {}, [], 0
+    for i, word in enumerate(d["text"]):
+        conf = float(d["conf"][i])
+        if conf < 0 or not word.strip():
+            continue
+        key = (d["block_num"][i], d["par_num"][i], d["line_num"][i])
+        lines.setdefault(key, []).append(word)
+        confs.append(conf)
+        area += d["width"][i] * d["height"][i]
+
+    if not confs:
+        return {"text": "", "confidence": 0.0, "low_conf_ratio": 1.0, "text_area": 0.0}
+    return {
+        "text": "\n".join(_join_words(words) for _, words in sorted(lines.items())),
+        "confidence": sum(confs) / len(confs),
+        "low_conf_ratio": sum(1 for c in confs if c < config.LOCAL_OCR_MIN_CONFIDENCE) / len(confs),
+        "text_area": area / float(img.width * img.height),
+    }
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn：呼叫端有多個執行緒 (下載 / 分析 pool)，fork 可能複製到被持有的鎖而卡死
+            _pool = ProcessPoolExecutor(
+                max_workers=config.LOCAL_OCR_WORKERS or os.cpu_count(),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def ocr_bytes(data: bytes) -> Optional[dict]:
+    """在行程池中執行 OCR (CPU 密集，不佔用呼叫端執行緒的 GIL)；不可用或失敗時回傳 None"""
+    if not available():
+        return None
+    try:
+        return _get_pool().submit(_ocr_image, data, config.LOCAL_OCR_LANG).result()
+    except Exception as e:
+        print(f"⚠️ 本機 OCR 失敗: {e}")
+        return None
+
+
+def route(result: Optional[dict]) -> str:
+    """
+    依 OCR 結果決定分析路徑
+
+    走文字 ("text") 的條件 (全部成立)：
+        * 字詞平均信心 >= LOCAL_OCR_MIN_CONFIDENCE，且低信心字詞比例 <= LOCAL_OCR_MAX_LOW_CONF_RATIO
+        * 文字長度 >= LOCAL_OCR_MIN_CHARS
+        * 文字框面積佔圖片 >= LOCAL_OCR_MIN_TEXT_AREA (照片、圖表等以圖像為主的內容送 vision)
+
+    Returns:
+        str: "text" 或 "vision"
+    """
+    path = "vision"
+    if (
+        result
+        and result["confidence"] >= config.LOCAL_OCR_MIN_CONFIDENCE
+        and result["low_conf_ratio"] <= config.LOCAL_OCR_MAX_LOW_CONF_RATIO
+        and len(result["text"].strip()) >= config.LOCAL_OCR_MIN_CHARS
+        and result["text_area"] >= config.LOCAL_OCR_MIN_TEXT_AREA
+    ):
+        path = "text"
+    with _stats_lock:
+        ocr_stats[path] += 1
+    return path
@@ -42,3 +42,18 @@ def get_chat_deployment_name() -> str:
     if not config.AZURE_OPENAI_CHAT_DEPLOYMENT:
         raise ValueError("AZURE_OPENAI_CHAT_DEPLOYMENT 未設定，請在 .env 中填入。")
     return config.AZURE_OPENAI_CHAT_DEPLOYMENT
+
+
+def get_embedding_deployment_name() -> str:
+    """
+    取得向量 (embedding) 模型部署名稱。
+
+    Returns:
+        str: embedding 部署名稱。
+
+    Raises:
+        ValueError: 當部署名稱未設定時。
+    """
+    if not config.AZURE_OPENAI_EMBEDDING_DEPLOYMENT:
+        raise ValueError("AZURE_OPENAI_EMBEDDING_DEPLOYMENT 未設定，請在 .env 中填入。")
+    return config.AZURE_OPENAI_EMBEDDING_DEPLOYMENT